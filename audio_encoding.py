@@ -0,0 +1,177 @@
+"""
+压缩音频
+
+合成结果保存为未压缩的WAV，在移动网络下体积偏大、开始播放慢。这里用ffmpeg生成
+Opus（Ogg/WebM封装）和MP3格式的副本，与WAV放在同一目录、同名不同扩展名，
+/audio/{filename} 根据请求的Accept头选择返回的格式。没有安装ffmpeg时始终返回WAV。
+"""
+import contextlib
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Tuple
+
+from config import Config
+
+# 格式名 -> 扩展名、MIME类型、ffmpeg编码参数
+AUDIO_FORMATS: Dict[str, Dict[str, Any]] = {
+    "opus": {"ext": ".ogg", "mime": "audio/ogg", "codec": ["-c:a", "libopus"], "bitrate": "AUDIO_OPUS_BITRATE"},
+    "webm": {"ext": ".webm", "mime": "audio/webm", "codec": ["-c:a", "libopus"], "bitrate": "AUDIO_OPUS_BITRATE"},
+    "mp3": {"ext": ".mp3", "mime": "audio/mpeg", "codec": ["-c:a", "libmp3lame"], "bitrate": "AUDIO_MP3_BITRATE"},
+    "wav": {"ext": ".wav", "mime": "audio/wav", "codec": None, "bitrate": None},
+}
+
+# 客户端同样接受多种格式时的优先顺序（压缩率高的在前，WAV兜底）
+FORMAT_PREFERENCE = ["opus", "webm", "mp3", "wav"]
+
+_ffmpeg_path: Optional[str] = None
+_ffmpeg_checked = False
+# 正在编码的文件 -> [锁, 使用者数量]，没有使用者时删除
+_encode_locks: Dict[str, List[Any]] = {}
+_encode_locks_guard = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio-encode")
+
+
+def get_ffmpeg() -> Optional[str]:
+    """查找ffmpeg可执行文件，结果只查找一次"""
+    global _ffmpeg_path, _ffmpeg_checked
+    if not _ffmpeg_checked:
+        _ffmpeg_path = shutil.which(Config.FFMPEG_PATH)
+        _ffmpeg_checked = True
+        if not _ffmpeg_path and Config.AUDIO_COMPRESSION_ENABLED:
+            print(f"⚠️ 未找到ffmpeg（{Config.FFMPEG_PATH}），音频将以WAV格式提供")
+    return _ffmpeg_path
+
+
+def media_type_for(path: str) -> str:
+    """按扩展名返回音频的MIME类型"""
+    ext = os.path.splitext(path)[1].lower()
+    for info in AUDIO_FORMATS.values():
+        if info["ext"] == ext:
+            return info["mime"]
+    return "application/octet-stream"
+
+
+def variant_path(wav_path: str, audio_format: str) -> str:
+    """压缩副本的路径：与WAV同名，扩展名不同"""
+    return os.path.splitext(wav_path)[0] + AUDIO_FORMATS[audio_format]["ext"]
+
+
+def variant_paths(wav_path: str) -> List[str]:
+    """WAV文件所有可能存在的压缩副本路径"""
+    return [variant_path(wav_path, name) for name in AUDIO_FORMATS if name != "wav"]
+
+
+def _parse_accept(accept: str) -> List[Tuple[str, float]]:
+    entries = []
+    for part in accept.split(","):
+        pieces = [piece.strip() for piece in part.split(";")]
+        mime = pieces[0].lower()
+        if not mime:
+            continue
+        q = 1.0
+        for param in pieces[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        entries.append((mime, q))
+    return entries
+
+
+def negotiate_format(accept: Optional[str]) -> str:
+    """
+    根据Accept头选择音频格式
+
+    客户端明确列出音频类型时按q值选择，q值相同时按 FORMAT_PREFERENCE 的顺序；
+    只有 */* 或没有Accept头时无法判断客户端能播放什么，使用配置的默认格式
+    """
+    if not Config.AUDIO_COMPRESSION_ENABLED or not get_ffmpeg():
+        return "wav"
+    entries = _parse_accept(accept or "")
+    if not any(mime.startswith("audio/") for mime, _ in entries):
+        return Config.AUDIO_DEFAULT_FORMAT
+
+    def quality(mime: str) -> float:
+        # 最具体的匹配优先：完整类型 > audio/* > */*
+        for pattern in (mime, "audio/*", "*/*"):
+            for entry_mime, q in entries:
+                if entry_mime == pattern:
+                    return q
+        return 0.0
+
+    best_format = "wav"
+    best_q = 0.0
+    for name in FORMAT_PREFERENCE:
+        q = quality(AUDIO_FORMATS[name]["mime"])
+        if q > best_q:
+            best_format, best_q = name, q
+    return best_format
+
+
+@contextlib.contextmanager
+def _encode_lock(path: str):
+    """同一个文件同时只编码一次，最后一个使用者释放后删除对应的锁"""
+    with _encode_locks_guard:
+        entry = _encode_locks.setdefault(path, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _encode_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _encode_locks[path]
+
+
+def encode_audio(wav_path: str, audio_format: str) -> Optional[str]:
+    """
+    获取WAV文件的压缩副本，不存在或比WAV旧时用ffmpeg生成
+
+    Returns:
+        str: 压缩副本的路径，ffmpeg不可用或编码失败时返回None
+    """
+    if audio_format == "wav":
+        return wav_path
+    ffmpeg = get_ffmpeg()
+    if not ffmpeg:
+        return None
+
+    output_path = variant_path(wav_path, audio_format)
+    with _encode_lock(output_path):
+        if os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(wav_path):
+            return output_path
+
+        info = AUDIO_FORMATS[audio_format]
+        temp_path = output_path + ".part"
+        cmd = [ffmpeg, "-y", "-loglevel", "error", "-i", wav_path, "-vn"] + info["codec"] + [
+            "-b:a", f"{getattr(Config, info['bitrate'])}k",
+            "-f", {"opus": "ogg", "webm": "webm", "mp3": "mp3"}[audio_format],
+            temp_path
+        ]
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"❌ 音频编码失败: {e}")
+            return None
+        if result.returncode != 0:
+            print(f"❌ 音频编码失败（{audio_format}）: {result.stderr.strip()[:200]}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return None
+        os.replace(temp_path, output_path)
+        return output_path
+
+
+def precompress_audio(wav_path: str):
+    """在后台生成配置的压缩格式，客户端第一次请求时不必等待编码"""
+    if not Config.AUDIO_COMPRESSION_ENABLED or not get_ffmpeg():
+        return
+    for name in Config.AUDIO_PRECOMPRESS_FORMATS.split(","):
+        name = name.strip()
+        if name in AUDIO_FORMATS and name != "wav":
+            _executor.submit(encode_audio, wav_path, name)
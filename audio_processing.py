@@ -0,0 +1,169 @@
+"""
+音频后处理（NumPy/SciPy）
+
+合成得到的音频在内存中做向量化处理，不经过pydub/ffmpeg的解码编码：
+- 拼接多段音频时在接缝处做短交叉淡化，避免句子之间的爆音
+- 按RMS响度归一化，不同句子、不同参考音色的音量保持一致，峰值不超过上限
+- 采样率与 Config.SAMPLE_RATE 不同时用 resample_poly 重采样
+
+样本统一用 float32 数组表示，形状为 (帧数, 声道数)，取值范围 [-1, 1]。
+"""
+import os
+import tempfile
+import wave
+from math import gcd
+from typing import List, Tuple, Optional
+
+import numpy as np
+from scipy.signal import resample_poly
+
+from config import Config
+
+# 归一化后峰值的上限（dBFS），为响度提升留出余量避免削波
+PEAK_CEILING_DBFS = -1.0
+# RMS低于该值视为静音，不做归一化
+SILENCE_RMS = 1e-4
+
+_INT_DTYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+
+def pcm_to_float(data: bytes, sample_width: int, channels: int) -> np.ndarray:
+    """PCM字节转换为 float32 样本"""
+    if sample_width == 3:
+        # 24位PCM没有对应的numpy类型，补齐到32位
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+        padded = np.zeros((raw.shape[0], 4), dtype=np.uint8)
+        padded[:, 1:] = raw
+        samples = padded.view(np.int32).reshape(-1).astype(np.float32) / 2 ** 31
+    elif sample_width in _INT_DTYPES:
+        samples = np.frombuffer(data, dtype=_INT_DTYPES[sample_width]).astype(np.float32)
+        if sample_width == 1:
+            # 8位PCM是无符号数
+            samples = (samples - 128) / 128
+        else:
+            samples /= 2 ** (8 * sample_width - 1)
+    else:
+        raise ValueError(f"不支持的采样宽度: {sample_width}")
+    return samples.reshape(-1, channels)
+
+
+def float_to_pcm16(samples: np.ndarray) -> bytes:
+    """float32 样本转换为16位PCM字节"""
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+
+
+def read_wav(path: str) -> Tuple[np.ndarray, int]:
+    """读取PCM WAV文件，返回 (样本, 采样率)"""
+    with wave.open(path, 'rb') as wav_file:
+        channels = wav_file.getnchannels()
+        sample_width = wav_file.getsampwidth()
+        sample_rate = wav_file.getframerate()
+        data = wav_file.readframes(wav_file.getnframes())
+    return pcm_to_float(data, sample_width, channels), sample_rate
+
+
+def write_wav(path: str, samples: np.ndarray, sample_rate: int):
+    """
+    把样本写入16位PCM WAV文件
+
+    先写到同目录的临时文件再替换：原文件是硬链接（缓存的副本、共享文件系统上TTS服务生成的文件）时
+    不会改动链接到的其他文件，中途失败也不会留下写了一半的文件
+    """
+    fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as f, wave.open(f, 'wb') as wav_file:
+            wav_file.setnchannels(samples.shape[1])
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(sample_rate)
+            wav_file.writeframes(float_to_pcm16(samples))
+        # mkstemp创建的文件只有本用户可读，改为普通文件的权限
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def resample(samples: np.ndarray, sample_rate: int, target_rate: int) -> np.ndarray:
+    """多相滤波重采样到目标采样率"""
+    if sample_rate == target_rate or len(samples) == 0:
+        return samples
+    divisor = gcd(sample_rate, target_rate)
+    return resample_poly(samples, target_rate // divisor, sample_rate // divisor, axis=0).astype(np.float32)
+
+
+def match_channels(samples: np.ndarray, channels: int) -> np.ndarray:
+    """转换声道数：多声道混合为单声道，单声道复制为多声道"""
+    if samples.shape[1] == channels:
+        return samples
+    mono = samples.mean(axis=1, keepdims=True)
+    return np.repeat(mono, channels, axis=1) if channels > 1 else mono
+
+
+def normalize_loudness(samples: np.ndarray, target_dbfs: Optional[float] = None) -> np.ndarray:
+    """按RMS响度归一化到目标电平，增益受峰值上限约束"""
+    if target_dbfs is None:
+        target_dbfs = Config.AUDIO_TARGET_DBFS
+    rms = float(np.sqrt(np.mean(np.square(samples)))) if samples.size else 0.0
+    if rms < SILENCE_RMS:
+        return samples
+    gain = 10 ** (target_dbfs / 20) / rms
+    peak = float(np.max(np.abs(samples)))
+    gain = min(gain, 10 ** (PEAK_CEILING_DBFS / 20) / peak)
+    return samples * np.float32(gain)
+
+
+def crossfade_concat(parts: List[np.ndarray], sample_rate: int, crossfade_ms: Optional[float] = None) -> np.ndarray:
+    """
+    按顺序拼接多段音频，相邻两段在接缝处等功率交叉淡化
+
+    淡化长度不超过较短一段的一半，所有段的声道数需一致
+    """
+    if crossfade_ms is None:
+        crossfade_ms = Config.AUDIO_CROSSFADE_MS
+    parts = [part for part in parts if len(part)]
+    if not parts:
+        return np.zeros((0, 1), dtype=np.float32)
+
+    fade = int(sample_rate * crossfade_ms / 1000)
+    result = parts[0]
+    for part in parts[1:]:
+        length = min(fade, len(result) // 2, len(part) // 2)
+        if length <= 0:
+            result = np.concatenate([result, part])
+            continue
+        t = np.linspace(0, np.pi / 2, length, dtype=np.float32)[:, None]
+        overlap = result[-length:] * np.cos(t) + part[:length] * np.sin(t)
+        result = np.concatenate([result[:-length], overlap, part[length:]])
+    return result
+
+
+def postprocess(samples: np.ndarray, sample_rate: int) -> Tuple[np.ndarray, int]:
+    """合成结果的后处理：重采样到 Config.SAMPLE_RATE 并归一化响度"""
+    samples = resample(samples, sample_rate, Config.SAMPLE_RATE)
+    return normalize_loudness(samples), Config.SAMPLE_RATE
+
+
+def postprocess_file(path: str) -> str:
+    """对WAV文件做后处理并替换原文件（只读写PCM数据，不经过解码编码）"""
+    samples, sample_rate = read_wav(path)
+    samples, sample_rate = postprocess(samples, sample_rate)
+    write_wav(path, samples, sample_rate)
+    return path
+
+
+def concat_wav(part_paths: List[str], output_path: str, normalize: bool = False) -> str:
+    """
+    读取多段WAV文件，在内存中统一格式、交叉淡化拼接后写入输出文件
+
+    格式以第一段为准（开启后处理时采样率统一为 Config.SAMPLE_RATE）
+    """
+    decoded = [read_wav(path) for path in part_paths]
+    target_rate = Config.SAMPLE_RATE if normalize else decoded[0][1]
+    channels = decoded[0][0].shape[1]
+    parts = [match_channels(resample(samples, rate, target_rate), channels) for samples, rate in decoded]
+    combined = crossfade_concat(parts, target_rate)
+    if normalize:
+        combined = normalize_loudness(combined)
+    write_wav(output_path, combined, target_rate)
+    return output_path
@@ -0,0 +1,196 @@
+"""
+音频格式工具
+
+流式合成时音频是一块一块到达的：WavStreamParser 从分块的WAV数据中解析出格式和PCM数据，
+GrowingWavFile 把PCM边接收边写入文件，结束后再补上文件头中的长度。
+probe_audio 只读取WAV/Ogg文件头获取时长等信息，不需要解码整个文件。
+"""
+import os
+import struct
+from typing import Optional, Tuple, Dict, Any
+
+# 长度未知时文件头中填写的最大值（流式播放的通用约定）
+UNKNOWN_SIZE = 0xFFFFFFFF
+
+
+def wav_header(channels: int, sample_width: int, sample_rate: int,
+               data_size: Optional[int] = None) -> bytes:
+    """
+    生成PCM WAV文件头
+
+    Args:
+        data_size: PCM数据的字节数，None表示长度未知（流式输出）
+    """
+    if data_size is None:
+        riff_size = UNKNOWN_SIZE
+        data_size = UNKNOWN_SIZE
+    else:
+        riff_size = 36 + data_size
+    byte_rate = sample_rate * channels * sample_width
+    return (b"RIFF" + struct.pack("<I", riff_size) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, byte_rate,
+                                    channels * sample_width, sample_width * 8)
+            + b"data" + struct.pack("<I", data_size))
+
+
+class WavStreamParser:
+    """从分块到达的WAV数据中解析格式，并取出其后的PCM数据"""
+
+    def __init__(self):
+        self._buffer = b""
+        # (声道数, 采样宽度字节数, 采样率)，解析到fmt块之前为None
+        self.params: Optional[Tuple[int, int, int]] = None
+        self.header_done = False
+
+    def feed(self, data: bytes) -> bytes:
+        """
+        输入新到达的数据
+
+        Returns:
+            bytes: 本次可以取出的PCM数据（文件头尚未完整时为空）
+        """
+        if self.header_done:
+            return data
+        self._buffer += data
+        return self._parse_header()
+
+    def _parse_header(self) -> bytes:
+        buffer = self._buffer
+        if len(buffer) < 12:
+            return b""
+        if buffer[:4] != b"RIFF" or buffer[8:12] != b"WAVE":
+            raise ValueError("不是WAV数据")
+
+        offset = 12
+        while len(buffer) >= offset + 8:
+            chunk_id = buffer[offset:offset + 4]
+            chunk_size = struct.unpack("<I", buffer[offset + 4:offset + 8])[0]
+            body_start = offset + 8
+            if chunk_id == b"data":
+                if self.params is None:
+                    raise ValueError("WAV数据缺少fmt块")
+                # 流式输出时data块的长度不可靠，之后的数据全部视为PCM
+                self.header_done = True
+                self._buffer = b""
+                return buffer[body_start:]
+            if len(buffer) < body_start + chunk_size:
+                return b""
+            if chunk_id == b"fmt ":
+                channels, sample_rate = struct.unpack("<HI", buffer[body_start + 2:body_start + 8])
+                bits = struct.unpack("<H", buffer[body_start + 14:body_start + 16])[0]
+                self.params = (channels, bits // 8, sample_rate)
+            # 块长度为奇数时有一个填充字节
+            offset = body_start + chunk_size + (chunk_size & 1)
+        return b""
+
+
+class GrowingWavFile:
+    """边接收边写入的WAV文件，写入过程中文件头的长度为未知值，关闭时补上实际长度"""
+
+    def __init__(self, path: str, channels: int, sample_width: int, sample_rate: int):
+        self.path = path
+        self.channels = channels
+        self.sample_width = sample_width
+        self.sample_rate = sample_rate
+        self.data_size = 0
+        self._file = open(path, 'wb')
+        self._file.write(wav_header(channels, sample_width, sample_rate))
+        self._file.flush()
+
+    def append(self, pcm: bytes):
+        self._file.write(pcm)
+        # 立即刷新，读取这个文件的一方可以拿到最新的数据
+        self._file.flush()
+        self.data_size += len(pcm)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.seek(0)
+        self._file.write(wav_header(self.channels, self.sample_width, self.sample_rate, self.data_size))
+        self._file.close()
+
+
+# Ogg文件末尾读取的字节数，最后一页一定在这个范围内（单页最大约64KB）
+OGG_TAIL_BYTES = 65536 + 27 + 255
+
+
+def probe_audio(path: str) -> Optional[Dict[str, Any]]:
+    """
+    只读取文件头获取音频信息
+
+    Returns:
+        dict: {"format", "duration", "sample_rate", "channels"}，
+              不是WAV/Ogg文件或文件头损坏时返回None
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(12)
+            if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+                return _probe_wav(f, os.fstat(f.fileno()).st_size)
+            if head[:4] == b"OggS":
+                return _probe_ogg(f, os.fstat(f.fileno()).st_size)
+    except (OSError, struct.error, IndexError, ValueError) as e:
+        # 文件被截断时按下标或struct读取头部字段会越界
+        print(f"⚠️ 读取音频文件头失败 {path}: {e}")
+    return None
+
+
+def _probe_wav(f, file_size: int) -> Optional[Dict[str, Any]]:
+    fmt = None
+    offset = 12
+    while offset + 8 <= file_size:
+        f.seek(offset)
+        chunk_id, chunk_size = struct.unpack("<4sI", f.read(8))
+        body_start = offset + 8
+        if chunk_id == b"fmt ":
+            channels, sample_rate, byte_rate = struct.unpack("<HII", f.read(16)[2:12])
+            fmt = (channels, sample_rate, byte_rate)
+        elif chunk_id == b"data":
+            if fmt is None or fmt[2] == 0:
+                return None
+            # 流式写入未完成的文件长度为未知值，按实际文件大小计算
+            data_size = min(chunk_size, file_size - body_start)
+            channels, sample_rate, byte_rate = fmt
+            return {
+                "format": "wav",
+                "duration": data_size / byte_rate,
+                "sample_rate": sample_rate,
+                "channels": channels
+            }
+        offset = body_start + chunk_size + (chunk_size & 1)
+    return None
+
+
+def _probe_ogg(f, file_size: int) -> Optional[Dict[str, Any]]:
+    # 第一页包含编码头：Opus的颗粒位置固定以48kHz计，Vorbis按头中的采样率
+    f.seek(0)
+    first_page = f.read(4096)
+    segments = first_page[26]
+    packet = first_page[27 + segments:]
+    if packet[:8] == b"OpusHead":
+        channels = packet[9]
+        pre_skip = struct.unpack("<H", packet[10:12])[0]
+        sample_rate = struct.unpack("<I", packet[12:16])[0] or 48000
+        granule_rate = 48000
+    elif packet[:7] == b"\x01vorbis":
+        channels = packet[11]
+        sample_rate = struct.unpack("<I", packet[12:16])[0]
+        pre_skip = 0
+        granule_rate = sample_rate
+    else:
+        return None
+
+    # 最后一页的颗粒位置就是总采样数
+    f.seek(max(0, file_size - OGG_TAIL_BYTES))
+    tail = f.read()
+    position = tail.rfind(b"OggS")
+    if position < 0 or position + 14 > len(tail) or granule_rate == 0:
+        return None
+    granule = struct.unpack("<q", tail[position + 6:position + 14])[0]
+    return {
+        "format": "ogg",
+        "duration": max(0, granule - pre_skip) / granule_rate,
+        "sample_rate": sample_rate,
+        "channels": channels
+    }
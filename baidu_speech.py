@@ -1,15 +1,16 @@
-import requests
 import json
 import os
 import base64
 from typing import Optional
 from config import Config
+from http_pool import get_session, get_timeout
 
 class BaiduSpeechRecognition:
     def __init__(self):
         self.api_key = Config.BAIDU_API_KEY
         self.secret_key = Config.BAIDU_SECRET_KEY
         self.access_token = None
+        self.session = get_session()
         
     def get_access_token(self) -> Optional[str]:
         """获取百度API访问令牌"""
@@ -21,7 +22,7 @@ class BaiduSpeechRecognition:
                 "client_secret": self.secret_key
             }
             
-            response = requests.post(url, params=params)
+            response = self.session.post(url, params=params, timeout=get_timeout())
             result = response.json()
             
             if "access_token" in result:
@@ -108,7 +109,7 @@ class BaiduSpeechRecognition:
             }
             
             print(f"📤 正在调用百度语音识别API...")
-            response = requests.post(url, headers=headers, json=payload)
+            response = self.session.post(url, headers=headers, json=payload, timeout=get_timeout())
             result = response.json()
             
             print(f"📥 百度API响应: {result}")
@@ -170,7 +171,7 @@ class BaiduSpeechRecognition:
             }
             
             print(f"📤 正在调用百度语音识别API...")
-            response = requests.post(url, headers=headers, json=payload)
+            response = self.session.post(url, headers=headers, json=payload, timeout=get_timeout())
             result = response.json()
             
             print(f"📥 百度API响应: {result}")
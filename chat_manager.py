@@ -1,22 +1,48 @@
 import os
 import json
 import time
+import uuid
+import asyncio
+import threading
 from datetime import datetime
-from typing import List, Dict, Optional, Any
-from deepseek_client import DeepSeekClient
+from typing import List, Dict, Optional, Any, Iterator, AsyncIterator, Tuple
+from llm_backends import create_llm_client
 from tts_client import TTSClient
+from conversation_summary import ConversationSummarizer
+from deepseek_client import ERROR_REPLIES, STREAM_INTERRUPTED_MARKER
+from response_cache import ResponseCache
+from tts_pipeline import SentencePipeline
+from voice_profile import VoiceProfile
+from tts_scheduler import TTSScheduler, PRIORITY_INTERACTIVE, PRIORITY_MAINTENANCE
+from audio_encoding import precompress_audio
+from audio_utils import probe_audio
+from history_window import get_message_tokens
 from config import Config
 import re
 
 class ChatManager:
     def __init__(self):
-        self.deepseek_client = DeepSeekClient()
+        self.llm_client = create_llm_client()
         self.tts_client = TTSClient()
+        # 所有合成请求经过调度器，按优先级排队并限制并发
+        self.tts_scheduler = TTSScheduler(self.tts_client)
+        # 分句流水线合成（可选）
+        self.tts_pipeline = SentencePipeline(self.tts_client, self.tts_scheduler) if Config.TTS_PIPELINE_ENABLED else None
         self.conversation_history: List[Dict[str, str]] = []
         self.custom_prompt: Optional[str] = None
         self.context: Optional[str] = None
         
-        # 聊天记录保存相关
+        # 当天较早对话的滚动摘要: {"content", "covered_count", "updated_at"}
+        self.conversation_summary: Optional[Dict[str, Any]] = None
+        self.summarizer = ConversationSummarizer(self.llm_client)
+        
+        # 相同输入的回复缓存（可选）
+        self.response_cache = ResponseCache() if Config.RESPONSE_CACHE_ENABLED else None
+        
+        # 对话历史的读写（含保存到文件）都需持有该锁，后台摘要线程也会读写历史。
+        # 调用大模型期间不持锁：请求开始时取历史快照，回复完成后把用户消息和回复成对写入，
+        # 并发的多轮对话可以同时等待大模型，消息也不会交错
+        self._history_lock = threading.RLock()
         self.chat_history_dir = "./chat_history"
         os.makedirs(self.chat_history_dir, exist_ok=True)
         
@@ -38,6 +64,7 @@ class ChatManager:
                 with open(filepath, 'r', encoding='utf-8') as f:
                     data = json.load(f)
                     self.conversation_history = data.get('messages', [])
+                    self.conversation_summary = data.get('summary')
                     print(f"✅ 已加载今天的聊天记录: {len(self.conversation_history)} 条消息")
             except Exception as e:
                 print(f"❌ 加载聊天记录失败: {e}")
@@ -51,13 +78,17 @@ class ChatManager:
         filepath = os.path.join(self.chat_history_dir, filename)
         
         try:
-            data = {
-                'date': datetime.now().strftime("%Y-%m-%d"),
-                'messages': self.conversation_history
-            }
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            # 持锁序列化和写文件，保存的始终是一致的快照，多次保存也不会乱序覆盖
+            with self._history_lock:
+                data = {
+                    'date': datetime.now().strftime("%Y-%m-%d"),
+                    'messages': self.conversation_history
+                }
+                if self.conversation_summary:
+                    data['summary'] = self.conversation_summary
+                
+                with open(filepath, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
             
             print(f"💾 已保存聊天记录: {filename}")
         except Exception as e:
@@ -148,77 +179,390 @@ class ChatManager:
             used_prompt = custom_prompt if custom_prompt is not None else self.custom_prompt
             used_context = context if context is not None else self.context
             
-            # 调用DeepSeek API
+            history, summary = self._prompt_snapshot()
+            # 输入与之前某次请求完全相同时直接复用回复和音频
+            cache_key, cached = self._lookup_cached_response(message, history, used_prompt, used_context)
+            if cached:
+                return self._finalize_cached_response(message, cached, used_prompt, used_context)
+            
+            # 调用大模型API
             if used_context:
-                response = self.deepseek_client.chat_with_context(message, self.conversation_history, used_context)
+                response = self.llm_client.chat_with_context(message, used_context, history, summary=summary)
             else:
-                response = self.deepseek_client.chat(message, self.conversation_history, used_prompt)
+                response = self.llm_client.chat(message, history, used_prompt, summary=summary)
             
-            # 清理括号内容
-            cleaned_response = self.clean_brackets_content(response)
-            print(f"🎭 原始响应: {response}")
-            print(f"🧹 清理后: {cleaned_response}")
+            assistant_message = self._record_reply(message, response)
+            return self._finalize_response(assistant_message, response, used_prompt, used_context, cache_key)
             
-            # 添加到对话历史
-            self.conversation_history.append({"role": "user", "content": message})
+        except Exception as e:
+            print(f"处理消息时出错: {e}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    def process_message_stream(self, message: str, custom_prompt: Optional[str] = None,
+                               context: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        流式处理用户消息
+        
+        先逐段产出 {"type": "delta", "content": ...} 文本增量，
+        回复完整后再生成音频、保存记录，最后产出 {"type": "done", ...} 完整结果。
+        开启分句合成时，两者之间还会按顺序产出 {"type": "audio_chunk", ...} 音频片段
+        """
+        try:
+            # 使用传入的prompt和context，如果没有则使用存储的值
+            used_prompt = custom_prompt if custom_prompt is not None else self.custom_prompt
+            used_context = context if context is not None else self.context
+            
+            history, summary = self._prompt_snapshot()
+            cache_key, cached = self._lookup_cached_response(message, history, used_prompt, used_context)
+            if cached:
+                result = self._finalize_cached_response(message, cached, used_prompt, used_context)
+            else:
+                # 调用大模型流式API（有上下文时与chat_with_context一样使用默认系统prompt）
+                chunks = []
+                for delta in self.llm_client.chat_stream(
+                        message, history, None if used_context else used_prompt,
+                        summary=summary, context=used_context):
+                    chunks.append(delta)
+                    yield {"type": "delta", "content": delta}
+                
+                response = "".join(chunks).strip()
+                assistant_message = self._record_reply(message, response)
+            
+            if cached:
+                yield {"type": "delta", "content": cached["text_response"]}
+                yield {"type": "done", **result}
+                return
+            
+            # 开启分句合成时，每段音频可播放后立即产出 audio_chunk 事件
+            yield from self._finalize_response_events(assistant_message, response, used_prompt, used_context, cache_key)
+            
+        except Exception as e:
+            print(f"流式处理消息时出错: {e}")
+            yield {
+                "type": "done",
+                "success": False,
+                "error": str(e)
+            }
+    
+    async def process_message_async(self, message: str, custom_prompt: Optional[str] = None,
+                                    context: Optional[str] = None) -> Dict[str, Any]:
+        """
+        process_message的异步版本
+        
+        等待大模型响应时不阻塞事件循环，音频合成和保存记录放到线程池中执行
+        """
+        try:
+            # 使用传入的prompt和context，如果没有则使用存储的值
+            used_prompt = custom_prompt if custom_prompt is not None else self.custom_prompt
+            used_context = context if context is not None else self.context
+            loop = asyncio.get_running_loop()
             
-            # 生成音频
-            audio_path = None
-            audio_filename = None
-            timestamp = int(time.time())
+            history, summary = self._prompt_snapshot()
+            cache_key, cached = self._lookup_cached_response(message, history, used_prompt, used_context)
+            if cached:
+                return await loop.run_in_executor(
+                    None, self._finalize_cached_response, message, cached, used_prompt, used_context)
             
-            if self.tts_client:
-                audio_filename = f"response_{timestamp}.wav"
-                # 使用清理后的响应生成音频
-                audio_path = self.tts_client.text_to_speech(cleaned_response, audio_filename)
-                # 只返回文件名，不包含路径
-                if audio_path:
-                    audio_path = os.path.basename(audio_path)
+            # 调用大模型API
+            if used_context:
+                response = await self.llm_client.chat_with_context_async(
+                    message, used_context, history, summary=summary)
+            else:
+                response = await self.llm_client.chat_async(message, history, used_prompt, summary=summary)
             
-            # 保存AI回复，包含音频信息
-            assistant_message = {
-                "role": "assistant", 
-                "content": cleaned_response  # 使用清理后的内容
+            assistant_message = await loop.run_in_executor(None, self._record_reply, message, response)
+            return await loop.run_in_executor(
+                None, self._finalize_response, assistant_message, response, used_prompt, used_context, cache_key)
+            
+        except Exception as e:
+            print(f"处理消息时出错: {e}")
+            return {
+                "success": False,
+                "error": str(e)
             }
+    
+    async def process_message_stream_async(self, message: str, custom_prompt: Optional[str] = None,
+                                           context: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """process_message_stream的异步版本，事件格式相同"""
+        try:
+            # 使用传入的prompt和context，如果没有则使用存储的值
+            used_prompt = custom_prompt if custom_prompt is not None else self.custom_prompt
+            used_context = context if context is not None else self.context
+            loop = asyncio.get_running_loop()
+            
+            history, summary = self._prompt_snapshot()
+            cache_key, cached = self._lookup_cached_response(message, history, used_prompt, used_context)
+            if cached:
+                result = await loop.run_in_executor(
+                    None, self._finalize_cached_response, message, cached, used_prompt, used_context)
+            else:
+                # 调用大模型流式API（有上下文时与chat_with_context一样使用默认系统prompt）
+                chunks = []
+                async for delta in self.llm_client.chat_stream_async(
+                        message, history, None if used_context else used_prompt,
+                        summary=summary, context=used_context):
+                    chunks.append(delta)
+                    yield {"type": "delta", "content": delta}
+                
+                response = "".join(chunks).strip()
+                assistant_message = await loop.run_in_executor(None, self._record_reply, message, response)
             
-            # 如果有音频文件，添加音频信息
-            if audio_filename and audio_path:
-                assistant_message["audio_file"] = audio_filename
-                assistant_message["timestamp"] = timestamp
+            if cached:
+                yield {"type": "delta", "content": cached["text_response"]}
+                yield {"type": "done", **result}
+                return
             
+            # 音频合成在线程池中进行，逐个取出事件
+            events = self._finalize_response_events(assistant_message, response, used_prompt, used_context, cache_key)
+            while True:
+                event = await loop.run_in_executor(None, next, events, None)
+                if event is None:
+                    break
+                yield event
+            
+        except Exception as e:
+            print(f"流式处理消息时出错: {e}")
+            yield {
+                "type": "done",
+                "success": False,
+                "error": str(e)
+            }
+    
+    def _prompt_snapshot(self) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        """
+        在同一次持锁中取出发送给模型的历史和滚动摘要
+        
+        已折叠进摘要的消息不再重复发送；摘要和历史一起取，后台摘要任务更新时两者不会错位
+        """
+        with self._history_lock:
+            covered = self.conversation_summary.get("covered_count", 0) if self.conversation_summary else 0
+            summary = self.conversation_summary.get("content") if self.conversation_summary else None
+            history = self.conversation_history[covered:]
+            # 在锁内算好token估算值，之后构建prompt时不再修改消息
+            for msg in history:
+                get_message_tokens(msg)
+            return history, summary
+    
+    def _lookup_cached_response(self, message: str, history: List[Dict[str, str]], used_prompt: Optional[str],
+                                used_context: Optional[str]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        计算本次请求的缓存键并查找缓存
+        
+        Returns:
+            Tuple: (缓存键, 缓存的回复)，未开启缓存时均为None
+        """
+        if self.response_cache is None:
+            return None, None
+        # 有上下文时与chat_with_context一样使用默认系统prompt
+        cache_key = self.llm_client.prompt_fingerprint(
+            message, history, None if used_context else used_prompt, context=used_context)
+        cached = self.response_cache.get(cache_key)
+        if cached:
+            print(f"♻️ 命中回复缓存: {cached['text_response'][:30]}")
+        return cache_key, cached
+    
+    def _record_reply(self, message: str, response: str) -> Dict[str, Any]:
+        """清理AI回复并把这一轮对话写入历史（音频合成完成后再补上音频信息），返回回复消息"""
+        # 清理括号内容
+        cleaned_response = self.clean_brackets_content(response)
+        print(f"🎭 原始响应: {response}")
+        print(f"🧹 清理后: {cleaned_response}")
+        # 流式响应中途断开时回复不完整：写入历史时加上标记，不缓存，也不合成语音
+        truncated = response.endswith(STREAM_INTERRUPTED_MARKER)
+        if truncated:
+            print("⚠️ 回复不完整（流式响应中断），不缓存也不合成语音")
+        return self._record_exchange(message, cleaned_response, truncated=truncated)
+    
+    def _finalize_response(self, assistant_message: Dict[str, Any], response: str,
+                           used_prompt: Optional[str], used_context: Optional[str],
+                           cache_key: Optional[str] = None) -> Dict[str, Any]:
+        """为已写入历史的回复生成音频"""
+        result = None
+        for event in self._finalize_response_events(assistant_message, response, used_prompt, used_context, cache_key):
+            result = event
+        result.pop("type")
+        return result
+    
+    def _finalize_response_events(self, assistant_message: Dict[str, Any], response: str,
+                                  used_prompt: Optional[str], used_context: Optional[str],
+                                  cache_key: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        _finalize_response的事件版本
+        
+        开启分句合成时先按顺序产出各段的 audio_chunk 事件，最后产出 {"type": "done", ...} 完整结果
+        """
+        cleaned_response = assistant_message["content"]
+        truncated = assistant_message.get("truncated", False)
+        
+        # 生成音频
+        audio_path = None
+        audio_filename = None
+        audio_partial = False
+        timestamp = int(time.time())
+        
+        if self.tts_client and not truncated:
+            # 同一秒内的多条回复（以及分句合成的 _partN 文件）不能重名
+            audio_filename = f"response_{timestamp}_{uuid.uuid4().hex[:8]}.wav"
+            # 使用清理后的响应生成音频
+            if self.tts_pipeline:
+                for event in self.tts_pipeline.synthesize(cleaned_response, audio_filename):
+                    if event["type"] == "audio_complete":
+                        audio_path = event["audio_path"]
+                        audio_partial = event.get("partial", False)
+                    else:
+                        yield event
+            else:
+                audio_path = self.tts_scheduler.synthesize(cleaned_response, audio_filename, PRIORITY_INTERACTIVE)
+            # 只返回文件名，不包含路径（分句合成返回的已经是文件名）
+            if audio_path:
+                audio_path = os.path.basename(audio_path)
+                precompress_audio(os.path.join(Config.AUDIO_OUTPUT_PATH, audio_path))
+        
+        # 只缓存正常生成且音频完整合成成功的回复
+        if cache_key and audio_path and not audio_partial and response not in ERROR_REPLIES:
+            self.response_cache.put(cache_key, cleaned_response, audio_path)
+        
+        audio_duration = self._attach_audio(assistant_message, audio_path, timestamp) if audio_path else None
+        result = self._exchange_result(cleaned_response, audio_path, audio_duration, used_prompt, used_context)
+        if truncated:
+            result["truncated"] = True
+        if audio_partial:
+            # 有句子合成失败，音频缺少部分内容
+            result["audio_partial"] = True
+        yield {"type": "done", **result}
+    
+    def _finalize_cached_response(self, message: str, cached: Dict[str, Any],
+                                  used_prompt: Optional[str], used_context: Optional[str]) -> Dict[str, Any]:
+        """把缓存的回复写入对话历史，复用已生成的音频文件"""
+        assistant_message = self._record_exchange(message, cached["text_response"],
+                                                  cached["audio_file"], int(time.time()))
+        result = self._exchange_result(cached["text_response"], cached["audio_file"],
+                                       assistant_message.get("audio_duration"), used_prompt, used_context)
+        result["cached"] = True
+        return result
+    
+    def _record_exchange(self, message: str, cleaned_response: str,
+                         audio_filename: Optional[str] = None, timestamp: Optional[int] = None,
+                         truncated: bool = False) -> Dict[str, Any]:
+        """把一轮对话写入历史并保存，返回写入的回复消息"""
+        # 保存AI回复，包含音频信息
+        assistant_message = {
+            "role": "assistant", 
+            "content": cleaned_response  # 使用清理后的内容
+        }
+        if truncated:
+            assistant_message["truncated"] = True
+        
+        # 如果有音频文件，添加音频信息
+        if audio_filename:
+            self._set_audio_info(assistant_message, audio_filename, timestamp)
+        
+        # 用户消息和回复在同一次持锁中添加，保存的记录里两者总是成对出现
+        with self._history_lock:
+            self.conversation_history.append({"role": "user", "content": message})
             self.conversation_history.append(assistant_message)
             
             # 自动保存聊天记录
             self.save_today_history()
-            
+        
+        # 较早的消息足够多时，在后台把它们折叠进摘要
+        self.summarizer.schedule(self)
+        
+        return assistant_message
+    
+    def _attach_audio(self, assistant_message: Dict[str, Any], audio_filename: str,
+                      timestamp: int) -> Optional[float]:
+        """音频合成完成后把音频信息补到已写入历史的回复上并保存，返回音频时长"""
+        info = {}
+        self._set_audio_info(info, audio_filename, timestamp)
+        with self._history_lock:
+            assistant_message.update(info)
+            self.save_today_history()
+        return info.get("audio_duration")
+    
+    def _set_audio_info(self, assistant_message: Dict[str, Any], audio_filename: str, timestamp: int):
+        """在回复消息上记录音频文件名、时间戳和时长"""
+        assistant_message["audio_file"] = audio_filename
+        assistant_message["timestamp"] = timestamp
+        # 合成时记录时长，之后读取历史不需要再打开音频文件
+        audio_duration = self._probe_audio_duration(audio_filename)
+        if audio_duration is not None:
+            assistant_message["audio_duration"] = audio_duration
+    
+    @staticmethod
+    def _exchange_result(cleaned_response: str, audio_path: Optional[str], audio_duration: Optional[float],
+                         used_prompt: Optional[str], used_context: Optional[str]) -> Dict[str, Any]:
+        return {
+            "success": True,
+            "text_response": cleaned_response,  # 使用清理后的内容
+            "audio_path": audio_path,
+            "audio_duration": audio_duration,
+            "used_prompt": used_prompt,
+            "used_context": used_context
+        }
+    
+    @staticmethod
+    def _probe_audio_duration(audio_filename: str) -> Optional[float]:
+        """读取文件头获取音频时长（秒），无法识别时返回None"""
+        info = probe_audio(os.path.join(Config.AUDIO_OUTPUT_PATH, audio_filename))
+        return round(info["duration"], 3) if info else None
+    
+    def get_audio_files_info(self) -> Dict[str, Any]:
+        """获取当前对话中音频文件的信息（时长取自消息记录，旧记录没有时读取文件头）"""
+        try:
+            files = []
+            total_duration = 0.0
+            with self._history_lock:
+                history = [dict(message) for message in self.conversation_history]
+            for index, message in enumerate(history):
+                audio_filename = message.get("audio_file")
+                if not audio_filename:
+                    continue
+                audio_path = os.path.join(Config.AUDIO_OUTPUT_PATH, audio_filename)
+                exists = os.path.exists(audio_path)
+                duration = message.get("audio_duration")
+                if duration is None and exists:
+                    duration = self._probe_audio_duration(audio_filename)
+                total_duration += duration or 0.0
+                files.append({
+                    "index": index,
+                    "audio_file": audio_filename,
+                    "exists": exists,
+                    "size": os.path.getsize(audio_path) if exists else 0,
+                    "duration": duration,
+                    "timestamp": message.get("timestamp")
+                })
             return {
                 "success": True,
-                "text_response": cleaned_response,  # 使用清理后的内容
-                "audio_path": audio_path,
-                "used_prompt": used_prompt,
-                "used_context": used_context
+                "files": files,
+                "total_files": len(files),
+                "total_duration": round(total_duration, 3)
             }
-            
         except Exception as e:
-            print(f"处理消息时出错: {e}")
             return {
                 "success": False,
-                "error": str(e)
+                "error": f"获取音频文件信息失败: {str(e)}"
             }
     
     def clear_history(self) -> Dict[str, Any]:
         """清空对话历史"""
         try:
-            self.conversation_history = []
-            # 保存空的聊天记录
-            self.save_today_history()
+            with self._history_lock:
+                self.conversation_history = []
+                self.conversation_summary = None
+                # 保存空的聊天记录
+                self.save_today_history()
             return {"success": True, "message": "对话历史已清空"}
         except Exception as e:
             return {"success": False, "error": str(e)}
     
     def get_history(self) -> List[Dict[str, str]]:
         """获取对话历史"""
-        return self.conversation_history.copy()
+        with self._history_lock:
+            return self.conversation_history.copy()
     
     def get_current_settings(self) -> Dict[str, any]:
         """获取当前设置"""
@@ -228,10 +572,36 @@ class ChatManager:
             "history_length": len(self.conversation_history)
         }
     
+    def get_llm_stats(self) -> Dict[str, Any]:
+        """获取大模型调用的用量和延迟统计"""
+        return {
+            "success": True,
+            "stats": self.llm_client.get_metrics(),
+            "response_cache": self.response_cache.get_stats() if self.response_cache else None
+        }
+    
+    def refresh_tts_backend(self) -> Dict[str, Any]:
+        """重新检测TTS调用方式"""
+        try:
+            backend = self.tts_client.refresh_backend()
+            return {"success": backend["kind"] is not None, "backend": backend}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    def set_voice_profile(self, ref_audio_path: Optional[str], prompt_text: str = "",
+                          prompt_lang: str = "中文") -> Dict[str, Any]:
+        """更换参考音色并向TTS服务重新登记"""
+        try:
+            profile = VoiceProfile(ref_audio_path, prompt_text, prompt_lang)
+            voice = self.tts_client.set_voice_profile(profile)
+            return {"success": True, "voice": voice}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
     def test_services(self) -> Dict[str, bool]:
         """测试所有服务是否正常"""
         results = {
-            "deepseek_api": self.deepseek_client.test_connection(),
+            "deepseek_api": self.llm_client.test_connection(),
             "tts_model": self._test_tts_model()
         }
         return results
@@ -242,7 +612,7 @@ class ChatManager:
             # 尝试生成一个简单的测试音频
             test_text = "测试"
             test_filename = "test_tts.wav"
-            result = self.tts_client.text_to_speech(test_text, test_filename)
+            result = self.tts_scheduler.synthesize(test_text, test_filename, PRIORITY_MAINTENANCE)
             return result is not None
         except Exception as e:
             print(f"TTS模型测试失败: {e}")
@@ -253,8 +623,15 @@ class ChatManager:
         return {
             "deepseek_api_key_configured": bool(Config.DEEPSEEK_API_KEY),
             "tts_model_path": Config.TTS_MODEL_PATH,
+            "tts_backend": self.tts_client.backend.describe(),
+            "tts_voice": self.tts_client.voice_profile.describe(),
             "conversation_history_length": len(self.conversation_history),
             "services_status": self.test_services(),
+            "llm_backends": Config.LLM_BACKENDS,
+            "prompt_cache": self.llm_client.get_cache_stats(),
+            "tts_cache": self.tts_client.cache.get_stats() if self.tts_client.cache else None,
+            "tts_scheduler": self.tts_scheduler.get_stats(),
+            "tts_quality": self.tts_client.quality.get_stats(),
             "custom_prompt_set": bool(self.custom_prompt),
             "context_set": bool(self.context)
         } 
@@ -262,25 +639,30 @@ class ChatManager:
     def delete_message_by_index(self, message_index: int) -> Dict[str, Any]:
         """删除指定索引的消息"""
         try:
-            if message_index < 0 or message_index >= len(self.conversation_history):
-                return {
-                    "success": False,
-                    "error": f"消息索引超出范围: {message_index}"
-                }
-            
-            # 获取要删除的消息
-            deleted_message = self.conversation_history[message_index]
-            
-            # 如果是assistant消息且有音频文件，检查是否需要删除音频文件
-            audio_file_to_delete = None
-            if deleted_message.get('role') == 'assistant' and 'audio_file' in deleted_message:
-                audio_file_to_delete = deleted_message['audio_file']
-            
-            # 删除消息
-            del self.conversation_history[message_index]
-            
-            # 自动保存聊天记录
-            self.save_today_history()
+            with self._history_lock:
+                if message_index < 0 or message_index >= len(self.conversation_history):
+                    return {
+                        "success": False,
+                        "error": f"消息索引超出范围: {message_index}"
+                    }
+                
+                # 获取要删除的消息
+                deleted_message = self.conversation_history[message_index]
+                
+                # 如果是assistant消息且有音频文件，检查是否需要删除音频文件
+                audio_file_to_delete = None
+                if deleted_message.get('role') == 'assistant' and 'audio_file' in deleted_message:
+                    audio_file_to_delete = deleted_message['audio_file']
+                
+                # 删除消息
+                del self.conversation_history[message_index]
+                
+                # 删除的是已折叠进摘要的消息时，同步调整摘要覆盖的范围
+                if self.conversation_summary and message_index < self.conversation_summary.get("covered_count", 0):
+                    self.conversation_summary["covered_count"] -= 1
+                
+                # 自动保存聊天记录
+                self.save_today_history()
             
             result = {
                 "success": True,
@@ -306,19 +688,20 @@ class ChatManager:
         """根据时间戳删除消息"""
         try:
             # 查找匹配时间戳的消息
-            message_index = None
-            for i, message in enumerate(self.conversation_history):
-                if message.get('timestamp') == timestamp:
-                    message_index = i
-                    break
-            
-            if message_index is None:
-                return {
-                    "success": False,
-                    "error": f"未找到时间戳为 {timestamp} 的消息"
-                }
-            
-            return self.delete_message_by_index(message_index)
+            with self._history_lock:
+                message_index = None
+                for i, message in enumerate(self.conversation_history):
+                    if message.get('timestamp') == timestamp:
+                        message_index = i
+                        break
+                
+                if message_index is None:
+                    return {
+                        "success": False,
+                        "error": f"未找到时间戳为 {timestamp} 的消息"
+                    }
+                
+                return self.delete_message_by_index(message_index)
             
         except Exception as e:
             return {
@@ -360,11 +743,12 @@ class ChatManager:
                 "is_idle_message": True
             }
             
-            # 添加到聊天记录
-            self.conversation_history.append(idle_message)
-            
-            # 保存到文件
-            self.save_today_history()
+            with self._history_lock:
+                # 添加到聊天记录
+                self.conversation_history.append(idle_message)
+                
+                # 保存到文件
+                self.save_today_history()
             
             print(f"💾 待机消息已保存到聊天记录")
             
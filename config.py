@@ -7,21 +7,120 @@ class Config:
     # DeepSeek API配置
     DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "")
     DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
+    DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
+    
+    # 大模型后端配置：按逗号分隔启用多个后端，由路由器按延迟选择并在失败时切换
+    LLM_BACKENDS = os.getenv("LLM_BACKENDS", "deepseek")  # 可选: deepseek, local
+    LOCAL_LLM_API_URL = os.getenv("LOCAL_LLM_API_URL", "http://localhost:11434/v1/chat/completions")  # OpenAI兼容接口
+    LOCAL_LLM_API_KEY = os.getenv("LOCAL_LLM_API_KEY", "")
+    LOCAL_LLM_MODEL = os.getenv("LOCAL_LLM_MODEL", "qwen2.5:7b")
+    LLM_ROUTER_EXPLORE_RATE = float(os.getenv("LLM_ROUTER_EXPLORE_RATE", "0.05"))  # 随机尝试非最快后端的比例，用于刷新延迟估计
     
     # TTS模型配置
     TTS_MODEL_PATH = os.getenv("TTS_MODEL_PATH", "./models/gpt-sovits")
     TTS_CONFIG_PATH = os.getenv("TTS_CONFIG_PATH", "./models/config.json")
     
+    # 参考音色：向TTS服务登记一次，之后合成时复用服务端的参考音频和特征
+    TTS_REF_AUDIO_PATH = os.getenv("TTS_REF_AUDIO_PATH", "")  # 参考音频路径（api_v2接口为服务端路径，除非开启上传）
+    TTS_PROMPT_TEXT = os.getenv("TTS_PROMPT_TEXT", "")  # 参考音频对应的文本，为空时使用无参考文本模式
+    TTS_PROMPT_LANG = os.getenv("TTS_PROMPT_LANG", "中文")
+    TTS_REF_AUDIO_UPLOAD = os.getenv("TTS_REF_AUDIO_UPLOAD", "false").lower() == "true"  # api_v2接口也先上传参考音频
+    TTS_VOICE_RETRY_INTERVAL = float(os.getenv("TTS_VOICE_RETRY_INTERVAL", "30"))  # 登记参考音色失败后的首次重试间隔（秒），之后逐次加倍
+    
+    # GPT-SOVITs HTTP接口探测：启动时探测一次，连续失败多次后重新探测
+    TTS_HTTP_PROBE_TEXT = os.getenv("TTS_HTTP_PROBE_TEXT", "你好")  # 探测时合成的文本
+    TTS_HTTP_PROBE_TIMEOUT = float(os.getenv("TTS_HTTP_PROBE_TIMEOUT", "60"))  # 每个候选接口的探测超时（秒）
+    TTS_HTTP_DISCOVERY_FAILURES = int(os.getenv("TTS_HTTP_DISCOVERY_FAILURES", "3"))  # 连续失败多少次后重新探测
+    TTS_HTTP_DISCOVERY_RETRY_INTERVAL = float(os.getenv("TTS_HTTP_DISCOVERY_RETRY_INTERVAL", "30"))  # 探测失败后至少间隔多久再探测（秒）
+    TTS_HTTP_DISCOVERY_WAIT = float(os.getenv("TTS_HTTP_DISCOVERY_WAIT", "10"))  # 正在探测时合成请求最多等待探测结果的时间（秒），超时后这次不合成语音
+    TTS_SHARED_FILESYSTEM = os.getenv("TTS_SHARED_FILESYSTEM", "false").lower() == "true"  # TTS服务与本服务共享文件系统时直接链接生成的音频文件
+    
+    # 进程内推理（Python API）：直接加载GPT-SOVITs仓库中的推理管线，只用CPU
+    GPT_SOVITS_ROOT = os.getenv("GPT_SOVITS_ROOT", "")  # GPT-SOVITs仓库根目录，为空时使用TTS_MODEL_PATH
+    TTS_PYTHON_WORKERS = int(os.getenv("TTS_PYTHON_WORKERS", "0"))  # 推理进程数，>0时启用，每个进程加载一份模型
+    TTS_PYTHON_CONFIG = os.getenv("TTS_PYTHON_CONFIG", "")  # 推理配置文件（相对仓库根目录），为空时使用GPT_SoVITS/configs/tts_infer.yaml
+    TTS_PYTHON_THREADS = int(os.getenv("TTS_PYTHON_THREADS", "0"))  # 每个进程的CPU线程数，0表示按核数平均分配
+    
+    # 命令行TTS的常驻工作进程数，>0时模型只加载一次（脚本需支持 --serve，见 tts_workers.py）
+    TTS_CLI_WORKERS = int(os.getenv("TTS_CLI_WORKERS", "0"))
+    TTS_CLI_WORKER_START_TIMEOUT = float(os.getenv("TTS_CLI_WORKER_START_TIMEOUT", "120"))  # 等待模型加载完成的时间（秒）
+    TTS_CLI_WORKER_MAX_START_FAILURES = int(os.getenv("TTS_CLI_WORKER_MAX_START_FAILURES", "3"))  # 连续启动失败多少次后改为按次启动
+    
+    # 语音缓存：相同文本和参数的合成结果直接复用，输出目录超过上限时淘汰最久未用的缓存音频
+    TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "true").lower() == "true"
+    TTS_CACHE_MAX_MB = int(os.getenv("TTS_CACHE_MAX_MB", "500"))  # 语音缓存独占空间的上限，<=0表示不限制。与对话音频硬链接的副本不计入，不是输出目录的磁盘上限
+    
+    # TTS任务调度：同时合成数不超过上游承载能力，等待队列按优先级出队
+    TTS_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", "2"))  # 同时进行的合成数上限
+    TTS_QUEUE_SIZE = int(os.getenv("TTS_QUEUE_SIZE", "32"))  # 排队等待的合成任务上限
+    # 负载自适应质量：出声时间p95超过预算或排队积压时降低推理参数档位，负载下降后恢复
+    TTS_QUALITY_BUDGET_MS = float(os.getenv("TTS_QUALITY_BUDGET_MS", "0"))  # 出声时间p95的预算（毫秒），<=0表示不启用
+    TTS_QUALITY_QUEUE_HIGH = int(os.getenv("TTS_QUALITY_QUEUE_HIGH", "8"))  # 排队任务达到该数量时降级
+    TTS_QUALITY_RECOVER_RATIO = float(os.getenv("TTS_QUALITY_RECOVER_RATIO", "0.6"))  # p95低于预算的该比例且无排队时恢复
+    TTS_QUALITY_WINDOW = int(os.getenv("TTS_QUALITY_WINDOW", "50"))  # 计算p95的最近样本数
+    TTS_QUALITY_MIN_SAMPLES = int(os.getenv("TTS_QUALITY_MIN_SAMPLES", "10"))  # 至少多少个样本才判断是否切换
+    TTS_QUALITY_COOLDOWN = float(os.getenv("TTS_QUALITY_COOLDOWN", "30"))  # 两次切换之间至少间隔的秒数
+    # 批量合成：短时间内到达的请求合并成一次请求，需TTS服务实现批量接口（见 tts_http.py），为空时不启用
+    TTS_BATCH_ENDPOINT = os.getenv("TTS_BATCH_ENDPOINT", "")
+    TTS_BATCH_WINDOW_MS = int(os.getenv("TTS_BATCH_WINDOW_MS", "20"))  # 收集同一批请求的等待时间（毫秒）
+    TTS_BATCH_MAX_SIZE = int(os.getenv("TTS_BATCH_MAX_SIZE", "8"))  # 每批最多的文本条数
+    
+    # 分句流水线合成：长回复按句子切分，第一句合成完即可开始播放
+    TTS_PIPELINE_ENABLED = os.getenv("TTS_PIPELINE_ENABLED", "false").lower() == "true"
+    TTS_PIPELINE_CONCURRENCY = int(os.getenv("TTS_PIPELINE_CONCURRENCY", "2"))  # 每条回复提前提交给调度器的句子数（总并发受 TTS_MAX_CONCURRENCY 限制）
+    TTS_PIPELINE_MIN_CHARS = int(os.getenv("TTS_PIPELINE_MIN_CHARS", "8"))  # 短于此长度的句子与下一句合并
+    TTS_PIPELINE_PART_TTL = float(os.getenv("TTS_PIPELINE_PART_TTL", "300"))  # 拼接完成后片段文件保留的秒数（留给还在播放的客户端）
+    
     # 音频配置
     SAMPLE_RATE = 22050
     AUDIO_OUTPUT_PATH = "./output"
     
+    # 音频后处理：合成结果重采样到SAMPLE_RATE并归一化响度（NumPy/SciPy，在内存中处理）
+    AUDIO_POSTPROCESS_ENABLED = os.getenv("AUDIO_POSTPROCESS_ENABLED", "false").lower() == "true"
+    AUDIO_TARGET_DBFS = float(os.getenv("AUDIO_TARGET_DBFS", "-20"))  # 响度归一化的目标RMS电平
+    AUDIO_CROSSFADE_MS = float(os.getenv("AUDIO_CROSSFADE_MS", "20"))  # 分句拼接时接缝处的交叉淡化时长（毫秒）
+    
+    # 压缩音频配置：用ffmpeg生成Opus/MP3副本，按请求的Accept头返回
+    AUDIO_COMPRESSION_ENABLED = os.getenv("AUDIO_COMPRESSION_ENABLED", "true").lower() == "true"
+    FFMPEG_PATH = os.getenv("FFMPEG_PATH", "ffmpeg")
+    AUDIO_OPUS_BITRATE = int(os.getenv("AUDIO_OPUS_BITRATE", "32"))  # kbps
+    AUDIO_MP3_BITRATE = int(os.getenv("AUDIO_MP3_BITRATE", "64"))  # kbps
+    AUDIO_PRECOMPRESS_FORMATS = os.getenv("AUDIO_PRECOMPRESS_FORMATS", "opus,mp3")  # 合成后立即在后台生成的格式
+    AUDIO_DEFAULT_FORMAT = os.getenv("AUDIO_DEFAULT_FORMAT", "mp3")  # Accept头没有列出音频类型时使用的格式
+    
     # Web服务器配置
     HOST = "0.0.0.0"
     PORT = 8000
     
     # 对话配置
     MAX_HISTORY_LENGTH = 10
+    HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "0"))  # 历史消息的token预算，大于0时取代按条数截取
+    HISTORY_WINDOW_STEP = int(os.getenv("HISTORY_WINDOW_STEP", "4"))  # 历史窗口起点每次前移的步长，保持prompt前缀稳定以命中缓存
+    
+    # 对话滚动摘要配置
+    SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "false").lower() == "true"
+    SUMMARY_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", str(MAX_HISTORY_LENGTH)))  # 最近多少条消息不参与折叠
+    SUMMARY_TRIGGER_MESSAGES = int(os.getenv("SUMMARY_TRIGGER_MESSAGES", "6"))  # 待折叠消息达到多少条时更新摘要
+    SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "500"))
+    DEEPSEEK_MAX_CONCURRENCY = int(os.getenv("DEEPSEEK_MAX_CONCURRENCY", "8"))  # 异步模式下同时进行的DeepSeek请求数上限
+    
+    # DeepSeek重试与熔断配置
+    DEEPSEEK_MAX_RETRIES = int(os.getenv("DEEPSEEK_MAX_RETRIES", "2"))  # 可重试错误的最大重试次数
+    DEEPSEEK_RETRY_BASE_DELAY = float(os.getenv("DEEPSEEK_RETRY_BASE_DELAY", "0.5"))  # 指数退避的基础等待秒数
+    DEEPSEEK_RETRY_MAX_DELAY = float(os.getenv("DEEPSEEK_RETRY_MAX_DELAY", "4"))
+    CIRCUIT_BREAKER_FAILURE_RATE = float(os.getenv("CIRCUIT_BREAKER_FAILURE_RATE", "0.5"))  # 最近调用失败率达到该值时熔断
+    CIRCUIT_BREAKER_MIN_CALLS = int(os.getenv("CIRCUIT_BREAKER_MIN_CALLS", "5"))  # 至少统计这么多次调用才判断是否熔断
+    CIRCUIT_BREAKER_WINDOW = int(os.getenv("CIRCUIT_BREAKER_WINDOW", "20"))  # 统计失败率的最近调用次数
+    CIRCUIT_BREAKER_COOLDOWN = float(os.getenv("CIRCUIT_BREAKER_COOLDOWN", "30"))  # 熔断后多少秒放行探测请求
+    
+    # 回复缓存配置：系统prompt、上下文、最近几条对话和当前消息相同时直接复用之前的回复和音频
+    RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+    RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))  # 缓存有效期（秒）
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+    RESPONSE_CACHE_RECENT_MESSAGES = int(os.getenv("RESPONSE_CACHE_RECENT_MESSAGES", "2"))  # 缓存键包含的最近历史消息数（2即上一轮问答）
+    
+    # 指标统计配置
+    METRICS_WINDOW_SIZE = int(os.getenv("METRICS_WINDOW_SIZE", "200"))  # 计算延迟分位数时保留的最近样本数
     
     # 系统prompt - 你可以在这里自定义AI助手的角色和行为
     SYSTEM_PROMPT = os.getenv("SYSTEM_PROMPT", "")
@@ -29,7 +128,15 @@ class Config:
     # 百度语音识别API配置
     BAIDU_API_KEY = os.getenv("BAIDU_API_KEY", "")
     BAIDU_SECRET_KEY = os.getenv("BAIDU_SECRET_KEY", "")
-    
+
+    # HTTP连接池配置（所有上游客户端共享）
+    HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))  # 缓存的主机连接池数量
+    HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))  # 每个主机保持的最大连接数
+    HTTP_POOL_HOST_SIZES = os.getenv("HTTP_POOL_HOST_SIZES", "")  # 按主机覆盖，如 "api.deepseek.com=20,localhost:9872=4"
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+    HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+    HTTP_TCP_KEEPALIVE = os.getenv("HTTP_TCP_KEEPALIVE", "true").lower() == "true"
+
     @classmethod
     def get_masked_api_key(cls) -> str:
         """获取隐藏的API key，只显示前4位和后4位"""
@@ -0,0 +1,107 @@
+"""
+对话滚动摘要
+
+当天的对话变长后，把超出最近窗口的较早消息在后台线程中折叠进一段滚动摘要。
+摘要和已折叠的消息数一起保存在当天的聊天记录文件中，请求时放在系统prompt之后，
+这样prompt保持简短，角色仍然记得当天更早的对话内容。
+
+后台任务在聊天管理器的历史锁内取出待折叠消息的副本，调用大模型时不持有锁；
+写回摘要和保存时再次持锁，并确认这段时间内历史没有被清空或删改。
+"""
+import threading
+import time
+from typing import List, Dict, Any, Optional
+
+from config import Config
+
+SUMMARY_SYSTEM_PROMPT = (
+    "你负责整理对话记忆。请把已有摘要和新的对话内容合并成一段新的摘要，"
+    "保留人物、事件、约定、用户的喜好和情绪等之后对话可能用到的信息，"
+    "用第三人称简洁叙述，不要超过300字，只输出摘要本身。"
+)
+
+
+class ConversationSummarizer:
+    def __init__(self, llm_client):
+        self.llm_client = llm_client
+        self._running = threading.Lock()
+
+    def needs_compaction(self, history: List[Dict[str, Any]],
+                         summary: Optional[Dict[str, Any]]) -> bool:
+        """判断是否有足够多的较早消息需要折叠进摘要"""
+        if not Config.SUMMARY_ENABLED:
+            return False
+        covered = summary.get("covered_count", 0) if summary else 0
+        pending = len(history) - covered - Config.SUMMARY_KEEP_RECENT
+        return pending >= Config.SUMMARY_TRIGGER_MESSAGES
+
+    def schedule(self, chat_manager) -> bool:
+        """
+        需要时在后台线程中更新摘要，不阻塞当前请求
+
+        Returns:
+            bool: 是否启动了新的摘要任务
+        """
+        with chat_manager._history_lock:
+            if not self.needs_compaction(chat_manager.conversation_history,
+                                         chat_manager.conversation_summary):
+                return False
+        # 同一时间只运行一个摘要任务
+        if not self._running.acquire(blocking=False):
+            return False
+
+        thread = threading.Thread(target=self._compact, args=(chat_manager,), daemon=True)
+        thread.start()
+        return True
+
+    def summarize(self, previous_summary: str, messages: List[Dict[str, Any]]) -> str:
+        """把已有摘要和新消息合并为新摘要，失败时抛出异常"""
+        transcript = "\n".join(
+            f"{'用户' if msg.get('role') == 'user' else '爱莉'}：{msg.get('content', '')}"
+            for msg in messages
+        )
+        prompt = f"已有摘要：{previous_summary or '无'}\n\n新的对话内容：\n{transcript}"
+        return self.llm_client.complete(
+            [
+                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.3,
+            max_tokens=Config.SUMMARY_MAX_TOKENS
+        )
+
+    def _compact(self, chat_manager):
+        """后台任务：把最近窗口之前、尚未折叠的消息合并进摘要"""
+        try:
+            # 持锁取出快照，生成摘要期间其他线程可以继续追加消息、补充音频信息
+            with chat_manager._history_lock:
+                history = chat_manager.conversation_history
+                summary = dict(chat_manager.conversation_summary or {})
+                covered = summary.get("covered_count", 0)
+                end = len(history) - Config.SUMMARY_KEEP_RECENT
+                if end <= covered:
+                    return
+                pending = [dict(msg) for msg in history[covered:end]]
+                last_message = history[end - 1]
+
+            print(f"📝 正在后台生成对话摘要: 折叠 {len(pending)} 条消息")
+            new_summary = self.summarize(summary.get("content", ""), pending)
+
+            with chat_manager._history_lock:
+                # 生成期间历史被清空或删除过消息时，放弃这次结果
+                current = chat_manager.conversation_history
+                if current is not history or len(current) < end or current[end - 1] is not last_message:
+                    print("⚠️ 对话历史已变化，放弃本次摘要")
+                    return
+
+                chat_manager.conversation_summary = {
+                    "content": new_summary,
+                    "covered_count": end,
+                    "updated_at": int(time.time())
+                }
+                chat_manager.save_today_history()
+            print(f"✅ 对话摘要已更新，已折叠 {end} 条消息")
+        except Exception as e:
+            print(f"❌ 生成对话摘要失败: {e}")
+        finally:
+            self._running.release()
@@ -1,16 +1,52 @@
+import asyncio
+import hashlib
+import time
 import requests
+import httpx
 import json
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, Iterable, AsyncIterator
 from config import Config
+from http_pool import get_session, get_timeout, get_async_client, get_async_timeout
+from history_window import select_history
+from metrics import LLMMetrics
+from resilience import CircuitBreaker, CircuitOpenError, backoff_delay, is_retryable_error
+
+# 请求失败时返回给用户的兜底回复
+UNAVAILABLE_REPLY = "抱歉，我现在无法回答，请稍后再试。"
+FORMAT_ERROR_REPLY = "抱歉，响应格式有误，请稍后再试。"
+UNKNOWN_ERROR_REPLY = "抱歉，发生了未知错误，请稍后再试。"
+ERROR_REPLIES = (UNAVAILABLE_REPLY, FORMAT_ERROR_REPLY, UNKNOWN_ERROR_REPLY)
+# 流式回复已产出部分内容后中断时，在末尾追加的标记；调用方据此识别不完整的回复
+STREAM_INTERRUPTED_MARKER = "……回复中断了，请稍后再试。"
 
 class DeepSeekClient:
-    def __init__(self):
-        self.api_key = Config.DEEPSEEK_API_KEY
-        self.api_url = Config.DEEPSEEK_API_URL
+    """
+    DeepSeek对话客户端
+    
+    DeepSeek的接口与OpenAI Chat Completions兼容，传入其他地址和模型名即可对接
+    任意兼容的服务（见 llm_backends.OpenAICompatibleClient）。
+    """
+    def __init__(self, api_url: Optional[str] = None, api_key: Optional[str] = None,
+                 model: Optional[str] = None, name: str = "deepseek"):
+        self.name = name
+        self.api_key = api_key if api_key is not None else Config.DEEPSEEK_API_KEY
+        self.api_url = api_url or Config.DEEPSEEK_API_URL
+        self.model = model or Config.DEEPSEEK_MODEL
+        self.models_url = self.api_url.rsplit("/chat/completions", 1)[0] + "/models"
         self.headers = {
-            "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        if self.api_key:
+            self.headers["Authorization"] = f"Bearer {self.api_key}"
+        self.session = get_session()
+        # 异步请求的并发上限，在首次异步调用时创建（需绑定到运行中的事件循环）
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+        
+        # 每次调用的用量、延迟和状态统计
+        self.metrics = LLMMetrics()
+        # 上游错误率过高时快速失败
+        self.breaker = CircuitBreaker(name)
     
     def _mask_api_key(self, text: str) -> str:
         """隐藏API key，只显示前4位和后4位"""
@@ -22,7 +58,9 @@ class DeepSeekClient:
     def chat(self, message: str, history: List[Dict[str, str]] = None, 
              custom_prompt: Optional[str] = None, 
              temperature: float = 0.7,
-             max_tokens: int = 1000) -> str:
+             max_tokens: int = 1000,
+             summary: Optional[str] = None,
+             context: Optional[str] = None) -> str:
         """
         发送消息到DeepSeek API并获取回复
         
@@ -32,87 +70,489 @@ class DeepSeekClient:
             custom_prompt: 自定义系统prompt，如果为None则使用默认的
             temperature: 控制回复的随机性 (0.0-1.0)
             max_tokens: 最大回复长度
+            summary: 更早对话的滚动摘要，放在系统prompt之后
+            context: 额外的上下文信息，放在当前用户消息之前
             
         Returns:
             str: AI的回复文本
         """
-        if history is None:
-            history = []
+        data = self._build_payload(message, history, custom_prompt,
+                                   temperature, max_tokens, stream=False,
+                                   summary=summary, context=context)
         
-        # 使用自定义prompt或默认prompt
-        system_prompt = custom_prompt if custom_prompt else Config.SYSTEM_PROMPT
+        try:
+            return self._post_completion(data)
+            
+        except CircuitOpenError as e:
+            print(f"⚡ {e}")
+            return UNAVAILABLE_REPLY
+        except requests.exceptions.RequestException as e:
+            error_msg = self._mask_api_key(str(e))
+            print(f"API请求错误: {error_msg}")
+            return UNAVAILABLE_REPLY
+        except KeyError as e:
+            print(f"API响应格式错误: {e}")
+            return FORMAT_ERROR_REPLY
+        except Exception as e:
+            error_msg = self._mask_api_key(str(e))
+            print(f"未知错误: {error_msg}")
+            return UNKNOWN_ERROR_REPLY
+    
+    def chat_with_context(self, message: str, context: str = "", 
+                         history: List[Dict[str, str]] = None,
+                         summary: Optional[str] = None) -> str:
+        """
+        带上下文的对话，可以在prompt中加入特定上下文
         
-        # 构建消息列表
-        messages = [{"role": "system", "content": system_prompt}]
+        Args:
+            message: 用户输入的消息
+            context: 额外的上下文信息
+            history: 对话历史记录
+            summary: 更早对话的滚动摘要
+            
+        Returns:
+            str: AI的回复文本
+        """
+        return self.chat(message, history, summary=summary, context=context)
+    
+    def chat_stream(self, message: str, history: List[Dict[str, str]] = None,
+                    custom_prompt: Optional[str] = None,
+                    temperature: float = 0.7,
+                    max_tokens: int = 1000,
+                    summary: Optional[str] = None,
+                    context: Optional[str] = None) -> Iterator[str]:
+        """
+        以流式方式发送消息到DeepSeek API，逐段产出回复文本
         
-        # 添加历史对话
-        for msg in history[-Config.MAX_HISTORY_LENGTH:]:
-            messages.append(msg)
+        参数与chat相同，区别在于请求使用SSE流式返回，每收到一段增量文本就立即产出，
+        调用方可以在完整回复生成之前就开始展示内容。
         
-        # 添加当前用户消息
-        messages.append({"role": "user", "content": message})
+        Yields:
+            str: 回复文本的增量片段。已产出部分内容后出错时，最后一段为 STREAM_INTERRUPTED_MARKER
+        """
+        data = self._build_payload(message, history, custom_prompt,
+                                   temperature, max_tokens, stream=True,
+                                   summary=summary, context=context)
+        
+        received = False
+        try:
+            for delta in self._stream_deltas(data):
+                received = True
+                yield delta
+            
+        except CircuitOpenError as e:
+            print(f"⚡ {e}")
+            yield STREAM_INTERRUPTED_MARKER if received else UNAVAILABLE_REPLY
+        except requests.exceptions.RequestException as e:
+            error_msg = self._mask_api_key(str(e))
+            print(f"API流式请求错误: {error_msg}")
+            yield STREAM_INTERRUPTED_MARKER if received else UNAVAILABLE_REPLY
+        except Exception as e:
+            error_msg = self._mask_api_key(str(e))
+            print(f"流式响应处理错误: {error_msg}")
+            yield STREAM_INTERRUPTED_MARKER if received else UNKNOWN_ERROR_REPLY
+    
+    def complete(self, messages: List[Dict[str, str]],
+                 temperature: float = 0.7,
+                 max_tokens: int = 1000) -> str:
+        """
+        发送已构建好的消息列表并返回回复文本
         
-        # 构建请求数据
+        与chat不同，请求失败时直接抛出异常，适合需要区分成功与失败的内部调用（如生成摘要）
+        """
         data = {
-            "model": "deepseek-chat",
+            "model": self.model,
             "messages": messages,
             "max_tokens": max_tokens,
             "temperature": temperature,
             "stream": False
         }
-        
+        return self._post_completion(data)
+    
+    def _post_completion(self, data: Dict[str, Any]) -> str:
+        """发送非流式请求并取出回复文本，可重试的错误按退避重试，最终失败时抛出异常"""
+        for attempt in range(Config.DEEPSEEK_MAX_RETRIES + 1):
+            self._check_breaker()
+            try:
+                result = self._post_completion_once(data)
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                time.sleep(self._retry_delay(e, attempt))
+            else:
+                self.breaker.record_success()
+                return result
+    
+    def _post_completion_once(self, data: Dict[str, Any]) -> str:
+        """发送一次非流式请求"""
+        call = self.metrics.start_call()
         try:
-            response = requests.post(
+            response = self.session.post(
                 self.api_url,
                 headers=self.headers,
                 json=data,
-                timeout=30
+                timeout=get_timeout(30)
             )
+            call["status"] = response.status_code
+            call["ttfb"] = response.elapsed.total_seconds()
             response.raise_for_status()
             
             result = response.json()
+            call["usage"] = result.get("usage")
             ai_message = result["choices"][0]["message"]["content"]
             return ai_message.strip()
+        except Exception as e:
+            call["error"] = self._mask_api_key(str(e))
+            raise
+        finally:
+            self.metrics.finish_call(call)
+    
+    async def _post_completion_async(self, data: Dict[str, Any]) -> str:
+        """_post_completion的异步版本"""
+        for attempt in range(Config.DEEPSEEK_MAX_RETRIES + 1):
+            self._check_breaker()
+            try:
+                result = await self._post_completion_once_async(data)
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                await asyncio.sleep(self._retry_delay(e, attempt))
+            else:
+                self.breaker.record_success()
+                return result
+    
+    async def _post_completion_once_async(self, data: Dict[str, Any]) -> str:
+        """发送一次异步非流式请求"""
+        call = self.metrics.start_call()
+        try:
+            async with self._get_semaphore():
+                async with get_async_client().stream(
+                    "POST",
+                    self.api_url,
+                    headers=self.headers,
+                    json=data,
+                    timeout=get_async_timeout(30)
+                ) as response:
+                    call["status"] = response.status_code
+                    self.metrics.mark_first_byte(call)
+                    await response.aread()
+            response.raise_for_status()
             
-        except requests.exceptions.RequestException as e:
+            result = response.json()
+            call["usage"] = result.get("usage")
+            ai_message = result["choices"][0]["message"]["content"]
+            return ai_message.strip()
+        except Exception as e:
+            call["error"] = self._mask_api_key(str(e))
+            raise
+        finally:
+            self.metrics.finish_call(call)
+    
+    def _build_messages(self, message: str, history: Optional[List[Dict[str, str]]],
+                        custom_prompt: Optional[str],
+                        summary: Optional[str] = None,
+                        context: Optional[str] = None) -> List[Dict[str, str]]:
+        """
+        构建发送给API的消息列表
+        
+        DeepSeek会缓存与之前请求相同的消息前缀，因此消息按从稳定到易变排列：
+        系统prompt、摘要、历史对话在多轮之间保持逐字节一致，上下文和当前消息放在末尾。
+        """
+        if history is None:
+            history = []
+        
+        # 使用自定义prompt或默认prompt
+        system_prompt = custom_prompt if custom_prompt else Config.SYSTEM_PROMPT
+        
+        # 构建消息列表
+        messages = [{"role": "system", "content": system_prompt}]
+        
+        # 更早对话的滚动摘要紧跟在系统prompt之后
+        if summary:
+            messages.append({"role": "system", "content": f"之前对话的摘要：{summary}"})
+        
+        # 添加历史对话（窗口按步长滑动），只发送API需要的字段
+        for msg in select_history(history):
+            messages.append({"role": msg["role"], "content": msg["content"]})
+        
+        # 上下文经常变化，放在当前用户消息之前，不破坏前面的缓存前缀
+        if context:
+            messages.append({
+                "role": "system",
+                "content": f"当前上下文：{context}\n请根据以上上下文回答用户的问题。"
+            })
+        
+        # 添加当前用户消息
+        messages.append({"role": "user", "content": message})
+        return messages
+    
+    def prompt_fingerprint(self, message: str, history: Optional[List[Dict[str, str]]] = None,
+                           custom_prompt: Optional[str] = None,
+                           temperature: float = 0.7,
+                           context: Optional[str] = None,
+                           recent_messages: Optional[int] = None) -> str:
+        """
+        计算一次请求的指纹，用作回复缓存的键
+        
+        由模型名、温度、系统prompt、上下文、当前消息和最近recent_messages条历史消息决定
+        （默认 Config.RESPONSE_CACHE_RECENT_MESSAGES，即上一轮问答）。
+        完整的历史窗口和摘要每轮都会变化，包含进来缓存几乎不会命中；回复主要取决于最近的对话
+        """
+        if recent_messages is None:
+            recent_messages = Config.RESPONSE_CACHE_RECENT_MESSAGES
+        recent = history[-recent_messages:] if history and recent_messages > 0 else []
+        messages = [{"role": "system", "content": custom_prompt if custom_prompt else Config.SYSTEM_PROMPT}]
+        messages.extend({"role": msg["role"], "content": msg["content"]} for msg in recent)
+        if context:
+            messages.append({"role": "system", "content": context})
+        messages.append({"role": "user", "content": message})
+        payload = {
+            "model": self.model,
+            "temperature": temperature,
+            "messages": messages
+        }
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    def _build_payload(self, message: str, history: Optional[List[Dict[str, str]]],
+                       custom_prompt: Optional[str], temperature: float,
+                       max_tokens: int, stream: bool,
+                       summary: Optional[str] = None,
+                       context: Optional[str] = None) -> Dict[str, Any]:
+        """构建请求数据"""
+        data = {
+            "model": self.model,
+            "messages": self._build_messages(message, history, custom_prompt, summary, context),
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": stream
+        }
+        if stream:
+            # 让流式响应在最后一个数据块中带上usage
+            data["stream_options"] = {"include_usage": True}
+        return data
+    
+    def _stream_deltas(self, data: Dict[str, Any]) -> Iterator[str]:
+        """
+        发送流式请求并产出文本增量，失败时抛出异常
+        
+        只在连接建立、收到成功状态码之前重试；开始产出内容后不再重试，避免重复输出。
+        """
+        for attempt in range(Config.DEEPSEEK_MAX_RETRIES + 1):
+            self._check_breaker()
+            call = self.metrics.start_call(stream=True)
+            connected = False
+            try:
+                with self.session.post(
+                    self.api_url,
+                    headers=self.headers,
+                    json=data,
+                    timeout=get_timeout(30),
+                    stream=True
+                ) as response:
+                    call["status"] = response.status_code
+                    response.raise_for_status()
+                    connected = True
+                    self.breaker.record_success()
+                    
+                    yield from self._iter_sse_deltas(response.iter_lines(), call)
+                return
+            except Exception as e:
+                call["error"] = self._mask_api_key(str(e))
+                if connected or not self._should_retry(e, attempt):
+                    raise
+                time.sleep(self._retry_delay(e, attempt))
+            finally:
+                self.metrics.finish_call(call)
+    
+    async def _stream_deltas_async(self, data: Dict[str, Any]) -> AsyncIterator[str]:
+        """_stream_deltas的异步版本"""
+        for attempt in range(Config.DEEPSEEK_MAX_RETRIES + 1):
+            self._check_breaker()
+            call = self.metrics.start_call(stream=True)
+            connected = False
+            try:
+                async with self._get_semaphore():
+                    async with get_async_client().stream(
+                        "POST",
+                        self.api_url,
+                        headers=self.headers,
+                        json=data,
+                        timeout=get_async_timeout(30)
+                    ) as response:
+                        call["status"] = response.status_code
+                        response.raise_for_status()
+                        connected = True
+                        self.breaker.record_success()
+                        
+                        async for raw_line in response.aiter_lines():
+                            payload = self._parse_sse_line(raw_line)
+                            if payload is None:
+                                continue
+                            if payload == "[DONE]":
+                                break
+                            
+                            delta = self._handle_stream_chunk(payload, call)
+                            if delta:
+                                yield delta
+                return
+            except Exception as e:
+                call["error"] = self._mask_api_key(str(e))
+                if connected or not self._should_retry(e, attempt):
+                    raise
+                await asyncio.sleep(self._retry_delay(e, attempt))
+            finally:
+                self.metrics.finish_call(call)
+    
+    def _check_breaker(self):
+        """熔断器打开时直接拒绝请求"""
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"{self.name} 错误率过高，熔断中，暂时跳过请求")
+    
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        """把失败计入熔断器，并判断是否还应重试"""
+        if not is_retryable_error(error):
+            # 上游能正常响应（如参数错误、响应格式问题），不计入熔断
+            self.breaker.record_success()
+            return False
+        self.breaker.record_failure()
+        # 熔断器已打开时不再重试，直接失败
+        return attempt < Config.DEEPSEEK_MAX_RETRIES and self.breaker.state == CircuitBreaker.CLOSED
+    
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """计算重试前的等待时间并打印提示"""
+        delay = backoff_delay(attempt)
+        print(f"🔁 {self.name} 请求失败，{delay:.2f}秒后重试（第{attempt + 1}次）: {self._mask_api_key(str(error))}")
+        return delay
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取上下文缓存命中统计"""
+        return self.metrics.get_cache_stats()
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取调用用量、延迟和熔断器状态统计"""
+        stats = self.metrics.snapshot()
+        stats["circuit_breaker"] = self.breaker.snapshot()
+        return stats
+    
+    def _iter_sse_deltas(self, lines: Iterable[bytes], call: Dict[str, Any]) -> Iterator[str]:
+        """解析SSE响应行，产出其中的文本增量"""
+        for raw_line in lines:
+            payload = self._parse_sse_line(raw_line)
+            if payload is None:
+                continue
+            if payload == "[DONE]":
+                break
+            
+            delta = self._handle_stream_chunk(payload, call)
+            if delta:
+                yield delta
+    
+    def _parse_sse_line(self, raw_line) -> Optional[str]:
+        """解析一行SSE数据，返回data字段内容，非数据行返回None"""
+        if not raw_line:
+            return None
+        line = raw_line.decode('utf-8') if isinstance(raw_line, bytes) else raw_line
+        if not line.startswith("data:"):
+            return None
+        return line[len("data:"):].strip()
+    
+    def _handle_stream_chunk(self, payload: str, call: Dict[str, Any]) -> Optional[str]:
+        """处理一个流式数据块：记录其中的usage和首个增量的到达时间，返回文本增量"""
+        chunk = json.loads(payload)
+        if chunk.get("usage"):
+            call["usage"] = chunk["usage"]
+        choices = chunk.get("choices") or []
+        if not choices:
+            return None
+        delta = choices[0].get("delta", {}).get("content")
+        if delta:
+            self.metrics.mark_first_byte(call)
+        return delta
+    
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """获取限制异步并发请求数的信号量"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore_loop = loop
+            self._semaphore = asyncio.Semaphore(Config.DEEPSEEK_MAX_CONCURRENCY)
+        return self._semaphore
+    
+    async def chat_async(self, message: str, history: List[Dict[str, str]] = None,
+                         custom_prompt: Optional[str] = None,
+                         temperature: float = 0.7,
+                         max_tokens: int = 1000,
+                         summary: Optional[str] = None,
+                         context: Optional[str] = None) -> str:
+        """
+        chat的异步版本，等待响应时不阻塞事件循环
+        
+        参数与返回值与chat相同；同时进行中的请求数受 Config.DEEPSEEK_MAX_CONCURRENCY 限制。
+        """
+        data = self._build_payload(message, history, custom_prompt,
+                                   temperature, max_tokens, stream=False,
+                                   summary=summary, context=context)
+        
+        try:
+            return await self._post_completion_async(data)
+            
+        except CircuitOpenError as e:
+            print(f"⚡ {e}")
+            return UNAVAILABLE_REPLY
+        except httpx.HTTPError as e:
             error_msg = self._mask_api_key(str(e))
             print(f"API请求错误: {error_msg}")
-            return "抱歉，我现在无法回答，请稍后再试。"
+            return UNAVAILABLE_REPLY
         except KeyError as e:
             print(f"API响应格式错误: {e}")
-            return "抱歉，响应格式有误，请稍后再试。"
+            return FORMAT_ERROR_REPLY
         except Exception as e:
             error_msg = self._mask_api_key(str(e))
             print(f"未知错误: {error_msg}")
-            return "抱歉，发生了未知错误，请稍后再试。"
+            return UNKNOWN_ERROR_REPLY
     
-    def chat_with_context(self, message: str, context: str = "", 
-                         history: List[Dict[str, str]] = None) -> str:
-        """
-        带上下文的对话，可以在prompt中加入特定上下文
+    async def chat_with_context_async(self, message: str, context: str = "",
+                                      history: List[Dict[str, str]] = None,
+                                      summary: Optional[str] = None) -> str:
+        """chat_with_context的异步版本"""
+        return await self.chat_async(message, history, summary=summary, context=context)
+    
+    async def chat_stream_async(self, message: str, history: List[Dict[str, str]] = None,
+                                custom_prompt: Optional[str] = None,
+                                temperature: float = 0.7,
+                                max_tokens: int = 1000,
+                                summary: Optional[str] = None,
+                                context: Optional[str] = None) -> AsyncIterator[str]:
+        """chat_stream的异步版本，逐段产出回复文本"""
+        data = self._build_payload(message, history, custom_prompt,
+                                   temperature, max_tokens, stream=True,
+                                   summary=summary, context=context)
         
-        Args:
-            message: 用户输入的消息
-            context: 额外的上下文信息
-            history: 对话历史记录
+        received = False
+        try:
+            async for delta in self._stream_deltas_async(data):
+                received = True
+                yield delta
             
-        Returns:
-            str: AI的回复文本
-        """
-        # 构建包含上下文的prompt
-        enhanced_prompt = Config.SYSTEM_PROMPT
-        if context:
-            enhanced_prompt += f"\n\n当前上下文：{context}\n请根据以上上下文回答用户的问题。"
-        
-        return self.chat(message, history, enhanced_prompt)
+        except CircuitOpenError as e:
+            print(f"⚡ {e}")
+            yield STREAM_INTERRUPTED_MARKER if received else UNAVAILABLE_REPLY
+        except httpx.HTTPError as e:
+            error_msg = self._mask_api_key(str(e))
+            print(f"API流式请求错误: {error_msg}")
+            yield STREAM_INTERRUPTED_MARKER if received else UNAVAILABLE_REPLY
+        except Exception as e:
+            error_msg = self._mask_api_key(str(e))
+            print(f"流式响应处理错误: {error_msg}")
+            yield STREAM_INTERRUPTED_MARKER if received else UNKNOWN_ERROR_REPLY
     
     def test_connection(self) -> bool:
         """测试API连接"""
         try:
-            response = requests.get(
-                "https://api.deepseek.com/v1/models",
+            response = self.session.get(
+                self.models_url,
                 headers=self.headers,
-                timeout=10
+                timeout=get_timeout(10)
             )
             return response.status_code == 200
         except Exception as e:
@@ -0,0 +1,94 @@
+"""
+对话历史窗口
+
+决定每次请求带上哪些历史消息。默认按 Config.MAX_HISTORY_LENGTH 条数截取；
+设置 Config.HISTORY_TOKEN_BUDGET 后改为按估算的token数从最近的消息往前装填，
+使每次请求的prompt大小与长短消息无关、保持稳定。
+
+按条数截取时，窗口起点按 Config.HISTORY_WINDOW_STEP 向前（更早的消息）对齐，只会整步向后跳，
+两次跳动之间发送的历史前缀保持不变，DeepSeek的上下文缓存可以持续命中。
+对齐只会多带上不到一个步长的较早消息，最近的 MAX_HISTORY_LENGTH 条消息总是完整保留。
+按token预算截取时预算是硬上限，窗口起点不做对齐，预算内能装下的消息全部带上。
+"""
+import re
+from typing import List, Dict, Any, Optional
+
+from config import Config
+
+# 每条消息在role、分隔符等格式上的额外开销
+MESSAGE_TOKEN_OVERHEAD = 4
+
+# 消息上缓存token估算值的字段名
+TOKEN_COUNT_KEY = "token_count"
+
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的token数
+
+    按DeepSeek官方给出的经验比例：1个中文字符约0.6个token，1个英文字符约0.3个token
+    """
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return int(cjk_count * 0.6 + other_count * 0.3) + 1
+
+
+def get_message_tokens(message: Dict[str, Any]) -> int:
+    """获取消息的token估算值，首次计算后缓存在消息上"""
+    tokens = message.get(TOKEN_COUNT_KEY)
+    if tokens is None:
+        tokens = estimate_tokens(message.get("content", "")) + MESSAGE_TOKEN_OVERHEAD
+        message[TOKEN_COUNT_KEY] = tokens
+    return tokens
+
+
+def align_window_start(start: int, step: Optional[int] = None) -> int:
+    """把窗口起点向前对齐到步长的整数倍，窗口只会变大，不会丢掉原本能带上的消息"""
+    if step is None:
+        step = Config.HISTORY_WINDOW_STEP
+    if step <= 1 or start <= 0:
+        return start
+    return start // step * step
+
+
+def select_history(history: List[Dict[str, Any]],
+                   token_budget: Optional[int] = None,
+                   max_messages: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    选出本次请求要带上的历史消息
+
+    Args:
+        history: 完整的对话历史
+        token_budget: 历史消息的token预算，为None时使用配置值，<=0表示按条数截取
+        max_messages: 按条数截取时保留的最近消息数（起点对齐时可能多带上不到一个步长的较早消息），
+                      为None时使用配置值
+
+    Returns:
+        List[Dict]: 按时间顺序排列的历史消息
+    """
+    if token_budget is None:
+        token_budget = Config.HISTORY_TOKEN_BUDGET
+    if max_messages is None:
+        max_messages = Config.MAX_HISTORY_LENGTH
+
+    if token_budget <= 0:
+        if max_messages <= 0:
+            return []
+        start = max(0, len(history) - max_messages)
+        return history[align_window_start(start):]
+
+    # 从最近的消息往前装填，直到超出预算
+    used = 0
+    start = len(history)
+    for index in range(len(history) - 1, -1, -1):
+        tokens = get_message_tokens(history[index])
+        if used + tokens > token_budget:
+            break
+        used += tokens
+        start = index
+
+    return history[start:]
@@ -0,0 +1,132 @@
+"""
+共享HTTP连接池
+
+DeepSeek、GPT-SOVITs和百度语音客户端都通过同一个requests.Session发送请求，
+稳定运行时复用已建立的TCP/TLS连接，不再为每次请求重新握手。
+异步代码路径使用同样配置的httpx.AsyncClient。
+"""
+import asyncio
+import socket
+import threading
+from typing import Dict, Optional, Tuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+from config import Config
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_async_client: Optional[httpx.AsyncClient] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """可选开启TCP keep-alive的连接池适配器"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        if Config.HTTP_TCP_KEEPALIVE:
+            kwargs["socket_options"] = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            ]
+        super().init_poolmanager(*args, **kwargs)
+
+
+def parse_host_pool_sizes(spec: str) -> Dict[str, int]:
+    """
+    解析按主机配置的连接池大小
+
+    格式: "api.deepseek.com=20,localhost:9872=4"
+    """
+    sizes = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item or "=" not in item:
+            continue
+        host, size = item.rsplit("=", 1)
+        try:
+            sizes[host.strip()] = int(size)
+        except ValueError:
+            print(f"⚠️ 忽略无效的连接池配置: {item}")
+    return sizes
+
+
+def create_session() -> requests.Session:
+    """创建挂载了连接池适配器的Session"""
+    session = requests.Session()
+
+    # 默认连接池：所有主机共用
+    default_adapter = KeepAliveAdapter(
+        pool_connections=Config.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=Config.HTTP_POOL_MAXSIZE,
+        max_retries=0
+    )
+    session.mount("http://", default_adapter)
+    session.mount("https://", default_adapter)
+
+    # 按主机覆盖连接池大小（requests按最长前缀匹配适配器）
+    for host, size in parse_host_pool_sizes(Config.HTTP_POOL_HOST_SIZES).items():
+        host_adapter = KeepAliveAdapter(pool_connections=1, pool_maxsize=size, max_retries=0)
+        session.mount(f"http://{host}", host_adapter)
+        session.mount(f"https://{host}", host_adapter)
+
+    return session
+
+
+def get_session() -> requests.Session:
+    """获取进程内共享的Session"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def get_timeout(read_timeout: Optional[float] = None) -> Tuple[float, float]:
+    """构建 (连接超时, 读取超时) 元组，读取超时默认使用配置值"""
+    if read_timeout is None:
+        read_timeout = Config.HTTP_READ_TIMEOUT
+    return (Config.HTTP_CONNECT_TIMEOUT, read_timeout)
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """获取共享的异步HTTP客户端（需在事件循环中调用，连接绑定到当前事件循环）"""
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client.is_closed or _async_client_loop is not loop:
+        _async_client_loop = loop
+        _async_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=Config.HTTP_POOL_MAXSIZE,
+                max_keepalive_connections=Config.HTTP_POOL_MAXSIZE
+            ),
+            timeout=httpx.Timeout(Config.HTTP_READ_TIMEOUT, connect=Config.HTTP_CONNECT_TIMEOUT)
+        )
+    return _async_client
+
+
+def get_async_timeout(read_timeout: Optional[float] = None) -> httpx.Timeout:
+    """构建异步客户端使用的超时配置"""
+    if read_timeout is None:
+        read_timeout = Config.HTTP_READ_TIMEOUT
+    return httpx.Timeout(read_timeout, connect=Config.HTTP_CONNECT_TIMEOUT)
+
+
+async def close_async_client():
+    """关闭共享的异步HTTP客户端"""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+def close_session():
+    """关闭共享Session，释放所有连接"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
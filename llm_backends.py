@@ -0,0 +1,215 @@
+"""
+大模型后端与路由
+
+ChatManager 通过 create_llm_client() 获得对话客户端：只配置一个后端时就是该后端本身，
+配置多个后端时是 LLMRouter。路由器对外提供与 DeepSeekClient 相同的接口，
+按各后端最近的响应延迟选择最快的一个，请求失败（或熔断）时依次切换到下一个后端。
+"""
+import random
+import threading
+import time
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator
+
+from config import Config
+from deepseek_client import DeepSeekClient
+from resilience import CircuitBreaker, CircuitOpenError
+
+# 延迟指数滑动平均的平滑系数
+LATENCY_EWMA_ALPHA = 0.3
+
+
+class OpenAICompatibleClient(DeepSeekClient):
+    """对接任意OpenAI兼容接口（如本地部署的模型服务）的客户端"""
+
+    def __init__(self, api_url: Optional[str] = None, api_key: Optional[str] = None,
+                 model: Optional[str] = None, name: str = "local"):
+        super().__init__(
+            api_url=api_url or Config.LOCAL_LLM_API_URL,
+            api_key=api_key if api_key is not None else Config.LOCAL_LLM_API_KEY,
+            model=model or Config.LOCAL_LLM_MODEL,
+            name=name
+        )
+
+
+BACKEND_FACTORIES = {
+    "deepseek": DeepSeekClient,
+    "local": OpenAICompatibleClient,
+}
+
+
+def create_backends(spec: Optional[str] = None) -> List[DeepSeekClient]:
+    """根据配置创建后端列表，如 "deepseek,local" """
+    if spec is None:
+        spec = Config.LLM_BACKENDS
+    backends = []
+    for name in spec.split(","):
+        name = name.strip().lower()
+        if not name:
+            continue
+        factory = BACKEND_FACTORIES.get(name)
+        if factory is None:
+            print(f"⚠️ 未知的大模型后端: {name}")
+            continue
+        backends.append(factory())
+    return backends
+
+
+def create_llm_client() -> DeepSeekClient:
+    """创建ChatManager使用的对话客户端"""
+    backends = create_backends()
+    if not backends:
+        print("⚠️ 未配置可用的大模型后端，使用DeepSeek")
+        return DeepSeekClient()
+    if len(backends) == 1:
+        return backends[0]
+    print(f"🔀 启用大模型路由: {', '.join(backend.name for backend in backends)}")
+    return LLMRouter(backends)
+
+
+class LLMRouter(DeepSeekClient):
+    """
+    多后端路由器
+
+    复用 DeepSeekClient 的prompt构建和错误处理，只替换底层的请求发送：
+    每次请求按延迟从低到高尝试各后端，前一个失败时切换到下一个。
+    流式请求只在还没有产出任何内容时切换，避免重复输出。
+    """
+
+    def __init__(self, backends: List[DeepSeekClient]):
+        super().__init__(name="router")
+        self.backends = backends
+        self.model = backends[0].model
+        self._lock = threading.Lock()
+        # (后端名, 是否流式) -> 延迟的指数滑动平均（秒）；流式记录首个增量的时间
+        self._latency_ewma: Dict[tuple, float] = {}
+
+    def _ordered_backends(self, stream: bool) -> List[DeepSeekClient]:
+        """按当前延迟估计排序后端，熔断中的后端排在最后"""
+        with self._lock:
+            estimates = {backend.name: self._latency_ewma.get((backend.name, stream))
+                         for backend in self.backends}
+
+        # 没有延迟数据的后端优先尝试一次，以便获得估计
+        def sort_key(backend):
+            estimate = estimates[backend.name]
+            return (backend.breaker.state == CircuitBreaker.OPEN,
+                    estimate is not None,
+                    estimate or 0.0)
+
+        ordered = sorted(self.backends, key=sort_key)
+        # 偶尔先尝试其他后端，避免一直使用过时的延迟估计
+        if len(ordered) > 1 and random.random() < Config.LLM_ROUTER_EXPLORE_RATE:
+            candidate = random.choice(ordered[1:])
+            if candidate.breaker.state != CircuitBreaker.OPEN:
+                ordered.remove(candidate)
+                ordered.insert(0, candidate)
+        return ordered
+
+    def _observe_latency(self, backend: DeepSeekClient, stream: bool, seconds: float):
+        key = (backend.name, stream)
+        with self._lock:
+            previous = self._latency_ewma.get(key)
+            if previous is None:
+                self._latency_ewma[key] = seconds
+            else:
+                self._latency_ewma[key] = LATENCY_EWMA_ALPHA * seconds + (1 - LATENCY_EWMA_ALPHA) * previous
+
+    def _report_failover(self, backend: DeepSeekClient, stream: bool, error: Exception):
+        """失败按读超时计入延迟估计，使出错的后端排到后面"""
+        self._observe_latency(backend, stream, float(Config.HTTP_READ_TIMEOUT))
+        print(f"🔀 后端 {backend.name} 请求失败，尝试下一个后端: {backend._mask_api_key(str(error))}")
+
+    def _post_completion(self, data: Dict[str, Any]) -> str:
+        last_error: Optional[Exception] = None
+        for backend in self._ordered_backends(stream=False):
+            started = time.perf_counter()
+            try:
+                result = backend._post_completion(dict(data, model=backend.model))
+            except Exception as e:
+                last_error = e
+                self._report_failover(backend, False, e)
+                continue
+            self._observe_latency(backend, False, time.perf_counter() - started)
+            return result
+        raise last_error or CircuitOpenError("没有可用的大模型后端")
+
+    async def _post_completion_async(self, data: Dict[str, Any]) -> str:
+        last_error: Optional[Exception] = None
+        for backend in self._ordered_backends(stream=False):
+            started = time.perf_counter()
+            try:
+                result = await backend._post_completion_async(dict(data, model=backend.model))
+            except Exception as e:
+                last_error = e
+                self._report_failover(backend, False, e)
+                continue
+            self._observe_latency(backend, False, time.perf_counter() - started)
+            return result
+        raise last_error or CircuitOpenError("没有可用的大模型后端")
+
+    def _stream_deltas(self, data: Dict[str, Any]) -> Iterator[str]:
+        last_error: Optional[Exception] = None
+        for backend in self._ordered_backends(stream=True):
+            started = time.perf_counter()
+            received = False
+            try:
+                for delta in backend._stream_deltas(dict(data, model=backend.model)):
+                    if not received:
+                        received = True
+                        self._observe_latency(backend, True, time.perf_counter() - started)
+                    yield delta
+                return
+            except Exception as e:
+                if received:
+                    raise
+                last_error = e
+                self._report_failover(backend, True, e)
+        raise last_error or CircuitOpenError("没有可用的大模型后端")
+
+    async def _stream_deltas_async(self, data: Dict[str, Any]) -> AsyncIterator[str]:
+        last_error: Optional[Exception] = None
+        for backend in self._ordered_backends(stream=True):
+            started = time.perf_counter()
+            received = False
+            try:
+                async for delta in backend._stream_deltas_async(dict(data, model=backend.model)):
+                    if not received:
+                        received = True
+                        self._observe_latency(backend, True, time.perf_counter() - started)
+                    yield delta
+                return
+            except Exception as e:
+                if received:
+                    raise
+                last_error = e
+                self._report_failover(backend, True, e)
+        raise last_error or CircuitOpenError("没有可用的大模型后端")
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """汇总各后端的上下文缓存命中统计"""
+        hit = 0
+        miss = 0
+        for backend in self.backends:
+            stats = backend.get_cache_stats()
+            hit += stats["hit_tokens"]
+            miss += stats["miss_tokens"]
+        total = hit + miss
+        return {
+            "hit_tokens": hit,
+            "miss_tokens": miss,
+            "hit_rate": round(hit / total, 4) if total else 0.0
+        }
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """各后端的统计以及路由使用的延迟估计"""
+        with self._lock:
+            estimates = {f"{name}{'(stream)' if stream else ''}": round(value * 1000, 1)
+                         for (name, stream), value in self._latency_ewma.items()}
+        return {
+            "backends": {backend.name: backend.get_metrics() for backend in self.backends},
+            "routing_latency_ms": estimates
+        }
+
+    def test_connection(self) -> bool:
+        """任意一个后端可用即视为连接正常"""
+        return any(backend.test_connection() for backend in self.backends)
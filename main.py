@@ -1,7 +1,7 @@
 import asyncio
 import uvicorn
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, UploadFile, File
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, UploadFile, File, Request
+from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 import json
@@ -11,6 +11,11 @@ from chat_manager import ChatManager
 from config import Config
 import time
 from baidu_speech import BaiduSpeechRecognition
+from audio_utils import wav_header
+from audio_encoding import negotiate_format, encode_audio, media_type_for
+from tts_scheduler import TTSQueueFull
+from tts_pipeline import is_part_filename
+from http_pool import close_async_client, close_session
 
 # 创建FastAPI应用
 app = FastAPI(title="爱莉希雅的闺房", description="与爱莉希雅一起度过美好时光的AI对话系统")
@@ -25,7 +30,25 @@ app.add_middleware(
 )
 
 # 创建聊天管理器实例
-chat_manager = ChatManager()
+# 进程内推理的工作进程（spawn）会以 __mp_main__ 的名字重新导入本文件，工作进程中不需要聊天管理器
+chat_manager = ChatManager() if __name__ != "__mp_main__" else None
+
+@app.on_event("startup")
+async def warm_up_tts():
+    """服务启动后再启动需要常驻进程的TTS后端"""
+    await asyncio.get_running_loop().run_in_executor(None, chat_manager.tts_client.warm_up)
+
+@app.on_event("shutdown")
+def flush_tts_cache():
+    """退出前写入语音缓存索引中尚未保存的最近使用时间"""
+    if chat_manager.tts_client.cache:
+        chat_manager.tts_client.cache.flush()
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    """退出前关闭共享的HTTP连接池"""
+    await close_async_client()
+    close_session()
 
 # 挂载静态文件目录
 if os.path.exists("static"):
@@ -1010,6 +1033,96 @@ async def root():
                 console.log('✅ 思考指示器已添加');
             }
 
+            function updateTypingIndicator(text) {
+                const typingIndicator = document.getElementById('typingIndicator');
+                if (typingIndicator) {
+                    typingIndicator.textContent = text;
+                    const container = document.getElementById('chatContainer');
+                    container.scrollTop = container.scrollHeight;
+                }
+            }
+
+            // 流式请求聊天接口，边接收边显示文本，返回最终结果
+            async function streamChat(text) {
+                const response = await fetch('/chat/stream', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                    },
+                    body: JSON.stringify({
+                        message: text,
+                        generate_audio: audioEnabled
+                    })
+                });
+
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                let streamedText = '';
+                let streamedAudio = false;
+                let result = null;
+
+                while (true) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+
+                    buffer += decoder.decode(value, { stream: true });
+                    const events = buffer.split('\\n\\n');
+                    buffer = events.pop();
+
+                    for (const event of events) {
+                        if (!event.startsWith('data: ')) continue;
+                        const data = JSON.parse(event.slice(6));
+                        if (data.type === 'delta') {
+                            streamedText += data.content;
+                            updateTypingIndicator(streamedText);
+                        } else if (data.type === 'audio_chunk') {
+                            // 分句合成的音频片段，到达后依次播放
+                            if (audioEnabled) {
+                                enqueueAudioChunk(data.audio_path);
+                                streamedAudio = true;
+                            }
+                        } else if (data.type === 'done') {
+                            result = data;
+                        }
+                    }
+                }
+
+                if (result) {
+                    result.streamed_audio = streamedAudio;
+                }
+                return result || { success: false };
+            }
+
+            // 分句音频片段的播放队列
+            let audioChunkQueue = [];
+            let audioChunkPlaying = false;
+
+            function enqueueAudioChunk(audioPath) {
+                audioChunkQueue.push(audioPath);
+                if (!audioChunkPlaying) {
+                    playNextAudioChunk();
+                }
+            }
+
+            function playNextAudioChunk() {
+                if (audioChunkQueue.length === 0) {
+                    audioChunkPlaying = false;
+                    return;
+                }
+                audioChunkPlaying = true;
+                const audio = new Audio('/audio/' + audioChunkQueue.shift());
+                if (currentAudio) {
+                    currentAudio.pause();
+                }
+                currentAudio = audio;
+                audio.addEventListener('ended', playNextAudioChunk);
+                audio.play().catch(error => {
+                    console.log('音频片段播放失败:', error);
+                    playNextAudioChunk();
+                });
+            }
+
             function hideTypingIndicator() {
                 const typingIndicator = document.getElementById('typingIndicator');
                 if (typingIndicator) {
@@ -1029,7 +1142,7 @@ async def root():
             }
 
             // 修改addMessageWithAudio函数，添加文件验证
-            async function addMessageWithAudioVerified(text, audioPath, actualIndex = null) {
+            async function addMessageWithAudioVerified(text, audioPath, actualIndex = null, autoplay = true) {
                 const container = document.getElementById('chatContainer');
                 
                 // 创建消息容器
@@ -1062,17 +1175,19 @@ async def root():
                     const audio = new Audio('/audio/' + audioPath);
                     let isPlaying = false;
                     
-                    // 自动播放音频
-                    if (currentAudio) {
-                        currentAudio.pause();
+                    // 自动播放音频（分句片段已经播放过时跳过）
+                    if (autoplay) {
+                        if (currentAudio) {
+                            currentAudio.pause();
+                        }
+                        currentAudio = audio;
+                        audio.play().catch(error => {
+                            console.log('音频自动播放失败:', error);
+                        });
+                        playButton.innerHTML = '⏸️';
+                        playButton.title = '暂停音频';
+                        isPlaying = true;
                     }
-                    currentAudio = audio;
-                    audio.play().catch(error => {
-                        console.log('音频自动播放失败:', error);
-                    });
-                    playButton.innerHTML = '⏸️';
-                    playButton.title = '暂停音频';
-                    isPlaying = true;
                     
                     playButton.onclick = () => {
                         if (isPlaying) {
@@ -1334,19 +1449,8 @@ async def root():
                     // 显示思考指示器
                     showTypingIndicator();
                     
-                    // 发送到聊天API
-                    const response = await fetch('/chat', {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json',
-                        },
-                        body: JSON.stringify({
-                            message: text,
-                            generate_audio: audioEnabled
-                        })
-                    });
-                    
-                    const result = await response.json();
+                    // 发送到流式聊天API
+                    const result = await streamChat(text);
                     console.log('🎯 收到DeepSeek响应:', result);
                     
                     // 隐藏思考指示器
@@ -1355,7 +1459,7 @@ async def root():
                     if (result.success) {
                         if (result.audio_path && audioEnabled) {
                             console.log('🎯 准备添加带音频的消息:', result.audio_path);
-                            await addMessageWithAudioVerified(result.text_response, result.audio_path);
+                            await addMessageWithAudioVerified(result.text_response, result.audio_path, null, !result.streamed_audio);
                         } else {
                             addMessage(result.text_response, 'ai');
                         }
@@ -1393,18 +1497,7 @@ async def root():
                 showTypingIndicator();
                 
                 try {
-                    const response = await fetch('/chat', {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json',
-                        },
-                        body: JSON.stringify({
-                            message: message,
-                            generate_audio: audioEnabled
-                        })
-                    });
-                    
-                    const result = await response.json();
+                    const result = await streamChat(message);
                     console.log('🎯 收到服务器响应:', result);
                     
                     // 隐藏思考指示器
@@ -1413,7 +1506,7 @@ async def root():
                     if (result.success) {
                         if (result.audio_path && audioEnabled) {
                             console.log('🎯 准备添加带音频的消息:', result.audio_path);
-                            await addMessageWithAudioVerified(result.text_response, result.audio_path);
+                            await addMessageWithAudioVerified(result.text_response, result.audio_path, null, !result.streamed_audio);
                         } else {
                             addMessage(result.text_response, 'ai');
                         }
@@ -2000,9 +2093,25 @@ async def chat_endpoint(request: Dict[str, Any]):
     else:
         print("💬 处理普通聊天消息")
         # 处理普通聊天消息
-        result = chat_manager.process_message(message)
+        result = await chat_manager.process_message_async(message)
         return result
 
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: Dict[str, Any]):
+    """流式处理聊天请求（SSE），边生成边返回文本增量"""
+    message = request.get("message", "")
+    
+    print(f"🎯 收到流式聊天请求: message长度={len(message)}")
+    
+    if not message:
+        raise HTTPException(status_code=400, detail="消息不能为空")
+    
+    async def event_source():
+        async for event in chat_manager.process_message_stream_async(message):
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(event_source(), media_type="text/event-stream")
+
 @app.post("/clear-history")
 async def clear_history():
     """清空对话历史"""
@@ -2013,6 +2122,55 @@ async def get_status():
     """获取系统状态"""
     return chat_manager.get_status()
 
+@app.get("/stats/llm")
+async def get_llm_stats():
+    """获取大模型调用的用量和延迟统计"""
+    return chat_manager.get_llm_stats()
+
+@app.post("/tts/stream")
+async def tts_stream_endpoint(request: Dict[str, Any]):
+    """流式合成语音，边合成边返回WAV音频（长度未知的WAV流）"""
+    text = request.get("text", "")
+    if not text:
+        raise HTTPException(status_code=400, detail="文本不能为空")
+    
+    # 经过调度器排队取得合成名额（可能等待），发起上游请求也是阻塞操作，放到线程池中执行
+    try:
+        stream = await asyncio.get_running_loop().run_in_executor(
+            None, chat_manager.tts_scheduler.stream, text)
+    except TTSQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    # 先取得第一块PCM再返回响应：合成失败时返回错误，而不是空的200
+    chunks = iter(stream)
+    first = await asyncio.get_running_loop().run_in_executor(None, next, chunks, None)
+    if first is None:
+        raise HTTPException(status_code=503, detail="语音合成失败")
+    
+    def audio_source():
+        yield wav_header(stream.channels, stream.sample_width, stream.sample_rate)
+        yield first
+        yield from chunks
+    
+    # 同步生成器由StreamingResponse在线程池中迭代
+    return StreamingResponse(audio_source(), media_type="audio/wav")
+
+@app.post("/tts/refresh")
+async def refresh_tts_backend():
+    """重新检测TTS调用方式（更换模型或启动TTS服务后调用）"""
+    return chat_manager.refresh_tts_backend()
+
+@app.post("/tts/voice")
+async def set_tts_voice(request: Dict[str, Any]):
+    """更换参考音色（参考音频路径、参考文本和语言），并向TTS服务重新登记"""
+    ref_audio_path = request.get("ref_audio_path")
+    if not ref_audio_path:
+        raise HTTPException(status_code=400, detail="参考音频路径不能为空")
+    # 上传参考音频是阻塞操作，放到线程池中执行
+    return await asyncio.get_running_loop().run_in_executor(
+        None, chat_manager.set_voice_profile, ref_audio_path,
+        request.get("prompt_text", ""), request.get("prompt_lang", "中文"))
+
 @app.get("/history")
 async def get_history_list():
     """获取历史记录列表"""
@@ -2042,14 +2200,25 @@ async def delete_history_by_date(date: str):
     }
 
 @app.get("/audio/{filename}")
-async def get_audio(filename: str):
-    """获取音频文件"""
+async def get_audio(filename: str, request: Request):
+    """获取音频文件，WAV文件按Accept头返回客户端支持的压缩格式"""
     audio_path = os.path.join(Config.AUDIO_OUTPUT_PATH, filename)
-    if os.path.exists(audio_path):
-        return FileResponse(audio_path, media_type="audio/wav")
-    else:
+    if not os.path.exists(audio_path):
         raise HTTPException(status_code=404, detail="音频文件不存在")
 
+    # 返回的格式随Accept头变化，告知缓存按Accept区分
+    headers = {"Vary": "Accept"}
+    # 分句合成的片段要尽快开始播放，直接返回WAV，不等待编码
+    if filename.lower().endswith(".wav") and not is_part_filename(filename):
+        audio_format = negotiate_format(request.headers.get("accept"))
+        if audio_format != "wav":
+            # 副本还没生成时在线程池中编码，失败时退回WAV
+            loop = asyncio.get_running_loop()
+            encoded_path = await loop.run_in_executor(None, encode_audio, audio_path, audio_format)
+            if encoded_path:
+                return FileResponse(encoded_path, media_type=media_type_for(encoded_path), headers=headers)
+    return FileResponse(audio_path, media_type=media_type_for(audio_path), headers=headers)
+
 @app.head("/audio/{filename}")
 async def head_audio(filename: str):
     """检查音频文件是否存在（HEAD请求）"""
@@ -2121,7 +2290,7 @@ async def websocket_endpoint(websocket: WebSocket):
             message_data = json.loads(data)
             
             # 处理消息
-            result = chat_manager.process_message(message_data.get("message", ""))
+            result = await chat_manager.process_message_async(message_data.get("message", ""))
             
             # 发送回复
             await websocket.send_text(json.dumps(result))
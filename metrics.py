@@ -0,0 +1,136 @@
+"""
+进程内指标统计
+
+RollingWindow 保留最近N个样本并计算分位数；LLMMetrics 汇总每次大模型调用的
+token用量、首字节时间、总耗时和HTTP状态，用于观察延迟和token花费的去向。
+"""
+import math
+import threading
+import time
+from collections import deque, Counter
+from typing import Dict, Any, Optional
+
+from config import Config
+
+
+class RollingWindow:
+    """保留最近 maxlen 个数值样本的滑动窗口"""
+
+    def __init__(self, maxlen: int):
+        self.samples = deque(maxlen=maxlen)
+
+    def add(self, value: float):
+        self.samples.append(value)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """按最近秩法计算第p百分位数，没有样本时返回None"""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = max(0, min(len(ordered) - 1, math.ceil(p / 100.0 * len(ordered)) - 1))
+        return ordered[index]
+
+    def summary(self) -> Dict[str, Any]:
+        """窗口内样本的数量、均值和常用分位数"""
+        if not self.samples:
+            return {"count": 0}
+        count = len(self.samples)
+        return {
+            "count": count,
+            "avg": round(sum(self.samples) / count, 1),
+            "p50": round(self.percentile(50), 1),
+            "p90": round(self.percentile(90), 1),
+            "p95": round(self.percentile(95), 1),
+            "p99": round(self.percentile(99), 1),
+            "max": round(max(self.samples), 1)
+        }
+
+
+class LLMMetrics:
+    """大模型调用的用量和延迟统计（线程安全）"""
+
+    def __init__(self, window_size: Optional[int] = None):
+        if window_size is None:
+            window_size = Config.METRICS_WINDOW_SIZE
+        self._lock = threading.Lock()
+        self.latency_ms = RollingWindow(window_size)
+        self.ttfb_ms = RollingWindow(window_size)
+        self.recent_calls = deque(maxlen=20)
+        self.status_counts = Counter()
+        self.totals = {
+            "calls": 0,
+            "errors": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cache_hit_tokens": 0,
+            "cache_miss_tokens": 0
+        }
+
+    def start_call(self, stream: bool = False) -> Dict[str, Any]:
+        """开始记录一次调用，返回的字典在调用过程中逐步填写"""
+        return {
+            "start": time.perf_counter(),
+            "stream": stream,
+            "status": None,
+            "ttfb": None,
+            "usage": None,
+            "error": None
+        }
+
+    def mark_first_byte(self, call: Dict[str, Any]):
+        """记录首字节（流式请求为首个文本增量）到达的时间"""
+        if call["ttfb"] is None:
+            call["ttfb"] = time.perf_counter() - call["start"]
+
+    def finish_call(self, call: Dict[str, Any]):
+        """结束一次调用并计入统计"""
+        latency = time.perf_counter() - call["start"]
+        usage = call["usage"] or {}
+
+        with self._lock:
+            self.totals["calls"] += 1
+            if call["error"]:
+                self.totals["errors"] += 1
+            self.totals["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            self.totals["completion_tokens"] += usage.get("completion_tokens", 0)
+            self.totals["cache_hit_tokens"] += usage.get("prompt_cache_hit_tokens", 0)
+            self.totals["cache_miss_tokens"] += usage.get("prompt_cache_miss_tokens", 0)
+            self.status_counts[str(call["status"]) if call["status"] else "none"] += 1
+
+            self.latency_ms.add(latency * 1000)
+            if call["ttfb"] is not None:
+                self.ttfb_ms.add(call["ttfb"] * 1000)
+
+            self.recent_calls.append({
+                "time": int(time.time()),
+                "stream": call["stream"],
+                "status": call["status"],
+                "ttfb_ms": round(call["ttfb"] * 1000, 1) if call["ttfb"] is not None else None,
+                "latency_ms": round(latency * 1000, 1),
+                "prompt_tokens": usage.get("prompt_tokens"),
+                "completion_tokens": usage.get("completion_tokens"),
+                "error": call["error"]
+            })
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """上下文缓存命中统计"""
+        with self._lock:
+            hit = self.totals["cache_hit_tokens"]
+            miss = self.totals["cache_miss_tokens"]
+        total = hit + miss
+        return {
+            "hit_tokens": hit,
+            "miss_tokens": miss,
+            "hit_rate": round(hit / total, 4) if total else 0.0
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前统计的快照"""
+        with self._lock:
+            return {
+                "totals": dict(self.totals),
+                "latency_ms": self.latency_ms.summary(),
+                "ttfb_ms": self.ttfb_ms.summary(),
+                "status_counts": dict(self.status_counts),
+                "recent_calls": list(self.recent_calls)
+            }
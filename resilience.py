@@ -0,0 +1,133 @@
+"""
+上游调用的重试与熔断
+
+可重试的错误（连接失败、超时、429、5xx）按带抖动的指数退避重试；
+熔断器统计最近调用的失败率，过高时直接快速失败，冷却后放行一个探测请求（半开状态），
+探测成功才恢复正常，避免上游故障期间每个请求都等满超时时间。
+"""
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Optional
+
+import httpx
+import requests
+
+from config import Config
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str,
+                 failure_rate: Optional[float] = None,
+                 min_calls: Optional[int] = None,
+                 window_size: Optional[int] = None,
+                 cooldown: Optional[float] = None):
+        self.name = name
+        self.failure_rate = failure_rate if failure_rate is not None else Config.CIRCUIT_BREAKER_FAILURE_RATE
+        self.min_calls = min_calls if min_calls is not None else Config.CIRCUIT_BREAKER_MIN_CALLS
+        self.cooldown = cooldown if cooldown is not None else Config.CIRCUIT_BREAKER_COOLDOWN
+        window_size = window_size if window_size is not None else Config.CIRCUIT_BREAKER_WINDOW
+
+        self._lock = threading.Lock()
+        self._results = deque(maxlen=window_size)  # True表示失败
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow_request(self) -> bool:
+        """判断当前是否放行请求；冷却结束后只放行一个半开探测请求"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            # 半开状态
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                print(f"✅ 熔断器 {self.name} 探测成功，恢复正常")
+                self._state = self.CLOSED
+                self._results.clear()
+                self._probe_in_flight = False
+            self._results.append(False)
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                print(f"⚠️ 熔断器 {self.name} 探测失败，继续熔断")
+                self._trip()
+                return
+            self._results.append(True)
+            if self._state == self.CLOSED and len(self._results) >= self.min_calls:
+                failures = sum(self._results)
+                if failures / len(self._results) >= self.failure_rate:
+                    print(f"🚨 熔断器 {self.name} 打开: 最近 {len(self._results)} 次调用失败 {failures} 次")
+                    self._trip()
+
+    def _trip(self):
+        """进入打开状态（调用方需持有锁）"""
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            failures = sum(self._results)
+            return {
+                "state": self._state,
+                "recent_calls": len(self._results),
+                "recent_failures": failures,
+                "retry_in_seconds": round(max(0.0, self.cooldown - (time.monotonic() - self._opened_at)), 1)
+                if self._state == self.OPEN else 0.0
+            }
+
+
+def backoff_delay(attempt: int,
+                  base_delay: Optional[float] = None,
+                  max_delay: Optional[float] = None) -> float:
+    """第attempt次重试前的等待时间（full jitter指数退避）"""
+    if base_delay is None:
+        base_delay = Config.DEEPSEEK_RETRY_BASE_DELAY
+    if max_delay is None:
+        max_delay = Config.DEEPSEEK_RETRY_MAX_DELAY
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def is_retryable_status(status_code: Optional[int]) -> bool:
+    """限流和服务端错误值得重试"""
+    return status_code == 429 or (status_code is not None and status_code >= 500)
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """判断异常是否属于上游暂时不可用、值得重试的错误"""
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return is_retryable_status(error.response.status_code)
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return is_retryable_status(error.response.status_code)
+    return False
@@ -0,0 +1,80 @@
+"""
+回复缓存
+
+用户经常重复同样的开场白（"你好"、"早上好"），测试也会重放相同的输入。
+开启后，系统prompt、上下文、温度、上一轮问答和当前消息都相同的请求直接返回
+之前的回复文本和已经合成好的音频文件，省去一次大模型调用和一次语音合成。
+更早的历史和摘要不参与比较，否则历史每轮都在增长，缓存几乎不会命中。
+条目超过有效期后失效，超过容量时淘汰最久未使用的条目。
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from config import Config
+
+
+class ResponseCache:
+    """带有效期的LRU回复缓存（线程安全）"""
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_entries = max_entries if max_entries is not None else Config.RESPONSE_CACHE_MAX_ENTRIES
+        self.ttl = ttl if ttl is not None else Config.RESPONSE_CACHE_TTL
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        查找缓存的回复
+
+        Returns:
+            Dict: {"text_response", "audio_file"}，未命中、已过期或音频文件已不存在时返回None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry["created_at"] > self.ttl:
+                del self._entries[key]
+                entry = None
+            # 音频文件被清理后，缓存的回复也不再完整
+            if entry is not None and entry["audio_file"] and not os.path.exists(
+                    os.path.join(Config.AUDIO_OUTPUT_PATH, entry["audio_file"])):
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return {"text_response": entry["text_response"], "audio_file": entry["audio_file"]}
+
+    def put(self, key: str, text_response: str, audio_file: Optional[str]):
+        """缓存一次回复，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            self._entries[key] = {
+                "text_response": text_response,
+                "audio_file": audio_file,
+                "created_at": time.time()
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """缓存条目数和命中率"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
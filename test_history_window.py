@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试历史窗口的选取（python -m unittest test_history_window）
+"""
+
+import unittest
+from unittest import mock
+
+from config import Config
+from history_window import align_window_start, select_history, get_message_tokens
+
+
+def make_history(count, content="你好，今天过得怎么样？"):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"{content}{i}"} for i in range(count)]
+
+
+class AlignWindowStartTest(unittest.TestCase):
+    def test_rounds_down(self):
+        self.assertEqual(align_window_start(5, 4), 4)
+        self.assertEqual(align_window_start(8, 4), 8)
+        self.assertEqual(align_window_start(3, 4), 0)
+
+    def test_step_one_keeps_start(self):
+        self.assertEqual(align_window_start(7, 1), 7)
+
+
+@mock.patch.object(Config, "HISTORY_WINDOW_STEP", 4)
+class CountModeTest(unittest.TestCase):
+    def test_never_fewer_than_max_messages(self):
+        for length in range(0, 40):
+            history = make_history(length)
+            window = select_history(history, token_budget=0, max_messages=10)
+            self.assertGreaterEqual(len(window), min(length, 10))
+            # 对齐最多多带上不到一个步长的消息
+            self.assertLess(len(window), min(length, 10) + 4)
+            self.assertEqual(window, history[len(history) - len(window):])
+
+    def test_prefix_stable_between_steps(self):
+        history = make_history(14)
+        first = select_history(history, token_budget=0, max_messages=10)
+        history += make_history(1)
+        second = select_history(history, token_budget=0, max_messages=10)
+        self.assertIs(first[0], second[0])
+
+    def test_zero_max_messages(self):
+        self.assertEqual(select_history(make_history(5), token_budget=0, max_messages=0), [])
+
+
+@mock.patch.object(Config, "HISTORY_WINDOW_STEP", 4)
+class TokenBudgetModeTest(unittest.TestCase):
+    def test_fills_budget_without_exceeding(self):
+        history = make_history(30)
+        per_message = get_message_tokens(history[-1])
+        for budget in (per_message, per_message * 3 + 1, per_message * 7):
+            window = select_history(history, token_budget=budget)
+            used = sum(get_message_tokens(message) for message in window)
+            self.assertLessEqual(used, budget)
+            # 再往前多带一条就会超出预算
+            previous = history[len(history) - len(window) - 1]
+            self.assertGreater(used + get_message_tokens(previous), budget)
+
+    def test_single_message_budget_is_not_empty(self):
+        history = make_history(9)
+        budget = get_message_tokens(history[-1])
+        self.assertEqual(select_history(history, token_budget=budget), history[-1:])
+
+
+if __name__ == "__main__":
+    unittest.main()
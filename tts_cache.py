@@ -0,0 +1,193 @@
+"""
+语音合成结果缓存
+
+同样的文本用同样的音色和参数合成，得到的音频可以直接复用。缓存键是
+（文本、参考音色、合成参数）的哈希，音频按哈希命名保存在输出目录下的缓存子目录中，
+索引文件记录每个条目的大小和最近使用时间，服务重启后仍然有效。
+
+缓存只保存自己的一份副本（同一文件系统上是硬链接，不额外占用空间）：
+登记时把新合成的音频链接进缓存目录，命中时再链接到调用方要求的输出文件名。
+对话记录引用的始终是输出目录中的文件，淘汰缓存中的副本不会删掉对话记录里的音频。
+
+大小上限只统计缓存独占的磁盘空间：与输出目录中的文件互为硬链接的副本不额外占用空间，
+淘汰它也腾不出空间，所以不计入；对应的对话音频被删除后（或不能硬链接而复制时）才计入。
+超过上限时按最近最少使用的顺序淘汰这些独占的副本。输出目录本身的大小不受这个上限约束。
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Any, Optional
+
+from config import Config
+
+CACHE_DIRNAME = "tts_cache"
+INDEX_FILENAME = "tts_cache_index.json"
+# 命中缓存只更新内存中的最近使用时间，索引文件最多每隔这么多秒写一次
+INDEX_SAVE_INTERVAL = 30
+
+
+def make_cache_key(text: str, params: Dict[str, Any]) -> str:
+    """根据文本和影响合成结果的全部参数计算缓存键"""
+    raw = json.dumps({"text": text, "params": params}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """按内容寻址的磁盘音频缓存（线程安全）"""
+
+    def __init__(self, output_path: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.output_path = output_path or Config.AUDIO_OUTPUT_PATH
+        self.cache_dir = os.path.join(self.output_path, CACHE_DIRNAME)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.max_bytes = max_bytes if max_bytes is not None else Config.TTS_CACHE_MAX_MB * 1024 * 1024
+        self.index_path = os.path.join(self.cache_dir, INDEX_FILENAME)
+        self._lock = threading.Lock()
+        # 缓存键 -> {"file", "size", "last_used"}
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._last_save = 0.0
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self._load_index()
+
+    def cache_filename(self, key: str) -> str:
+        return f"tts_{key[:32]}.wav"
+
+    def get(self, key: str, output_path: str) -> Optional[str]:
+        """
+        命中时把缓存的音频链接（或复制）到output_path并更新最近使用时间
+
+        Returns:
+            str: 命中时为output_path，未命中时为None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                path = os.path.join(self.cache_dir, entry["file"])
+                if os.path.exists(path):
+                    _link_or_copy(path, output_path)
+                    entry["last_used"] = time.time()
+                    self.hits += 1
+                    self._dirty = True
+                    if time.time() - self._last_save >= INDEX_SAVE_INTERVAL:
+                        self._save_index()
+                    return output_path
+                # 文件已被手动删除
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, audio_path: str):
+        """把新合成的音频链接（或复制）到缓存目录中按哈希命名的位置并登记，原文件保持不变"""
+        filename = self.cache_filename(key)
+        cached_path = os.path.join(self.cache_dir, filename)
+        with self._lock:
+            _link_or_copy(audio_path, cached_path)
+            self._entries[key] = {
+                "file": filename,
+                "size": os.path.getsize(cached_path),
+                "last_used": time.time()
+            }
+            self._evict(keep=key)
+            self._save_index()
+
+    def _evict(self, keep: str):
+        """缓存独占的空间超过大小上限时，按最近最少使用的顺序删除独占的副本（调用方需持有锁）"""
+        if self.max_bytes <= 0:
+            return
+        owned = self._owned_sizes()
+        total = sum(owned.values())
+        if total <= self.max_bytes:
+            return
+
+        for key, entry in sorted(self._entries.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep or key not in owned:
+                continue
+            try:
+                os.remove(os.path.join(self.cache_dir, entry["file"]))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"⚠️ 删除缓存音频失败 {entry['file']}: {e}")
+                continue
+            total -= owned[key]
+            del self._entries[key]
+            print(f"🧹 淘汰缓存音频: {entry['file']}")
+
+    def _owned_sizes(self) -> Dict[str, int]:
+        """只被缓存引用（硬链接数为1）的条目及其大小，与其他文件共享数据的条目不占用额外空间"""
+        sizes = {}
+        for key, entry in self._entries.items():
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, entry["file"]))
+            except OSError:
+                continue
+            if stat.st_nlink == 1:
+                sizes[key] = stat.st_size
+        return sizes
+
+    def _load_index(self):
+        """加载索引，丢弃音频文件已不存在的条目"""
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            self._entries = {
+                key: entry for key, entry in entries.items()
+                if os.path.exists(os.path.join(self.cache_dir, entry["file"]))
+            }
+            print(f"✅ 已加载语音缓存索引: {len(self._entries)} 条")
+        except Exception as e:
+            print(f"❌ 加载语音缓存索引失败: {e}")
+            self._entries = {}
+
+    def _save_index(self):
+        """写入索引（先写临时文件再替换，避免中途崩溃留下损坏的索引）"""
+        try:
+            temp_path = self.index_path + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(temp_path, self.index_path)
+            self._last_save = time.time()
+            self._dirty = False
+        except Exception as e:
+            print(f"❌ 保存语音缓存索引失败: {e}")
+
+    def flush(self):
+        """把命中缓存后尚未写入的最近使用时间写入索引"""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(entry["size"] for entry in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+
+def _link_or_copy(src: str, dst: str):
+    """
+    让dst成为src的一份副本：同一文件系统上创建硬链接，否则复制
+
+    先写到临时文件再替换，dst已存在时不会留下不完整的文件
+    """
+    if os.path.abspath(src) == os.path.abspath(dst):
+        return
+    temp_path = f"{dst}.{threading.get_ident()}.tmp"
+    try:
+        os.link(src, temp_path)
+    except OSError:
+        shutil.copyfile(src, temp_path)
+    os.replace(temp_path, dst)
@@ -2,51 +2,428 @@ import os
 import subprocess
 import tempfile
 import json
-from typing import Optional
+import threading
+import time
+import uuid
+import wave
+from typing import Optional, Dict, Any, Iterator, Callable, List
 from config import Config
+from http_pool import get_session, get_timeout
+from tts_cache import TTSCache, make_cache_key
+from tts_workers import CLIWorkerPool, CLIWorkerUnavailable
+from tts_http import GPTSoVITSHTTP, DOWNLOAD_CHUNK_SIZE
+from audio_utils import WavStreamParser, GrowingWavFile, probe_audio
+from voice_profile import VoiceProfile
+from tts_quality import TTSQualityController
+from tts_inprocess import PythonTTSPool, has_pipeline
+from audio_processing import postprocess_file
+
+# GPT-SOVITs推理参数，顺序与WebUI /api/inference 接口的data数组一致
+DEFAULT_INFERENCE_PARAMS = {
+    "text_lang": "中文",
+    "ref_audio_path": None,
+    "aux_ref_audio_paths": [],
+    "prompt_text": "",
+    "prompt_lang": "中文",
+    "top_k": 5,
+    "top_p": 1,
+    "temperature": 1,
+    "text_split_method": "凑四句一切",
+    "batch_size": 20,
+    "speed_factor": 1.0,
+    "ref_text_free": False,
+    "split_bucket": True,
+    "fragment_interval": 0.3,
+    "seed": -1,
+    "keep_random": True,
+    "parallel_infer": True,
+    "repetition_penalty": 1.35,
+    "sample_steps": 32,
+    "super_sampling": False
+}
+
+class TTSBackend:
+    """解析出的TTS调用方式及其配置，创建后不再重复检测"""
+    PYTHON = "python"
+    CLI = "cli"
+    HTTP = "http"
+    
+    def __init__(self, kind: Optional[str], script_path: Optional[str] = None,
+                 base_url: Optional[str] = None, api_url: Optional[str] = None):
+        self.kind = kind                  # None表示没有可用的接口
+        self.script_path = script_path    # 命令行接口的脚本路径
+        self.base_url = base_url          # GPT-SOVITs HTTP服务的基础地址
+        self.api_url = api_url            # 由配置文件指定的TTS接口地址
+        self.http: Optional[GPTSoVITSHTTP] = None  # 基础地址下探测到的接口
+    
+    def describe(self) -> Dict[str, Any]:
+        info = {
+            "kind": self.kind,
+            "script_path": self.script_path,
+            "base_url": self.base_url,
+            "api_url": self.api_url
+        }
+        if self.http:
+            info.update(self.http.describe())
+        return info
+
+def new_output_filename() -> str:
+    """调用方没有指定文件名时使用的输出文件名，同一秒内的多次合成不会重名"""
+    return f"tts_output_{int(time.time())}_{uuid.uuid4().hex[:8]}.wav"
+
+def read_file_chunks(path: str) -> Iterator[bytes]:
+    """按块读取文件"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(DOWNLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+class AudioStream:
+    """
+    流式合成的音频
+    
+    迭代得到PCM数据块；指定了output_path时同时写入逐渐增长的WAV文件，
+    结束后audio_path为完整文件的路径（失败时为None）。
+    声道数、采样宽度和采样率在收到第一块PCM数据之前为None。
+    """
+    def __init__(self, source: Iterator[bytes], output_path: Optional[str] = None,
+                 audio_path: Optional[str] = None,
+                 on_complete: Optional[Callable[[str], str]] = None):
+        self.source = source
+        self.output_path = output_path
+        self.audio_path = audio_path
+        self.on_complete = on_complete
+        # 迭代结束或中途关闭时调用（调度器借此归还并发名额）
+        self.on_close: Optional[Callable[[], None]] = None
+        self.channels: Optional[int] = None
+        self.sample_width: Optional[int] = None
+        self.sample_rate: Optional[int] = None
+    
+    def __iter__(self) -> Iterator[bytes]:
+        try:
+            yield from self._iter_pcm()
+        finally:
+            if self.on_close:
+                self.on_close()
+    
+    def _iter_pcm(self) -> Iterator[bytes]:
+        parser = WavStreamParser()
+        wav_file: Optional[GrowingWavFile] = None
+        completed = False
+        try:
+            for data in self.source:
+                pcm = parser.feed(data)
+                if not pcm:
+                    continue
+                if self.channels is None:
+                    self.channels, self.sample_width, self.sample_rate = parser.params
+                    if self.output_path:
+                        wav_file = GrowingWavFile(self.output_path, *parser.params)
+                if wav_file:
+                    wav_file.append(pcm)
+                yield pcm
+            completed = True
+        except Exception as e:
+            print(f"❌ 流式合成中断: {e}")
+        finally:
+            # 上游出错或客户端中途断开（生成器被关闭）时，不完整的文件不保留
+            if wav_file and not completed:
+                wav_file.close()
+                os.remove(wav_file.path)
+                self.audio_path = None
+                wav_file = None
+        
+        if wav_file:
+            wav_file.close()
+            self.audio_path = wav_file.path
+            if self.on_complete:
+                self.audio_path = self.on_complete(wav_file.path)
 
 class TTSClient:
     def __init__(self):
         self.model_path = Config.TTS_MODEL_PATH
         self.config_path = Config.TTS_CONFIG_PATH
         self.output_path = Config.AUDIO_OUTPUT_PATH
+        self.session = get_session()
+        self.inference_params = dict(DEFAULT_INFERENCE_PARAMS)
+        # 参考音色，向TTS服务登记一次后复用服务端的路径和特征
+        self.voice_profile = VoiceProfile.from_config()
+        # 按负载调整推理参数的档位（缓存键不包含档位，只缓存正常档位合成的音频）
+        self.quality = TTSQualityController()
         
         # 确保输出目录存在
         os.makedirs(self.output_path, exist_ok=True)
+        
+        # 相同文本和参数的合成结果直接复用
+        self.cache = TTSCache(self.output_path) if Config.TTS_CACHE_ENABLED else None
+        
+        # 启动时确定TTS调用方式，模型或服务变化后调用refresh_backend重新检测。
+        # 常驻进程不在这里启动：python main.py 会导入两次应用（__main__ 和 uvicorn 的 main:app），
+        # 在构造时启动会各自带起一套工作进程；服务启动后（warm_up）或第一次合成时才启动
+        self.cli_pool: Optional[CLIWorkerPool] = None
+        self.python_pool: Optional[PythonTTSPool] = None
+        self._cli_pool_lock = threading.Lock()
+        self.backend = self.resolve_backend()
+        self._start_python_pool()
     
-    def text_to_speech(self, text: str, output_filename: Optional[str] = None) -> Optional[str]:
+    def text_to_speech(self, text: str, output_filename: Optional[str] = None,
+                       check_cache: bool = True) -> Optional[str]:
         """
         将文本转换为语音
         
         Args:
             text: 要转换的文本
             output_filename: 输出文件名（可选）
+            check_cache: 为False时不查找缓存（调用方已经查过）
             
         Returns:
-            str: 生成的音频文件路径，失败时返回None
+            str: 生成的音频文件路径，失败时返回None。命中缓存时缓存的音频同样保存为output_filename
         """
         if not output_filename:
-            import time
-            output_filename = f"tts_output_{int(time.time())}.wav"
+            output_filename = new_output_filename()
+        
+        if check_cache:
+            cached_path = self.get_cached(text, output_filename)
+            if cached_path:
+                print(f"♻️ 命中语音缓存: {os.path.basename(cached_path)}")
+                return cached_path
         
         output_path = os.path.join(self.output_path, output_filename)
+        degraded = self.quality.degraded
+        result = self._synthesize(text, output_path)
+        if result:
+            result = self._postprocess(result)
+            result = self.store_cached(text, result, degraded)
+        return result
+    
+    def _postprocess(self, audio_path: str) -> str:
+        """开启后处理时重采样并归一化响度；进程内推理已在内存中处理过"""
+        if not Config.AUDIO_POSTPROCESS_ENABLED or self.backend.kind == TTSBackend.PYTHON:
+            return audio_path
+        try:
+            return postprocess_file(audio_path)
+        except (wave.Error, EOFError, OSError, ValueError) as e:
+            # 不是PCM WAV时保留原始音频
+            print(f"⚠️ 音频后处理失败: {e}")
+            return audio_path
+    
+    def supports_batching(self) -> bool:
+        """当前TTS服务是否可能支持批量合成（见 tts_http 中的批量接口说明）"""
+        http = self.backend.http
+        return http is not None and http.batch_supported is not False
+    
+    def text_to_speech_batch(self, texts: List[str], output_filenames: List[Optional[str]],
+                             check_cache: bool = True) -> Optional[List[Optional[str]]]:
+        """
+        一次请求合成多条文本，已缓存的直接复用（check_cache为False时不查找缓存）
+        
+        Returns:
+            list: 与texts对应的音频文件路径（某条失败时为None），不支持批量合成时返回None，
+                  调用方应改为逐条调用 text_to_speech
+        """
+        http = self.backend.http
+        if http is None:
+            return None
+        output_filenames = [filename or new_output_filename() for filename in output_filenames]
+        results: List[Optional[str]] = [None] * len(texts)
+        if check_cache:
+            results = [self.get_cached(text, filename) for text, filename in zip(texts, output_filenames)]
+        pending = [index for index, path in enumerate(results) if not path]
+        if not pending:
+            return results
+        
+        output_paths = [os.path.join(self.output_path, output_filenames[index]) for index in pending]
+        degraded = self.quality.degraded
+        batch = http.synthesize_batch([texts[index] for index in pending], self._synthesis_params(), output_paths)
+        if batch is None:
+            return None
+        print(f"📦 批量合成 {len(pending)} 条文本")
+        for index, path in zip(pending, batch):
+            results[index] = self.store_cached(texts[index], self._postprocess(path), degraded) if path else None
+        return results
+    
+    def text_to_speech_stream(self, text: str, output_filename: Optional[str] = None,
+                              check_cache: bool = True) -> AudioStream:
+        """
+        流式合成语音
+        
+        GPT-SOVITs的api_v2接口支持流式合成时，边接收边产出PCM数据并写入逐渐增长的文件，
+        不必等整句合成完就能开始播放；其他接口整段合成后再按块读出。
+        
+        Args:
+            check_cache: 为False时不查找缓存（调用方已经查过）
+        """
+        if not output_filename:
+            output_filename = new_output_filename()
+        
+        if check_cache:
+            stream = self.cached_stream(text, output_filename)
+            if stream:
+                return stream
+        
+        http = self.backend.http
+        degraded = self.quality.degraded
+        params = self._synthesis_params()
+        if http and http.supports_streaming(params):
+            source = http.open_stream(text, params)
+            if source is not None:
+                return AudioStream(source, os.path.join(self.output_path, output_filename),
+                                   on_complete=lambda path: self.store_cached(text, self._postprocess(path), degraded))
         
+        # 不支持流式合成时整段合成
+        audio_path = self.text_to_speech(text, output_filename)
+        return AudioStream(read_file_chunks(audio_path) if audio_path else iter(()), audio_path=audio_path)
+    
+    def cached_stream(self, text: str, output_filename: str) -> Optional[AudioStream]:
+        """已合成过时按块读出缓存的音频（同时保存为output_filename），未命中时返回None"""
+        cached_path = self.get_cached(text, output_filename)
+        if cached_path:
+            return AudioStream(read_file_chunks(cached_path), audio_path=cached_path)
+        return None
+    
+    def cache_key(self, text: str) -> str:
+        """合成结果的缓存键：文本、TTS服务和全部推理参数（含参考音色）"""
+        params = self.voice_profile.apply(self.inference_params)
+        params["model_path"] = self.model_path
+        params["sample_rate"] = Config.SAMPLE_RATE
+        # 后处理（重采样到 SAMPLE_RATE、响度归一化）的开关和目标电平也会改变合成结果
+        params["postprocess"] = Config.AUDIO_POSTPROCESS_ENABLED
+        params["target_dbfs"] = Config.AUDIO_TARGET_DBFS
+        # 同一路径下替换了参考音频时缓存也要失效
+        params["voice"] = self.voice_profile.fingerprint() if self.voice_profile.is_set else None
+        return make_cache_key(text, params)
+    
+    def set_voice_profile(self, profile: VoiceProfile) -> Dict[str, Any]:
+        """更换参考音色，下次合成时向TTS服务重新登记"""
+        self.voice_profile = profile
+        handle = self.register_voice()
+        return {**profile.describe(), "handle": handle}
+    
+    def register_voice(self) -> Optional[str]:
+        """向TTS服务登记当前音色（已登记过的直接返回），不支持登记时返回None"""
+        http = self.backend.http
+        if http is None or not self.voice_profile.is_set:
+            return None
+        return http.register_voice(self.voice_profile, self.voice_profile.apply(self.inference_params))
+    
+    def _synthesis_params(self) -> Dict[str, Any]:
+        """发往TTS服务的推理参数：当前质量档位，参考音色使用已登记的服务端路径"""
+        return self.voice_profile.apply(self.quality.apply(self.inference_params), self.register_voice())
+    
+    def get_cached(self, text: str, output_filename: str) -> Optional[str]:
+        """查找已合成过的音频，命中时保存为输出目录中的output_filename并返回路径，未开启缓存或未命中时返回None"""
+        if self.cache is None:
+            return None
         try:
-            # 这里需要根据你的GPT-SOVITs具体实现来调用
-            # 以下是几种常见的调用方式，你需要根据实际情况调整
-            
-            # 方式1: 如果GPT-SOVITs提供了Python API
-            if self._has_python_api():
+            return self.cache.get(self.cache_key(text), os.path.join(self.output_path, output_filename))
+        except OSError as e:
+            print(f"⚠️ 读取语音缓存失败: {e}")
+            return None
+    
+    def store_cached(self, text: str, audio_path: str, degraded: bool = False) -> str:
+        """
+        把合成好的音频登记到缓存（缓存保存自己的副本），返回audio_path
+
+        Args:
+            degraded: 是否用降级的质量档位合成。缓存键不包含档位，降级合成的音频不登记，
+                      之后按正常档位命中缓存的总是高质量的音频
+        """
+        if self.cache is None or degraded:
+            return audio_path
+        try:
+            self.cache.put(self.cache_key(text), audio_path)
+        except OSError as e:
+            print(f"⚠️ 写入语音缓存失败: {e}")
+        return audio_path
+    
+    def resolve_backend(self) -> TTSBackend:
+        """
+        检测可用的TTS调用方式
+        
+        按Python API、命令行接口、HTTP API的顺序检测，并解析出调用时需要的脚本路径或接口地址
+        """
+        # 这里需要根据你的GPT-SOVITs具体实现来调用
+        # 以下是几种常见的调用方式，你需要根据实际情况调整
+        
+        # 方式1: 如果GPT-SOVITs提供了Python API
+        if self._has_python_api():
+            backend = TTSBackend(TTSBackend.PYTHON)
+        
+        # 方式2: 如果GPT-SOVITs提供了命令行接口
+        elif self._has_cli_interface():
+            backend = TTSBackend(TTSBackend.CLI, script_path=self._find_cli_script())
+        
+        # 方式3: 如果GPT-SOVITs提供了HTTP API
+        elif self._has_http_api():
+            if self.model_path.startswith('http'):
+                backend = TTSBackend(TTSBackend.HTTP, base_url=self.model_path.rstrip('/'))
+                backend.http = GPTSoVITSHTTP(backend.base_url, self.session)
+                # 在后台探测可用的接口，探测完成前的合成请求最多等待 TTS_HTTP_DISCOVERY_WAIT 秒
+                backend.http.start_discovery(self.voice_profile.apply(self.inference_params), self.voice_profile)
+            else:
+                backend = TTSBackend(TTSBackend.HTTP, api_url=self._configured_api_url())
+        
+        else:
+            print("未找到可用的TTS接口，请检查模型配置")
+            return TTSBackend(None)
+        
+        print(f"🔊 TTS调用方式: {backend.describe()}")
+        return backend
+    
+    def refresh_backend(self) -> Dict[str, Any]:
+        """重新检测TTS调用方式（更换模型或启动TTS服务后调用）"""
+        self.backend = self.resolve_backend()
+        self._start_cli_pool()
+        self._start_python_pool()
+        return self.backend.describe()
+    
+    def _start_python_pool(self):
+        """使用Python API时启动常驻的推理进程池，替换之前的进程池"""
+        if self.python_pool:
+            self.python_pool.stop()
+            self.python_pool = None
+        if self.backend.kind == TTSBackend.PYTHON:
+            self.python_pool = PythonTTSPool(self._gpt_sovits_root())
+    
+    def warm_up(self):
+        """服务启动后预热需要常驻进程的后端（命令行工作进程和进程内推理的进程池都不在导入时创建）"""
+        self._ensure_cli_pool()
+        if self.python_pool:
+            self.python_pool.start()
+    
+    def _gpt_sovits_root(self) -> str:
+        """GPT-SOVITs仓库的根目录，未单独配置时使用模型路径"""
+        return Config.GPT_SOVITS_ROOT or self.model_path
+    
+    def _start_cli_pool(self):
+        """停止之前的命令行工作进程，新的进程池在 warm_up 或第一次合成时启动"""
+        with self._cli_pool_lock:
+            pool, self.cli_pool = self.cli_pool, None
+        if pool:
+            pool.stop()
+    
+    def _ensure_cli_pool(self) -> Optional[CLIWorkerPool]:
+        """命令行接口开启常驻工作进程时启动进程池（已启动时直接返回）"""
+        if self.backend.kind != TTSBackend.CLI or not self.backend.script_path or Config.TTS_CLI_WORKERS <= 0:
+            return None
+        with self._cli_pool_lock:
+            if self.cli_pool is None:
+                print(f"🔥 启动 {Config.TTS_CLI_WORKERS} 个TTS工作进程")
+                self.cli_pool = CLIWorkerPool(self.backend.script_path, self.model_path)
+            return self.cli_pool
+    
+    def _synthesize(self, text: str, output_path: str) -> Optional[str]:
+        """按启动时确定的接口合成音频"""
+        try:
+            kind = self.backend.kind
+            if kind == TTSBackend.PYTHON:
                 return self._call_python_api(text, output_path)
-            
-            # 方式2: 如果GPT-SOVITs提供了命令行接口
-            elif self._has_cli_interface():
+            elif kind == TTSBackend.CLI:
                 return self._call_cli_interface(text, output_path)
-            
-            # 方式3: 如果GPT-SOVITs提供了HTTP API
-            elif self._has_http_api():
+            elif kind == TTSBackend.HTTP:
                 return self._call_http_api(text, output_path)
-            
             else:
                 print("未找到可用的TTS接口，请检查模型配置")
                 return None
@@ -56,15 +433,8 @@ class TTSClient:
             return None
     
     def _has_python_api(self) -> bool:
-        """检查是否有Python API"""
-        try:
-            # 这里需要根据你的GPT-SOVITs实现来检查
-            # 例如检查特定的模块是否存在
-            import importlib
-            importlib.import_module("gpt_sovits")  # 替换为实际的模块名
-            return True
-        except ImportError:
-            return False
+        """检查是否可以在进程内调用GPT-SOVITs的推理管线（需开启推理进程）"""
+        return Config.TTS_PYTHON_WORKERS > 0 and has_pipeline(self._gpt_sovits_root())
     
     def _has_cli_interface(self) -> bool:
         """检查是否有命令行接口"""
@@ -106,50 +476,55 @@ class TTSClient:
         return False
     
     def _call_python_api(self, text: str, output_path: str) -> Optional[str]:
-        """调用Python API"""
-        try:
-            # 这里需要根据你的GPT-SOVITs Python API来调用
-            # 以下是示例代码，需要根据实际情况修改
-            
-            # 示例1: 如果GPT-SOVITs提供了类似这样的API
-            # from gpt_sovits import TTSModel
-            # model = TTSModel(self.model_path)
-            # audio = model.synthesize(text)
-            # model.save_audio(audio, output_path)
-            
-            # 示例2: 如果使用torch或其他框架
-            # import torch
-            # model = torch.load(self.model_path)
-            # audio = model.generate(text)
-            # torchaudio.save(output_path, audio, Config.SAMPLE_RATE)
-            
-            print("请根据你的GPT-SOVITs Python API实现具体的调用逻辑")
-            return None
-            
-        except Exception as e:
-            print(f"Python API调用失败: {e}")
+        """调用Python API：在常驻的推理进程中合成"""
+        if self.python_pool is None:
+            print("GPT-SOVITs推理进程未启动")
             return None
+        params = self.voice_profile.apply(self.quality.apply(self.inference_params))
+        return self.python_pool.synthesize(text, params, output_path)
+    
+    def _find_cli_script(self) -> Optional[str]:
+        """查找命令行接口的脚本文件"""
+        possible_scripts = [
+            os.path.join(self.model_path, "infer.py"),
+            os.path.join(self.model_path, "inference.py"),
+            os.path.join(self.model_path, "tts.py")
+        ]
+        
+        for script in possible_scripts:
+            if os.path.exists(script):
+                return script
+        return None
+    
+    def _configured_api_url(self) -> str:
+        """从配置文件读取TTS接口地址"""
+        if os.path.exists(self.config_path):
+            try:
+                with open(self.config_path, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+                    return config.get('api_url', 'http://localhost:8000/tts')
+            except Exception as e:
+                print(f"读取TTS配置文件失败: {e}")
+        return 'http://localhost:8000/tts'  # 默认地址
     
     def _call_cli_interface(self, text: str, output_path: str) -> Optional[str]:
         """调用命令行接口"""
         try:
-            # 查找可执行文件
-            possible_scripts = [
-                os.path.join(self.model_path, "infer.py"),
-                os.path.join(self.model_path, "inference.py"),
-                os.path.join(self.model_path, "tts.py")
-            ]
-            
-            script_path = None
-            for script in possible_scripts:
-                if os.path.exists(script):
-                    script_path = script
-                    break
-            
+            script_path = self.backend.script_path
             if not script_path:
                 print("未找到TTS脚本文件")
                 return None
             
+            # 优先交给已加载模型的常驻工作进程
+            cli_pool = self._ensure_cli_pool()
+            if cli_pool and not cli_pool.disabled:
+                try:
+                    if cli_pool.synthesize(text, output_path, timeout=60) and os.path.exists(output_path):
+                        return output_path
+                    return None
+                except CLIWorkerUnavailable as e:
+                    print(f"⚠️ {e}，改为按次启动进程")
+            
             # 构建命令
             cmd = [
                 "python", script_path,
@@ -179,164 +554,38 @@ class TTSClient:
     def _call_http_api(self, text: str, output_path: str) -> Optional[str]:
         """调用HTTP API"""
         try:
-            import requests
+            # model_path是HTTP URL时，发往启动时探测到的GPT-SOVITs接口
+            if self.backend.http:
+                return self.backend.http.synthesize(text, self._synthesis_params(), output_path)
             
-            # 检查model_path是否是HTTP URL
-            if self.model_path.startswith('http'):
-                # 直接使用model_path作为基础URL
-                base_url = self.model_path.rstrip('/')
-                
-                # 尝试GPT-SOVITs的inference API
-                api_url = f"{base_url}/api/inference"
-                
-                # 构建GPT-SOVITs所需的参数格式 - 简化版本
-                inference_data = {
-                    "data": [
-                        text,                    # text
-                        "中文",                  # text_lang
-                        None,                    # ref_audio_path
-                        [],                      # aux_ref_audio_paths
-                        "",                      # prompt_text
-                        "中文",                  # prompt_lang
-                        5,                       # top_k
-                        1,                       # top_p
-                        1,                       # temperature
-                        "凑四句一切",             # text_split_method
-                        20,                      # batch_size
-                        1.0,                     # speed_factor
-                        False,                   # ref_text_free
-                        True,                    # split_bucket
-                        0.3,                     # fragment_interval
-                        -1,                      # seed
-                        True,                    # keep_random
-                        True,                    # parallel_infer
-                        1.35,                    # repetition_penalty
-                        32,                      # sample_steps
-                        False                    # super_sampling
-                    ]
-                }
-                
-                print(f"调用GPT-SOVITs API: {api_url}")
-                print(f"请求数据: {inference_data}")
-                
-                try:
-                    response = requests.post(api_url, json=inference_data, timeout=120)
-                    
-                    print(f"响应状态码: {response.status_code}")
-                    print(f"响应头: {dict(response.headers)}")
-                    
-                    if response.status_code == 200:
-                        response_data = response.json()
-                        print(f"响应数据: {response_data}")
-                        
-                        # 检查响应是否包含音频文件路径
-                        if 'data' in response_data and len(response_data['data']) > 0:
-                            audio_info = response_data['data'][0]
-                            
-                            if 'url' in audio_info:
-                                # 下载音频文件
-                                audio_url = audio_info['url']
-                                print(f"下载音频文件: {audio_url}")
-                                
-                                audio_response = requests.get(audio_url, timeout=30)
-                                if audio_response.status_code == 200:
-                                    # 保存音频文件
-                                    with open(output_path, 'wb') as f:
-                                        f.write(audio_response.content)
-                                    print(f"✅ 音频文件已保存: {output_path}")
-                                    return output_path
-                                else:
-                                    print(f"❌ 下载音频文件失败: {audio_response.status_code}")
-                                    return None
-                            else:
-                                print(f"❌ 响应中没有音频URL: {audio_info}")
-                                return None
-                        else:
-                            print(f"❌ 响应格式不正确: {response_data}")
-                            return None
-                    else:
-                        print(f"❌ API调用失败: {response.status_code}")
-                        try:
-                            error_data = response.json()
-                            print(f"错误信息: {error_data}")
-                        except:
-                            print(f"错误信息: {response.text[:200]}")
-                        return None
-                            
-                except requests.exceptions.RequestException as e:
-                    print(f"❌ 网络连接问题 💡 请检查网络连接")
-                    return None
-                
-                # 如果inference API失败，尝试其他端点
-                possible_endpoints = [
-                    "/tts",
-                    "/synthesize", 
-                    "/generate",
-                    "/api/tts",
-                    "/infer",
-                    "/"
-                ]
-                
-                for endpoint in possible_endpoints:
-                    api_url = f"{base_url}{endpoint}"
-                    try:
-                        print(f"尝试API端点: {api_url}")
-                        
-                        # 发送POST请求
-                        response = requests.post(
-                            api_url,
-                            json={"text": text},
-                            timeout=30
-                        )
-                        
-                        if response.status_code == 200:
-                            # 保存音频文件
-                            with open(output_path, 'wb') as f:
-                                f.write(response.content)
-                            print(f"✅ API调用成功: {api_url}")
-                            return output_path
-                        else:
-                            print(f"❌ API调用失败: {response.status_code}")
-                            
-                    except requests.exceptions.RequestException as e:
-                        print(f"❌ API请求失败: {e}")
-                        continue
-                
-                print("所有HTTP API端点都失败了")
-                return None
+            # 配置文件中指定的接口地址（启动时已解析）
+            api_url = self.backend.api_url
+            
+            # 发送请求
+            response = self.session.post(
+                api_url,
+                json={"text": text},
+                timeout=get_timeout(60)
+            )
+            
+            if response.status_code == 200:
+                # 保存音频文件
+                with open(output_path, 'wb') as f:
+                    f.write(response.content)
+                return output_path
             else:
-                # 原有的本地配置文件逻辑
-                config_file = self.config_path if os.path.exists(self.config_path) else None
-                
-                if config_file:
-                    with open(config_file, 'r', encoding='utf-8') as f:
-                        config = json.load(f)
-                        api_url = config.get('api_url', 'http://localhost:8000/tts')
-                else:
-                    api_url = 'http://localhost:8000/tts'  # 默认地址
-                
-                # 发送请求
-                response = requests.post(
-                    api_url,
-                    json={"text": text},
-                    timeout=60
-                )
+                print(f"HTTP API调用失败: {response.status_code}")
+                return None
                 
-                if response.status_code == 200:
-                    # 保存音频文件
-                    with open(output_path, 'wb') as f:
-                        f.write(response.content)
-                    return output_path
-                else:
-                    print(f"HTTP API调用失败: {response.status_code}")
-                    return None
-                    
         except Exception as e:
             print(f"HTTP API调用失败: {e}")
             return None
     
     def get_audio_duration(self, audio_path: str) -> float:
-        """获取音频文件时长"""
+        """获取音频文件时长，WAV/Ogg只读取文件头，其他格式才解码整个文件"""
+        info = probe_audio(audio_path)
+        if info:
+            return info["duration"]
         try:
             from pydub import AudioSegment
             audio = AudioSegment.from_file(audio_path)
@@ -0,0 +1,545 @@
+"""
+GPT-SOVITs HTTP接口
+
+不同版本、不同启动方式的GPT-SOVITs服务提供的接口路径和参数格式各不相同
+（WebUI的Gradio接口、api_v2.py的 /tts 接口、各种只接收文本的简单接口）。
+启动时用一句短文本依次探测候选的接口和参数格式，记住第一个能返回音频的组合，
+之后的合成请求直接发往该接口；连续失败多次后在后台重新探测。探测要逐个尝试候选接口，
+服务无响应时可能持续数分钟，期间的合成请求最多等待 TTS_HTTP_DISCOVERY_WAIT 秒，
+超时后这次不合成语音，不会一直排队等到探测结束。
+
+音频边接收边分块写入磁盘，不在内存中缓存整个文件；Gradio接口返回的音频文件
+在与TTS服务共享文件系统时直接硬链接或复制，省去一次HTTP下载。
+api_v2 接口还支持流式合成（streaming_mode），边生成边返回分块的WAV数据。
+
+GPT-SOVITs自带接口的 batch_size/parallel_infer 只对一段文本切分出的句子并行推理，
+一次请求仍然只返回一段音频。配置了 TTS_BATCH_ENDPOINT 时，多条文本合并成一次请求
+发往该接口（需在TTS服务端自行实现）：
+
+    请求:  POST <服务地址><TTS_BATCH_ENDPOINT>，请求体与api_v2相同，"text" 换成 "texts": [文本, ...]
+    响应:  {"audios": ["<base64编码的WAV>", ...]}，顺序与texts一致，某条失败时为null
+
+接口不存在（404/405）时不再尝试，退回逐条请求。
+"""
+import base64
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Any, Optional, List, Tuple, Iterator
+
+import requests
+
+from config import Config
+from http_pool import get_timeout
+
+# 参数格式
+PAYLOAD_GRADIO = "gradio"    # WebUI: {"data": [text, text_lang, ...]}，返回音频文件URL
+PAYLOAD_API_V2 = "api_v2"    # api_v2.py: {"text", "text_lang", "ref_audio_path", ...}，直接返回音频
+PAYLOAD_TEXT = "text"        # 简单接口: {"text"}，直接返回音频
+
+# 候选接口，按探测顺序排列
+CANDIDATE_ENDPOINTS: List[Tuple[str, str]] = [
+    ("/api/inference", PAYLOAD_GRADIO),
+    ("/tts", PAYLOAD_API_V2),
+    ("/tts", PAYLOAD_TEXT),
+    ("/synthesize", PAYLOAD_TEXT),
+    ("/generate", PAYLOAD_TEXT),
+    ("/api/tts", PAYLOAD_TEXT),
+    ("/infer", PAYLOAD_TEXT),
+    ("/", PAYLOAD_TEXT),
+]
+
+# WebUI参数值与api_v2参数值的对应关系
+LANGUAGE_CODES = {
+    "中文": "zh", "英文": "en", "日文": "ja", "粤语": "yue", "韩文": "ko",
+    "中英混合": "zh", "日英混合": "ja", "粤英混合": "yue", "韩英混合": "ko",
+    "多语种混合": "auto", "多语种混合(粤语)": "auto_yue"
+}
+SPLIT_METHODS = {
+    "不切": "cut0", "凑四句一切": "cut1", "凑50字一切": "cut2",
+    "按中文句号。切": "cut3", "按英文句号.切": "cut4", "按标点符号切": "cut5"
+}
+
+# 常见音频格式的文件头
+_AUDIO_MAGIC = (b"RIFF", b"OggS", b"ID3", b"fLaC", b"\xff\xfb", b"\xff\xf3")
+
+# 写入磁盘时每次读取的字节数
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# 登记参考音色连续失败时，重试间隔加倍的上限（秒）
+VOICE_RETRY_MAX_INTERVAL = 600
+
+
+def build_payload(payload_format: str, text: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """按接口的参数格式构建请求体"""
+    if payload_format == PAYLOAD_GRADIO:
+        # 文本在前，其余参数按固定顺序排列；参考音频以Gradio文件对象的形式传递
+        values = dict(params)
+        if isinstance(values.get("ref_audio_path"), str):
+            values["ref_audio_path"] = {"path": values["ref_audio_path"], "meta": {"_type": "gradio.FileData"}}
+        return {"data": [text] + list(values.values())}
+    if payload_format == PAYLOAD_API_V2:
+        return {
+            "text": text,
+            "text_lang": LANGUAGE_CODES.get(params["text_lang"], params["text_lang"]),
+            "ref_audio_path": params["ref_audio_path"],
+            "aux_ref_audio_paths": params["aux_ref_audio_paths"],
+            "prompt_text": params["prompt_text"],
+            "prompt_lang": LANGUAGE_CODES.get(params["prompt_lang"], params["prompt_lang"]),
+            "top_k": params["top_k"],
+            "top_p": params["top_p"],
+            "temperature": params["temperature"],
+            "text_split_method": SPLIT_METHODS.get(params["text_split_method"], params["text_split_method"]),
+            "batch_size": params["batch_size"],
+            "speed_factor": params["speed_factor"],
+            "split_bucket": params["split_bucket"],
+            "fragment_interval": params["fragment_interval"],
+            "seed": params["seed"],
+            "parallel_infer": params["parallel_infer"],
+            "repetition_penalty": params["repetition_penalty"],
+            "sample_steps": params["sample_steps"],
+            "super_sampling": params["super_sampling"],
+            "media_type": "wav"
+        }
+    return {"text": text}
+
+
+def is_audio_content(content_type: str, head: bytes) -> bool:
+    """根据Content-Type和开头的字节判断是否是音频（避免把首页HTML之类的内容当成音频保存）"""
+    if content_type.startswith("audio/"):
+        return True
+    return head.startswith(_AUDIO_MAGIC)
+
+
+def stream_audio_to_file(response: requests.Response, output_path: str) -> Optional[str]:
+    """
+    把流式响应中的音频分块写入文件
+
+    Returns:
+        str: 文件路径，响应内容不是音频时返回None且不留下文件
+    """
+    chunks = response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE)
+    first = b""
+    for chunk in chunks:
+        if chunk:
+            first = chunk
+            break
+    if not is_audio_content(response.headers.get("Content-Type", ""), first[:4]):
+        print(f"❌ 接口返回的不是音频: {response.url} {response.headers.get('Content-Type')}")
+        return None
+
+    with open(output_path, 'wb') as f:
+        f.write(first)
+        for chunk in chunks:
+            f.write(chunk)
+    return output_path
+
+
+def link_or_copy(source_path: str, output_path: str) -> str:
+    """把TTS服务生成的文件放到输出目录：优先硬链接，跨文件系统时复制"""
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    try:
+        os.link(source_path, output_path)
+    except OSError:
+        shutil.copyfile(source_path, output_path)
+    return output_path
+
+
+class GPTSoVITSHTTP:
+    """探测并记住可用的GPT-SOVITs HTTP接口"""
+
+    def __init__(self, base_url: str, session: requests.Session):
+        self.base_url = base_url.rstrip('/')
+        self.session = session
+        self.endpoint: Optional[str] = None
+        self.payload_format: Optional[str] = None
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._last_discovery = 0.0
+        # 是否正在探测，同一时间只进行一次探测；没有在探测时 _discovery_done 处于设置状态
+        self._discovering = False
+        self._discovery_done = threading.Event()
+        self._discovery_done.set()
+        # 批量接口是否可用，None表示还没有请求过
+        self.batch_supported: Optional[bool] = None if Config.TTS_BATCH_ENDPOINT else False
+        # 已登记的参考音色: (音色指纹, 服务端路径)
+        self._voice: Optional[Tuple[str, str]] = None
+        # 登记失败的音色: (音色指纹, 连续失败次数, 下次可以重试的时间)
+        self._voice_failure: Optional[Tuple[str, int, float]] = None
+        # 正在登记的音色指纹，同一时间只有一个线程发起登记
+        self._registering: Optional[str] = None
+
+    def describe(self) -> Dict[str, Any]:
+        return {"endpoint": self.endpoint, "payload_format": self.payload_format,
+                "batch_supported": self.batch_supported,
+                "voice_handle": self._voice[1] if self._voice else None}
+
+    def discover(self, params: Dict[str, Any], profile=None) -> bool:
+        """依次探测候选接口，记住第一个能返回音频的接口和参数格式（阻塞到探测结束）"""
+        with self._lock:
+            self._begin_discovery()
+        return self._run_discovery(params, profile)
+
+    def start_discovery(self, params: Dict[str, Any], profile=None) -> bool:
+        """在后台探测接口，已经在探测时不重复启动；返回是否启动了新的探测"""
+        with self._lock:
+            if self._discovering:
+                return False
+            self._begin_discovery()
+        threading.Thread(target=self._run_discovery, args=(params, profile),
+                         name="tts-discover", daemon=True).start()
+        return True
+
+    def _begin_discovery(self):
+        """标记开始探测（调用方需持有锁），在启动探测线程之前设置，之后到达的请求不会再发起探测"""
+        self._discovering = True
+        self._discovery_done.clear()
+        self._last_discovery = time.monotonic()
+
+    def _run_discovery(self, params: Dict[str, Any], profile=None) -> bool:
+        try:
+            return self._discover(params, profile)
+        finally:
+            with self._lock:
+                self._discovering = False
+                self._discovery_done.set()
+
+    def _discover(self, params: Dict[str, Any], profile=None) -> bool:
+        """
+        探测接口（网络请求不持有锁，结果在锁内一次性更新）
+
+        配置了参考音色时，每种参数格式先按该格式的方式登记音色（Gradio上传、api_v2 使用服务端路径），
+        再用登记得到的服务端路径探测，TTS服务读不到本地参考音频时也能探测成功
+        """
+        probe_path = os.path.join(Config.AUDIO_OUTPUT_PATH, f".tts_probe_{os.getpid()}.wav")
+        # 各参数格式登记得到的服务端路径，同一次探测中只上传一次
+        handles: Dict[str, Optional[str]] = {}
+        # 探测到的 (接口地址, 参数格式, 已登记的音色)
+        found: Optional[Tuple[str, str, Optional[Tuple[str, str]]]] = None
+        print(f"🔍 正在探测GPT-SOVITs接口: {self.base_url}")
+        try:
+            for path, payload_format in CANDIDATE_ENDPOINTS:
+                url = f"{self.base_url}{path}"
+                probe_params = params
+                if profile is not None and profile.is_set and payload_format != PAYLOAD_TEXT:
+                    if payload_format not in handles:
+                        handles[payload_format] = self._reference_handle(payload_format, profile.ref_audio_path)
+                    if handles[payload_format]:
+                        probe_params = profile.apply(params, handles[payload_format])
+                try:
+                    result = self._request(url, payload_format, Config.TTS_HTTP_PROBE_TEXT, probe_params,
+                                           probe_path, get_timeout(Config.TTS_HTTP_PROBE_TIMEOUT))
+                except requests.exceptions.ConnectionError as e:
+                    # 服务没有启动时不必继续尝试其他路径
+                    print(f"❌ 无法连接GPT-SOVITs服务: {e}")
+                    break
+                except Exception as e:
+                    print(f"   {path} ({payload_format}): {e}")
+                    continue
+                if result:
+                    # 探测时已用登记得到的路径合成成功时，音色不必再登记
+                    voice = (profile.fingerprint(), handles[payload_format]) if probe_params is not params else None
+                    found = (url, payload_format, voice)
+                    break
+                print(f"   {path} ({payload_format}): 不可用")
+        finally:
+            if os.path.exists(probe_path):
+                os.remove(probe_path)
+
+        with self._lock:
+            if found:
+                self.endpoint, self.payload_format, voice = found
+                self._failures = 0
+                # 服务可能重启过，之前登记的音色需要重新登记
+                self._voice = voice
+                self._voice_failure = None
+            else:
+                self.endpoint = None
+                self.payload_format = None
+        if found:
+            print(f"✅ 使用GPT-SOVITs接口: {found[0]} ({found[1]})")
+            return True
+        print("❌ 没有找到可用的GPT-SOVITs接口")
+        return False
+
+    def _ensure_endpoint(self, params: Dict[str, Any], profile=None) -> bool:
+        """
+        是否有可用的接口
+
+        没有时在后台重新探测（两次探测之间至少间隔配置的时间）。正在探测时（包括本次发起的探测）
+        最多等待 TTS_HTTP_DISCOVERY_WAIT 秒，探测成功则继续合成，超时或探测失败时返回False
+        """
+        with self._lock:
+            if self.endpoint:
+                return True
+            if not self._discovering:
+                if time.monotonic() - self._last_discovery < Config.TTS_HTTP_DISCOVERY_RETRY_INTERVAL:
+                    return False
+                self._begin_discovery()
+                threading.Thread(target=self._run_discovery, args=(params, profile),
+                                 name="tts-discover", daemon=True).start()
+        if not self._discovery_done.wait(Config.TTS_HTTP_DISCOVERY_WAIT):
+            print(f"⚠️ GPT-SOVITs接口探测 {Config.TTS_HTTP_DISCOVERY_WAIT:.0f} 秒内没有完成")
+            return False
+        return self.endpoint is not None
+
+    def synthesize(self, text: str, params: Dict[str, Any], output_path: str) -> Optional[str]:
+        """发往已探测到的接口合成音频，连续失败达到阈值后下次请求重新探测"""
+        if not self._ensure_endpoint(params):
+            print("❌ GPT-SOVITs接口不可用，跳过语音合成")
+            return None
+
+        endpoint, payload_format = self.endpoint, self.payload_format
+        try:
+            result = self._request(endpoint, payload_format, text, params, output_path, get_timeout(120))
+        except requests.exceptions.RequestException as e:
+            print(f"❌ GPT-SOVITs请求失败: {e}")
+            result = None
+
+        self._record_result(endpoint, bool(result))
+        return result
+
+    def register_voice(self, profile, params: Dict[str, Any]) -> Optional[str]:
+        """
+        向TTS服务登记参考音色，同一音色只登记一次
+
+        上传和登记请求不持有锁，不阻塞其他线程的合成；其他线程正在登记、或上次登记失败后
+        还没到重试时间时直接返回None。
+
+        Returns:
+            str: 合成时使用的服务端参考音频路径，登记失败时返回None（调用方使用配置的路径）
+        """
+        if not profile.is_set or not self._ensure_endpoint(params, profile):
+            return None
+        fingerprint = profile.fingerprint()
+        with self._lock:
+            if self._voice and self._voice[0] == fingerprint:
+                return self._voice[1]
+            failure = self._voice_failure
+            if failure and failure[0] == fingerprint and time.monotonic() < failure[2]:
+                return None
+            if self._registering == fingerprint:
+                return None
+            payload_format = self.payload_format
+            if payload_format not in (PAYLOAD_GRADIO, PAYLOAD_API_V2):
+                # 只接收文本的接口不支持指定音色
+                return None
+            self._registering = fingerprint
+
+        handle = None
+        try:
+            handle = self._reference_handle(payload_format, profile.ref_audio_path)
+            if payload_format == PAYLOAD_API_V2:
+                handle = self._set_refer_audio(handle)
+        finally:
+            with self._lock:
+                self._registering = None
+                if handle:
+                    self._voice = (fingerprint, handle)
+                    self._voice_failure = None
+                else:
+                    failures = failure[1] + 1 if failure and failure[0] == fingerprint else 1
+                    delay = min(Config.TTS_VOICE_RETRY_INTERVAL * 2 ** (failures - 1), VOICE_RETRY_MAX_INTERVAL)
+                    self._voice_failure = (fingerprint, failures, time.monotonic() + delay)
+        if handle:
+            print(f"🎙️ 已登记参考音色: {handle}")
+        else:
+            print(f"⚠️ 登记参考音色失败，{delay:.0f}秒内使用配置的路径")
+        return handle
+
+    def _reference_handle(self, payload_format: str, ref_audio_path: str) -> Optional[str]:
+        """
+        参考音频在TTS服务端的路径
+
+        Gradio接口先上传；api_v2 接口只能读取服务端的文件，需要上传时先上传，否则按原路径使用
+        """
+        if payload_format == PAYLOAD_GRADIO or Config.TTS_REF_AUDIO_UPLOAD:
+            return self._upload_reference(ref_audio_path)
+        return ref_audio_path
+
+    def _upload_reference(self, ref_audio_path: str) -> Optional[str]:
+        """通过Gradio的 /upload 接口上传参考音频，返回服务端路径"""
+        if not os.path.isfile(ref_audio_path):
+            print(f"❌ 参考音频不存在: {ref_audio_path}")
+            return None
+        try:
+            with open(ref_audio_path, 'rb') as f:
+                response = self.session.post(f"{self.base_url}/upload",
+                                             files={"files": (os.path.basename(ref_audio_path), f)},
+                                             timeout=get_timeout(60))
+            if response.status_code == 200:
+                paths = response.json()
+                if isinstance(paths, list) and paths:
+                    return paths[0]
+            print(f"❌ 上传参考音频失败: {response.status_code} {response.text[:200]}")
+        except (requests.exceptions.RequestException, ValueError, OSError) as e:
+            print(f"❌ 上传参考音频失败: {e}")
+        return None
+
+    def _set_refer_audio(self, server_path: Optional[str]) -> Optional[str]:
+        """调用 api_v2 的 /set_refer_audio 让服务端预先提取参考音频的特征"""
+        if not server_path:
+            return None
+        try:
+            response = self.session.get(f"{self.base_url}/set_refer_audio",
+                                        params={"refer_audio_path": server_path}, timeout=get_timeout(60))
+        except requests.exceptions.RequestException as e:
+            print(f"❌ 登记参考音色失败: {e}")
+            return None
+        if response.status_code == 404:
+            # 旧版本没有这个接口，服务端仍会按路径缓存特征
+            return server_path
+        if response.status_code != 200:
+            print(f"❌ 登记参考音色失败: {response.status_code} {response.text[:200]}")
+            return None
+        return server_path
+
+    def _record_result(self, endpoint: str, ok: bool):
+        """记录请求结果，连续失败达到阈值时清除已探测的接口"""
+        with self._lock:
+            if ok:
+                self._failures = 0
+                return
+            self._failures += 1
+            if self._failures >= Config.TTS_HTTP_DISCOVERY_FAILURES and self.endpoint == endpoint:
+                print(f"⚠️ GPT-SOVITs接口连续失败 {self._failures} 次，下次请求时重新探测")
+                self.endpoint = None
+                self.payload_format = None
+                self._last_discovery = 0.0
+
+    def synthesize_batch(self, texts: List[str], params: Dict[str, Any],
+                         output_paths: List[str]) -> Optional[List[Optional[str]]]:
+        """
+        一次请求合成多条文本
+
+        Returns:
+            list: 与texts对应的音频文件路径（某条失败时为None），批量接口不可用或请求失败时返回None
+        """
+        if self.batch_supported is False:
+            return None
+        url = f"{self.base_url}{Config.TTS_BATCH_ENDPOINT}"
+        payload = build_payload(PAYLOAD_API_V2, "", params)
+        del payload["text"]
+        payload["texts"] = texts
+        try:
+            response = self.session.post(url, json=payload, timeout=get_timeout(120 + 30 * len(texts)))
+        except requests.exceptions.RequestException as e:
+            print(f"❌ GPT-SOVITs批量请求失败: {e}")
+            return None
+        if response.status_code in (404, 405):
+            print(f"⚠️ TTS服务不支持批量接口 {url}，改为逐条请求")
+            self.batch_supported = False
+            return None
+        if response.status_code != 200:
+            print(f"❌ GPT-SOVITs批量请求失败: {response.status_code} {response.text[:200]}")
+            return None
+        try:
+            audios = response.json()["audios"]
+        except (ValueError, KeyError, TypeError):
+            print(f"❌ 批量接口响应格式不正确: {response.text[:200]}")
+            return None
+        if not isinstance(audios, list) or len(audios) != len(texts):
+            print("❌ 批量接口返回的音频数量与请求不一致")
+            return None
+
+        self.batch_supported = True
+        results: List[Optional[str]] = []
+        for audio, output_path in zip(audios, output_paths):
+            data = base64.b64decode(audio) if audio else b""
+            if not is_audio_content("", data[:16]):
+                results.append(None)
+                continue
+            with open(output_path, 'wb') as f:
+                f.write(data)
+            results.append(output_path)
+        return results
+
+    def supports_streaming(self, params: Dict[str, Any]) -> bool:
+        """探测到的接口是否支持流式合成（只有api_v2接口支持）"""
+        return self._ensure_endpoint(params) and self.payload_format == PAYLOAD_API_V2
+
+    def open_stream(self, text: str, params: Dict[str, Any]) -> Optional[Iterator[bytes]]:
+        """
+        发起流式合成请求
+
+        Returns:
+            Iterator[bytes]: 按到达顺序产出的WAV数据块（文件头之后是PCM），请求失败时返回None
+        """
+        endpoint = self.endpoint
+        payload = build_payload(PAYLOAD_API_V2, text, params)
+        payload["streaming_mode"] = True
+        try:
+            response = self.session.post(endpoint, json=payload, timeout=get_timeout(120), stream=True)
+        except requests.exceptions.RequestException as e:
+            print(f"❌ GPT-SOVITs流式请求失败: {e}")
+            self._record_result(endpoint, False)
+            return None
+        if response.status_code != 200:
+            print(f"❌ GPT-SOVITs流式请求失败: {response.status_code} {response.text[:200]}")
+            response.close()
+            self._record_result(endpoint, False)
+            return None
+        self._record_result(endpoint, True)
+        return self._iter_stream(response)
+
+    @staticmethod
+    def _iter_stream(response: requests.Response) -> Iterator[bytes]:
+        # chunk_size=None: 数据到达多少就产出多少，不等待凑满固定大小
+        with response:
+            for chunk in response.iter_content(chunk_size=None):
+                if chunk:
+                    yield chunk
+
+    def _request(self, url: str, payload_format: str, text: str, params: Dict[str, Any],
+                 output_path: str, timeout) -> Optional[str]:
+        """发送一次合成请求并保存音频，接口返回的不是音频时返回None"""
+        with self.session.post(url, json=build_payload(payload_format, text, params),
+                               timeout=timeout, stream=True) as response:
+            if response.status_code != 200:
+                print(f"❌ API调用失败: {url} {response.status_code} {response.text[:200]}")
+                return None
+
+            if payload_format == PAYLOAD_GRADIO:
+                return self._fetch_gradio_audio(response, output_path)
+
+            return stream_audio_to_file(response, output_path)
+
+    def _fetch_gradio_audio(self, response: requests.Response, output_path: str) -> Optional[str]:
+        """
+        获取Gradio接口生成的音频文件
+
+        返回结果中有服务端的文件路径和下载URL：共享文件系统时直接链接或复制文件，
+        否则流式下载到磁盘
+        """
+        try:
+            response_data = response.json()
+        except ValueError:
+            print(f"❌ 响应格式不正确: {response.text[:200]}")
+            return None
+
+        # 检查响应是否包含音频文件路径
+        data = response_data.get('data') if isinstance(response_data, dict) else None
+        if not data or not isinstance(data[0], dict) or 'url' not in data[0]:
+            print(f"❌ 响应中没有音频URL: {response_data}")
+            return None
+
+        server_path = data[0].get('path')
+        if Config.TTS_SHARED_FILESYSTEM and server_path and os.path.isfile(server_path):
+            try:
+                return link_or_copy(server_path, output_path)
+            except OSError as e:
+                print(f"⚠️ 直接读取TTS服务的音频文件失败，改为下载: {e}")
+
+        audio_url = data[0]['url']
+        print(f"下载音频文件: {audio_url}")
+        with self.session.get(audio_url, timeout=get_timeout(30), stream=True) as audio_response:
+            if audio_response.status_code != 200:
+                print(f"❌ 下载音频文件失败: {audio_response.status_code}")
+                return None
+            # 分块写入，不在内存中保存整个文件
+            result = stream_audio_to_file(audio_response, output_path)
+        if result:
+            print(f"✅ 音频文件已保存: {output_path}")
+        return result
@@ -0,0 +1,162 @@
+"""
+进程内的GPT-SOVITs推理（Python API）
+
+直接调用GPT-SOVITs仓库中的推理管线（GPT_SoVITS/TTS_infer_pack/TTS.py，api_v2.py使用的同一个），
+不经过HTTP服务或命令行。推理放在若干个工作进程中（只用CPU），每个进程启动时加载一次模型，
+之后一直复用；多条回复可以在不同的CPU核上同时合成。
+
+工作进程把合成结果以numpy数组（int16 PCM）返回给主进程，由主进程直接写入输出文件，
+不经过临时文件；开启音频后处理时在写入前直接处理内存中的数组。
+
+工作进程用spawn方式启动，启动时会重新导入主模块（以 __mp_main__ 的名字）。
+因此进程池不在导入时创建，而是在服务启动后（FastAPI startup）或第一次合成时创建；
+用 python main.py 启动时，main.py 在 __mp_main__ 中不创建 ChatManager，
+避免工作进程里再构建一套TTS客户端和进程池。
+"""
+import multiprocessing
+import os
+import sys
+import threading
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Optional, Tuple
+
+from config import Config
+from tts_http import build_payload, PAYLOAD_API_V2
+from audio_processing import postprocess, pcm_to_float, write_wav
+
+# 推理管线相对于GPT-SOVITs仓库根目录的位置
+TTS_PIPELINE_MODULE = os.path.join("GPT_SoVITS", "TTS_infer_pack", "TTS.py")
+DEFAULT_PIPELINE_CONFIG = os.path.join("GPT_SoVITS", "configs", "tts_infer.yaml")
+
+# 工作进程中的推理管线，由 _init_worker 创建
+_pipeline = None
+
+
+def has_pipeline(root: str) -> bool:
+    """root是否是包含推理管线的GPT-SOVITs仓库"""
+    return os.path.isfile(os.path.join(root, TTS_PIPELINE_MODULE))
+
+
+def _init_worker(root: str, config_path: str, threads: int):
+    """工作进程启动时加载模型（只用CPU）"""
+    global _pipeline
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    os.chdir(root)
+    sys.path[:0] = [root, os.path.join(root, "GPT_SoVITS")]
+
+    import torch
+    from TTS_infer_pack.TTS import TTS, TTS_Config
+
+    torch.set_num_threads(threads)
+    tts_config = TTS_Config(config_path)
+    tts_config.device = "cpu"
+    tts_config.is_half = False
+    _pipeline = TTS(tts_config)
+    print(f"✅ GPT-SOVITs推理进程已加载模型（pid={os.getpid()}）", file=sys.stderr)
+
+
+def _ping() -> int:
+    """预热用的空任务，确保工作进程已启动并加载完模型"""
+    return os.getpid()
+
+
+def _run_inference(inputs: Dict[str, Any]) -> Tuple[int, Any]:
+    """在工作进程中合成，返回 (采样率, int16 PCM数组)"""
+    import numpy as np
+
+    sample_rate = None
+    fragments = []
+    for sample_rate, audio in _pipeline.run(inputs):
+        fragments.append(audio)
+    if not fragments:
+        raise RuntimeError("推理管线没有返回音频")
+    return sample_rate, np.concatenate(fragments).astype(np.int16, copy=False)
+
+
+class PythonTTSPool:
+    """常驻的GPT-SOVITs推理进程池"""
+
+    def __init__(self, root: str, workers: Optional[int] = None):
+        self.root = os.path.abspath(root)
+        self.workers = workers if workers is not None else Config.TTS_PYTHON_WORKERS
+        config_path = Config.TTS_PYTHON_CONFIG or DEFAULT_PIPELINE_CONFIG
+        # 每个进程分到的CPU线程数，避免多个进程互相争抢
+        threads = Config.TTS_PYTHON_THREADS or max(1, (os.cpu_count() or 1) // self.workers)
+        self._initargs = (self.root, config_path, threads)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> Optional[ProcessPoolExecutor]:
+        """
+        创建进程池并在后台预热（已创建时直接返回）
+
+        在工作进程中（重新导入主模块时）不会创建进程池，返回None
+        """
+        if multiprocessing.parent_process() is not None:
+            return None
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._create_executor()
+            return self._executor
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # 父进程中有多个线程，用spawn启动子进程，避免fork带来的锁状态问题
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=self._initargs
+        )
+        # 在后台预热，避免第一次请求等待模型加载
+        for _ in range(self.workers):
+            executor.submit(_ping)
+        return executor
+
+    def synthesize(self, text: str, params: Dict[str, Any], output_path: str,
+                   timeout: float = 300) -> Optional[str]:
+        """在工作进程中合成，并把返回的PCM写入输出文件"""
+        inputs = build_payload(PAYLOAD_API_V2, text, params)
+        del inputs["media_type"]
+        inputs["return_fragment"] = False
+        # 工作进程的工作目录是GPT-SOVITs仓库，相对路径按本进程的工作目录解析
+        if inputs["ref_audio_path"]:
+            inputs["ref_audio_path"] = os.path.abspath(inputs["ref_audio_path"])
+        inputs["aux_ref_audio_paths"] = [os.path.abspath(path) for path in inputs["aux_ref_audio_paths"]]
+        executor = self.start()
+        if executor is None:
+            print("❌ GPT-SOVITs推理进程池不可用")
+            return None
+        try:
+            sample_rate, audio = executor.submit(_run_inference, inputs).result(timeout=timeout)
+        except BrokenProcessPool:
+            # 工作进程崩溃（如内存不足）后进程池不可再用，下次合成时重新创建
+            print("⚠️ GPT-SOVITs推理进程异常退出，下次合成时重新启动进程池")
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            return None
+        except Exception as e:
+            print(f"❌ GPT-SOVITs推理失败: {e}")
+            return None
+
+        channels = 1 if audio.ndim == 1 else audio.shape[1]
+        if Config.AUDIO_POSTPROCESS_ENABLED:
+            samples, sample_rate = postprocess(pcm_to_float(audio.tobytes(), 2, channels), sample_rate)
+            write_wav(output_path, samples, sample_rate)
+            return output_path
+
+        with wave.open(output_path, 'wb') as wav_file:
+            wav_file.setnchannels(channels)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(sample_rate)
+            wav_file.writeframes(audio.tobytes())
+        return output_path
+
+    def stop(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,195 @@
+"""
+分句流水线语音合成
+
+长回复整段合成时，要等全部音频生成完才能开始播放。流水线模式把回复按句子切成若干段，
+按顺序提交给调度器合成，每段一完成就交给调用方播放，全部完成后再拼接成完整的音频文件
+保存到聊天记录中。每条回复只提前提交 TTS_PIPELINE_CONCURRENCY 句，其余的句子等前面的
+取走后再提交，不占满调度器的队列；各条回复之间的先后由调度器的优先级决定。
+
+客户端按播放进度逐段获取片段，拼接完成时后面的片段可能还没取走，所以片段文件在
+TTS_PIPELINE_PART_TTL 秒后才删除；服务重启前没来得及删除的片段在下次启动时清理。
+"""
+import os
+import re
+import threading
+import wave
+from concurrent.futures import Future
+from typing import List, Dict, Any, Optional, Iterator
+
+from config import Config
+from tts_scheduler import PRIORITY_INTERACTIVE, PRIORITY_PREFETCH, TTSQueueFull
+from audio_processing import concat_wav
+
+# 句末标点，切分时保留在句子末尾
+_SENTENCE_PATTERN = re.compile(r'[^。！？!?；;…\n]+[。！？!?；;…\n]*')
+# 分句合成的片段文件名：{完整音频的文件名}_part{序号}.wav
+_PART_FILENAME_PATTERN = re.compile(r'_part\d+\.wav$', re.IGNORECASE)
+
+
+def is_part_filename(filename: str) -> bool:
+    """是否是分句合成的片段文件"""
+    return bool(_PART_FILENAME_PATTERN.search(filename))
+
+
+def split_sentences(text: str, min_chars: Optional[int] = None) -> List[str]:
+    """
+    把文本切分成适合逐段合成的句子
+
+    过短的句子会与后一句合并，避免产生大量只有一两个字的音频片段
+    """
+    if min_chars is None:
+        min_chars = Config.TTS_PIPELINE_MIN_CHARS
+
+    sentences = []
+    pending = ""
+    for piece in _SENTENCE_PATTERN.findall(text):
+        pending += piece
+        if len(pending.strip()) >= min_chars:
+            sentences.append(pending.strip())
+            pending = ""
+    if pending.strip():
+        # 末尾剩下的短句并入上一句
+        if sentences:
+            sentences[-1] += pending.strip()
+        else:
+            sentences.append(pending.strip())
+    return sentences
+
+
+def concat_wav_files(part_paths: List[str], output_path: str) -> Optional[str]:
+    """
+    按顺序拼接WAV文件
+
+    PCM WAV在内存中统一格式后交叉淡化拼接（见 audio_processing）；不是PCM WAV时尝试用pydub转换后拼接
+    """
+    try:
+        return concat_wav(part_paths, output_path, normalize=Config.AUDIO_POSTPROCESS_ENABLED)
+    except (wave.Error, EOFError, OSError, ValueError) as e:
+        print(f"⚠️ 直接拼接WAV失败，尝试使用pydub: {e}")
+
+    try:
+        from pydub import AudioSegment
+        combined = AudioSegment.empty()
+        for path in part_paths:
+            combined += AudioSegment.from_file(path)
+        combined.export(output_path, format="wav")
+        return output_path
+    except Exception as e:
+        print(f"❌ 拼接音频失败: {e}")
+        return None
+
+
+class SentencePipeline:
+    """按句子流水线合成语音，每条回复提前提交的句子数受限"""
+
+    def __init__(self, tts_client, scheduler, lookahead: Optional[int] = None):
+        self.tts_client = tts_client
+        self.scheduler = scheduler
+        if lookahead is None:
+            lookahead = Config.TTS_PIPELINE_CONCURRENCY
+        self.lookahead = max(1, lookahead)
+        self._remove_stale_parts()
+
+    def synthesize(self, text: str, output_filename: str) -> Iterator[Dict[str, Any]]:
+        """
+        逐段合成并按顺序产出音频事件
+
+        Yields:
+            {"type": "audio_chunk", "index", "total", "text", "audio_path"}: 某一段已可播放
+            {"type": "audio_complete", "audio_path", "partial"}: 完整音频（最后一个事件）。
+                有句子合成失败时partial为True，audio_path是其余句子拼接的音频；全部失败时audio_path为None
+        """
+        # 整段文本已经合成过时直接返回
+        cached_path = self.tts_client.get_cached(text, output_filename)
+        if cached_path:
+            yield {"type": "audio_complete", "audio_path": os.path.basename(cached_path), "partial": False}
+            return
+
+        sentences = split_sentences(text)
+        if len(sentences) <= 1:
+            # 只有一句时不需要切分
+            audio_path = self.scheduler.synthesize(text, output_filename, PRIORITY_INTERACTIVE)
+            yield {"type": "audio_complete", "audio_path": os.path.basename(audio_path) if audio_path else None,
+                   "partial": False}
+            return
+
+        stem, ext = os.path.splitext(output_filename)
+        degraded = self.tts_client.quality.degraded
+        print(f"🎼 分句合成: {len(sentences)} 段")
+
+        def submit(index: int) -> Future:
+            # 第一句决定开始播放的时间，按对话回复的优先级调度，之后的句子作为预合成，让位于其他对话的第一句。
+            # 开始播放后缺了某一句会听出断档，所以后续句子排队时不会被其他请求挤掉
+            priority = PRIORITY_INTERACTIVE if index == 0 else PRIORITY_PREFETCH
+            try:
+                return self.scheduler.submit(sentences[index], f"{stem}_part{index}{ext}", priority, False)
+            except TTSQueueFull as e:
+                future = Future()
+                future.set_exception(e)
+                return future
+
+        futures = [submit(index) for index in range(min(self.lookahead, len(sentences)))]
+        part_paths = []
+        missing = 0
+        for index, sentence in enumerate(sentences):
+            future = futures[index]
+            # 取走一句时提交窗口外的下一句
+            if len(futures) < len(sentences):
+                futures.append(submit(len(futures)))
+            try:
+                part_path = future.result()
+            except Exception as e:
+                print(f"❌ 第{index + 1}段合成失败: {e}")
+                part_path = None
+            if not part_path:
+                print(f"⚠️ 第{index + 1}段没有音频，完整音频将缺少这一句")
+                missing += 1
+                continue
+            part_paths.append(part_path)
+            yield {
+                "type": "audio_chunk",
+                "index": index,
+                "total": len(sentences),
+                "text": sentence,
+                "audio_path": os.path.basename(part_path)
+            }
+
+        audio_path = None
+        if part_paths:
+            audio_path = concat_wav_files(part_paths, os.path.join(self.tts_client.output_path, output_filename))
+            if audio_path and not missing:
+                # 合成期间降过档时，拼接结果中可能有降级的句子，不登记到缓存；缺句的音频同样不缓存
+                degraded = degraded or self.tts_client.quality.degraded
+                audio_path = self.tts_client.store_cached(text, audio_path, degraded)
+            # 与其他回复相同的句子会合并成一次合成，得到的可能是别的文件，只删除片段文件
+            self._schedule_removal([path for path in part_paths if is_part_filename(path)])
+        yield {
+            "type": "audio_complete",
+            "audio_path": os.path.basename(audio_path) if audio_path else None,
+            "partial": bool(missing)
+        }
+
+    def _schedule_removal(self, part_paths: List[str]):
+        """片段文件在 TTS_PIPELINE_PART_TTL 秒后删除（缓存中的副本是独立的链接，不受影响）"""
+        timer = threading.Timer(Config.TTS_PIPELINE_PART_TTL, _remove_files, [part_paths])
+        timer.daemon = True
+        timer.start()
+
+    def _remove_stale_parts(self):
+        """清理上次运行遗留的片段文件"""
+        try:
+            filenames = os.listdir(self.tts_client.output_path)
+        except OSError:
+            return
+        _remove_files([os.path.join(self.tts_client.output_path, filename)
+                       for filename in filenames if is_part_filename(filename)])
+
+
+def _remove_files(paths: List[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"⚠️ 删除音频片段失败: {e}")
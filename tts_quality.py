@@ -0,0 +1,111 @@
+"""
+负载自适应的TTS质量
+
+高峰期排队的合成请求越来越多时，固定的推理参数会让每条回复的等待时间持续增长。
+质量控制器统计最近的出声时间（从提交合成到拿到音频，含排队时间）和排队长度：
+p95超过预算或队列积压时切换到更省时的参数档位（更少的采样步数、更短的切分），
+负载下降后再逐级恢复。每次切换后清空统计并冷却一段时间，避免在两档之间来回抖动。
+只统计实际合成的任务，命中缓存的不计入。
+
+降级后如果不再有新的合成（负载已经消失），每空闲一个冷却时间恢复一档；
+在下次取用参数时检查，不需要后台线程，空闲后的第一条合成就使用恢复后的档位。
+"""
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+from config import Config
+from metrics import RollingWindow
+
+# 参数档位，从高质量到低延迟排列；每档只列出相对默认参数的改动
+QUALITY_PRESETS: List[Dict[str, Any]] = [
+    {"name": "high", "params": {}},
+    {"name": "balanced", "params": {"sample_steps": 16, "super_sampling": False}},
+    {"name": "fast", "params": {"sample_steps": 8, "super_sampling": False, "text_split_method": "按标点符号切"}},
+]
+
+
+class TTSQualityController:
+    """按出声时间p95和排队长度在参数档位之间切换（线程安全）"""
+
+    def __init__(self, budget_ms: Optional[float] = None):
+        self.budget_ms = budget_ms if budget_ms is not None else Config.TTS_QUALITY_BUDGET_MS
+        self.enabled = self.budget_ms > 0
+        self.level = 0
+        self.latency_ms = RollingWindow(Config.TTS_QUALITY_WINDOW)
+        self._lock = threading.Lock()
+        self._last_change = time.monotonic()
+        self._last_observed = self._last_change
+        self._changes = 0
+
+    @property
+    def preset(self) -> Dict[str, Any]:
+        return QUALITY_PRESETS[self.level]
+
+    @property
+    def degraded(self) -> bool:
+        """当前是否处于降级的档位（已空闲足够久的会先恢复）"""
+        with self._lock:
+            self._recover_idle()
+            return self.level > 0
+
+    def apply(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """当前档位的推理参数"""
+        with self._lock:
+            self._recover_idle()
+            preset = self.preset
+        params = dict(params)
+        params.update(preset["params"])
+        return params
+
+    def observe(self, latency_ms: float, queue_depth: int):
+        """记录一次合成的出声时间，并根据当前负载决定是否切换档位"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._last_observed = time.monotonic()
+            self.latency_ms.add(latency_ms)
+            if len(self.latency_ms.samples) < Config.TTS_QUALITY_MIN_SAMPLES:
+                return
+            if time.monotonic() - self._last_change < Config.TTS_QUALITY_COOLDOWN:
+                return
+
+            p95 = self.latency_ms.percentile(95)
+            overloaded = p95 > self.budget_ms or queue_depth >= Config.TTS_QUALITY_QUEUE_HIGH
+            # 恢复的阈值低于降级的阈值，留出回差
+            relaxed = p95 < self.budget_ms * Config.TTS_QUALITY_RECOVER_RATIO and queue_depth == 0
+
+            if overloaded and self.level < len(QUALITY_PRESETS) - 1:
+                self._switch(self.level + 1, f"p95={p95:.0f}ms，排队{queue_depth}")
+            elif relaxed and self.level > 0:
+                self._switch(self.level - 1, f"p95={p95:.0f}ms")
+
+    def _recover_idle(self):
+        """降级后空闲（没有新的合成）时，每个冷却时间恢复一档（调用方需持有锁）"""
+        if self.level == 0 or Config.TTS_QUALITY_COOLDOWN <= 0:
+            return
+        idle = time.monotonic() - max(self._last_observed, self._last_change)
+        steps = int(idle // Config.TTS_QUALITY_COOLDOWN)
+        if steps > 0:
+            self._switch(max(0, self.level - steps), f"空闲{idle:.0f}秒")
+
+    def _switch(self, level: int, reason: str):
+        """切换档位（调用方需持有锁）"""
+        direction = "降级" if level > self.level else "恢复"
+        self.level = level
+        self._last_change = time.monotonic()
+        self._changes += 1
+        # 之前的样本是旧参数下测得的，不再参考
+        self.latency_ms.samples.clear()
+        print(f"🎚️ TTS质量{direction}到 {self.preset['name']}（{reason}）")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._recover_idle()
+            return {
+                "enabled": self.enabled,
+                "preset": self.preset["name"],
+                "budget_ms": self.budget_ms,
+                "changes": self._changes,
+                "latency_ms": self.latency_ms.summary()
+            }
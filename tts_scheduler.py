@@ -0,0 +1,337 @@
+"""
+TTS任务调度
+
+所有合成请求（对话回复、分句预合成、状态检测）都经过调度器再交给 TTSClient：
+- 同时进行的合成数量不超过 TTS_MAX_CONCURRENCY，与GPT-SOVITs服务的承载能力一致
+- 等待队列按优先级出队：对话回复 > 预合成 > 状态检测/维护，同一优先级先到先得
+- 已缓存的文本直接返回缓存的音频，不进入队列
+- 队列长度有上限，满了之后低优先级请求直接拒绝，对话回复会挤掉排队中优先级最低的任务；
+  已经开始播放的回复中后续句子的任务（不可丢弃）不会被挤掉
+- 相同文本（缓存键相同）的请求在合成完成前合并为一次，共享同一个结果
+- 流式合成同样要排队取得名额，名额一直占用到音频流被读完或关闭
+- TTS服务提供批量接口时，短时间窗口内排队的同一优先级的多条请求合并成一次批量合成，只占用一个并发名额；
+  批量请求失败时这些任务重新排队，各自单独合成
+- 每个任务的出声时间和当前排队长度交给质量控制器（tts_quality），负载高时降低推理参数档位
+"""
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Dict, Any, Optional, List, Callable, Tuple
+
+from config import Config
+from tts_client import AudioStream, new_output_filename
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREFETCH = 1
+PRIORITY_MAINTENANCE = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_PREFETCH: "prefetch",
+    PRIORITY_MAINTENANCE: "maintenance",
+}
+
+# 流式合成取得名额后，音频流一直没有被读取时最多占用名额的时间（秒）
+STREAM_SLOT_TIMEOUT = 300
+
+
+class TTSQueueFull(Exception):
+    """等待队列已满，请求被拒绝"""
+
+
+class _Job:
+    def __init__(self, key: str, text: str, output_filename: Optional[str], priority: int,
+                 task: Optional[Callable[[], Tuple[Any, Optional[threading.Event]]]] = None,
+                 droppable: bool = True):
+        self.key = key
+        self.text = text
+        self.output_filename = output_filename
+        self.priority = priority
+        # 队列满时能否被更高优先级的请求挤掉
+        self.droppable = droppable
+        # 批量合成失败后重新排队的任务不再参与批量合成
+        self.batchable = task is None
+        # 在堆中的序号，重新排队时沿用，保持原来的先后顺序
+        self.sequence = 0
+        # 不是普通合成的任务：返回 (结果, 释放名额的事件)，事件为None时执行完立即释放
+        self.task = task
+        self.future: Future = Future()
+        self.started = False
+        self.cancelled = False
+        self.submitted_at = time.monotonic()
+
+
+class TTSScheduler:
+    """带优先级、并发上限和请求合并的TTS调度器"""
+
+    def __init__(self, tts_client, concurrency: Optional[int] = None, max_queue: Optional[int] = None):
+        self.tts_client = tts_client
+        self.concurrency = max(1, concurrency if concurrency is not None else Config.TTS_MAX_CONCURRENCY)
+        self.max_queue = max(1, max_queue if max_queue is not None else Config.TTS_QUEUE_SIZE)
+        self._condition = threading.Condition()
+        # 堆中的元素为 (优先级, 序号, 任务)；任务提升优先级后旧元素留在堆中，出队时跳过
+        self._heap: List[tuple] = []
+        self._sequence = itertools.count()
+        self._queued: Dict[str, _Job] = {}
+        self._inflight: Dict[str, _Job] = {}
+        self._running = 0
+        self._stats = {"submitted": 0, "cache_hits": 0, "coalesced": 0, "rejected": 0, "completed": 0, "batches": 0}
+
+        for index in range(self.concurrency):
+            threading.Thread(target=self._worker, name=f"tts-scheduler-{index}", daemon=True).start()
+
+    def submit(self, text: str, output_filename: Optional[str] = None,
+               priority: int = PRIORITY_INTERACTIVE, droppable: bool = True) -> Future:
+        """
+        提交合成任务
+
+        Args:
+            droppable: 为False时队列满了也不会被更高优先级的请求挤掉（如正在播放的回复的后续句子）
+
+        Returns:
+            Future: 结果为音频文件路径（失败时为None）。已缓存时返回已完成的Future；
+                    与正在排队或合成中的相同文本合并时，返回的是已有任务的Future，音频文件名以先提交的请求为准
+        Raises:
+            TTSQueueFull: 队列已满且无法为该请求腾出位置
+        """
+        output_filename = output_filename or new_output_filename()
+        cached_path = self.tts_client.get_cached(text, output_filename)
+        if cached_path:
+            with self._condition:
+                self._stats["submitted"] += 1
+                self._stats["cache_hits"] += 1
+            future = Future()
+            future.set_result(cached_path)
+            return future
+
+        key = self.tts_client.cache_key(text)
+        with self._condition:
+            self._stats["submitted"] += 1
+            job = self._inflight.get(key)
+            if job is not None:
+                self._stats["coalesced"] += 1
+                if not droppable:
+                    job.droppable = False
+                # 高优先级的请求在等待同一个任务时，任务随之提前
+                if priority < job.priority and not job.started:
+                    job.priority = priority
+                    job.sequence = next(self._sequence)
+                    heapq.heappush(self._heap, (priority, job.sequence, job))
+                return job.future
+
+            return self._enqueue(_Job(key, text, output_filename, priority, droppable=droppable)).future
+
+    def _enqueue(self, job: _Job) -> _Job:
+        """任务入队（调用方需持有锁），队列已满且无法腾出位置时抛出 TTSQueueFull"""
+        if len(self._queued) >= self.max_queue and not self._drop_lowest(job.priority):
+            self._stats["rejected"] += 1
+            raise TTSQueueFull(f"TTS队列已满（{self.max_queue}），{PRIORITY_NAMES.get(job.priority, job.priority)}请求被拒绝")
+        self._inflight[job.key] = job
+        self._queued[job.key] = job
+        job.sequence = next(self._sequence)
+        heapq.heappush(self._heap, (job.priority, job.sequence, job))
+        self._condition.notify()
+        return job
+
+    def stream(self, text: str, output_filename: Optional[str] = None,
+               priority: int = PRIORITY_INTERACTIVE) -> AudioStream:
+        """
+        在并发名额内流式合成，已缓存时直接读出缓存的音频，不占用名额
+
+        Raises:
+            TTSQueueFull: 队列已满且无法为该请求腾出位置
+        """
+        output_filename = output_filename or new_output_filename()
+        cached = self.tts_client.cached_stream(text, output_filename)
+        if cached:
+            return cached
+
+        def task():
+            stream = self.tts_client.text_to_speech_stream(text, output_filename, check_cache=False)
+            released = threading.Event()
+            stream.on_close = released.set
+            return stream, released
+
+        key = f"stream:{uuid.uuid4().hex}"
+        with self._condition:
+            self._stats["submitted"] += 1
+            job = self._enqueue(_Job(key, text, output_filename, priority, task))
+        return job.future.result()
+
+    def synthesize(self, text: str, output_filename: Optional[str] = None,
+                   priority: int = PRIORITY_INTERACTIVE, droppable: bool = True) -> Optional[str]:
+        """提交合成任务并等待结果，队列已满或合成失败时返回None"""
+        try:
+            return self.submit(text, output_filename, priority, droppable).result()
+        except TTSQueueFull as e:
+            print(f"⚠️ {e}")
+            return None
+        except Exception as e:
+            print(f"❌ TTS任务失败: {e}")
+            return None
+
+    def _drop_lowest(self, priority: int) -> bool:
+        """挤掉一个优先级低于priority的排队任务（调用方需持有锁），返回是否腾出了位置"""
+        victim = None
+        for job in self._queued.values():
+            # 同为最低优先级时挤掉最后到达的
+            if not job.droppable:
+                continue
+            if job.priority > priority and (victim is None or job.priority >= victim.priority):
+                victim = job
+        if victim is None:
+            return False
+        victim.cancelled = True
+        del self._queued[victim.key]
+        del self._inflight[victim.key]
+        self._stats["rejected"] += 1
+        victim.future.set_exception(TTSQueueFull("TTS队列已满，任务被更高优先级的请求挤出"))
+        return True
+
+    def _peek_job(self) -> Optional[_Job]:
+        """查看优先级最高的排队任务但不取出（调用方需持有锁），队列为空时返回None"""
+        while self._heap:
+            priority, _, job = self._heap[0]
+            # 丢弃已取消、已开始或优先级已提升的旧元素
+            if job.cancelled or job.started or priority != job.priority:
+                heapq.heappop(self._heap)
+                continue
+            return job
+        return None
+
+    def _pop_job(self) -> Optional[_Job]:
+        """取出优先级最高的排队任务（调用方需持有锁），队列为空时返回None"""
+        job = self._peek_job()
+        if job is None:
+            return None
+        heapq.heappop(self._heap)
+        job.started = True
+        del self._queued[job.key]
+        return job
+
+    def _next_batch(self) -> List[_Job]:
+        """等待下一个任务；可以批量合成时在时间窗口内继续收集同一优先级的排队任务"""
+        with self._condition:
+            job = self._pop_job()
+            while job is None:
+                self._condition.wait()
+                job = self._pop_job()
+            self._running += 1
+            batch = [job]
+            if not job.batchable or Config.TTS_BATCH_MAX_SIZE <= 1 or not self.tts_client.supports_batching():
+                return batch
+
+            deadline = time.monotonic() + Config.TTS_BATCH_WINDOW_MS / 1000
+            while len(batch) < Config.TTS_BATCH_MAX_SIZE:
+                job = self._peek_job()
+                if job is not None and job.batchable and job.priority == batch[0].priority:
+                    batch.append(self._pop_job())
+                    continue
+                if job is not None:
+                    # 优先级不同的任务、流式合成等任务留给其他名额，不放进同一批
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return batch
+
+    def _worker(self):
+        while True:
+            batch = self._next_batch()
+            if batch[0].task:
+                self._run_task(batch[0])
+                continue
+            # 排队期间相同的文本可能已经合成完并缓存，命中缓存的结果不计入出声时间
+            results: List[Optional[str]] = [self.tts_client.get_cached(job.text, job.output_filename)
+                                            for job in batch]
+            pending = [index for index, result in enumerate(results) if not result]
+            requeue: List[_Job] = []
+            if len(pending) > 1:
+                synthesized = None
+                try:
+                    synthesized = self.tts_client.text_to_speech_batch(
+                        [batch[index].text for index in pending],
+                        [batch[index].output_filename for index in pending], check_cache=False)
+                except Exception as e:
+                    print(f"❌ TTS批量任务异常: {e}")
+                if synthesized is None:
+                    # 不支持批量合成或批量请求失败时重新排队，由空闲的名额各自合成，不在这一个名额里逐条合成
+                    requeue = [batch[index] for index in pending]
+                else:
+                    for index, result in zip(pending, synthesized):
+                        results[index] = result
+            elif pending:
+                job = batch[pending[0]]
+                try:
+                    results[pending[0]] = self.tts_client.text_to_speech(job.text, job.output_filename,
+                                                                         check_cache=False)
+                except Exception as e:
+                    print(f"❌ TTS任务异常: {e}")
+            self._finish(batch, results, pending, requeue)
+
+    def _finish(self, batch: List[_Job], results: List[Optional[str]], synthesized: List[int],
+                requeue: List[_Job]):
+        """
+        归还名额并交付结果
+
+        Args:
+            synthesized: 实际合成（未命中缓存）的任务在batch中的下标，只有这些任务计入出声时间
+            requeue: 批量合成失败、需要重新排队的任务
+        """
+        done = [index for index, job in enumerate(batch) if job not in requeue]
+        with self._condition:
+            self._running -= 1
+            self._stats["completed"] += len(done)
+            if len(synthesized) > 1 and not requeue:
+                self._stats["batches"] += 1
+            for index in done:
+                del self._inflight[batch[index].key]
+            for job in requeue:
+                job.started = False
+                job.batchable = False
+                self._queued[job.key] = job
+                heapq.heappush(self._heap, (job.priority, job.sequence, job))
+            if requeue:
+                self._condition.notify_all()
+            queue_depth = len(self._queued)
+        if requeue:
+            print(f"🔁 批量合成失败，{len(requeue)} 条任务重新排队")
+        for index in done:
+            job = batch[index]
+            # 出声时间包含排队时间，状态检测之类的维护任务不计入
+            if results[index] and index in synthesized and job.priority != PRIORITY_MAINTENANCE:
+                self.tts_client.quality.observe((time.monotonic() - job.submitted_at) * 1000, queue_depth)
+            job.future.set_result(results[index])
+
+    def _run_task(self, job: _Job):
+        """执行流式合成等任务，名额占用到任务给出的事件被设置（或超时）"""
+        released = None
+        try:
+            result, released = job.task()
+            job.future.set_result(result)
+        except Exception as e:
+            print(f"❌ TTS任务异常: {e}")
+            job.future.set_exception(e)
+        if released is not None and not released.wait(STREAM_SLOT_TIMEOUT):
+            print(f"⚠️ 音频流 {STREAM_SLOT_TIMEOUT} 秒内没有读完，释放TTS并发名额")
+        with self._condition:
+            self._running -= 1
+            self._stats["completed"] += 1
+            del self._inflight[job.key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._condition:
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            for job in self._queued.values():
+                queued[PRIORITY_NAMES.get(job.priority, str(job.priority))] += 1
+            return {
+                "concurrency": self.concurrency,
+                "running": self._running,
+                "queued": queued,
+                "max_queue": self.max_queue,
+                **self._stats
+            }
@@ -0,0 +1,214 @@
+"""
+命令行TTS的常驻工作进程
+
+按次调用命令行接口时，每句话都要启动一个新的Python进程并重新加载GPT-SOVITs模型，
+加载时间远大于合成本身。工作进程模式启动若干个常驻进程，模型只加载一次，
+之后通过标准输入输出逐行交换JSON请求：
+
+    启动:  python infer.py --serve --model_path <模型路径>
+    就绪:  进程向stdout写一行 {"ready": true}
+    请求:  {"id": 1, "text": "要合成的文本", "output": "输出文件路径"}
+    响应:  {"id": 1, "ok": true}  或  {"id": 1, "ok": false, "error": "错误信息"}
+
+stdout只用于协议，日志请写到stderr。进程崩溃或超时后会自动重启；
+脚本不支持 --serve 时（无法就绪），TTSClient 退回到按次启动进程的方式。
+"""
+import atexit
+import json
+import queue
+import subprocess
+import threading
+import time
+from typing import Optional
+
+from config import Config
+
+
+class CLIWorkerUnavailable(Exception):
+    """没有可用的工作进程，调用方应退回到按次启动进程"""
+
+
+class CLIWorker:
+    """一个常驻的TTS工作进程"""
+
+    def __init__(self, script_path: str, model_path: str):
+        self.script_path = script_path
+        self.model_path = model_path
+        self.process: Optional[subprocess.Popen] = None
+        self._lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._next_id = 0
+
+    def start(self) -> bool:
+        """启动进程并等待模型加载完成"""
+        self.stop()
+        self._lines = queue.Queue()
+        try:
+            self.process = subprocess.Popen(
+                ["python", self.script_path, "--serve", "--model_path", self.model_path],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                text=True,
+                encoding="utf-8",
+                bufsize=1
+            )
+        except OSError as e:
+            print(f"❌ 启动TTS工作进程失败: {e}")
+            return False
+
+        # 在后台线程中读取输出，便于按超时等待响应
+        threading.Thread(target=self._read_stdout, args=(self.process, self._lines), daemon=True).start()
+
+        message = self._read_message(Config.TTS_CLI_WORKER_START_TIMEOUT)
+        if not message or not message.get("ready"):
+            print(f"⚠️ TTS工作进程未能就绪（pid={self.process.pid}），脚本可能不支持 --serve")
+            self.stop()
+            return False
+        print(f"✅ TTS工作进程已就绪（pid={self.process.pid}）")
+        return True
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def synthesize(self, text: str, output_path: str, timeout: float) -> dict:
+        """
+        发送一次合成请求
+
+        Returns:
+            dict: 工作进程的响应
+        Raises:
+            CLIWorkerUnavailable: 进程已退出、通信失败或响应超时
+        """
+        if not self.is_alive():
+            raise CLIWorkerUnavailable("TTS工作进程未运行")
+
+        self._next_id += 1
+        request_id = self._next_id
+        try:
+            self.process.stdin.write(json.dumps(
+                {"id": request_id, "text": text, "output": output_path}, ensure_ascii=False) + "\n")
+            self.process.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise CLIWorkerUnavailable(f"写入TTS工作进程失败: {e}")
+
+        deadline = time.monotonic() + timeout
+        while True:
+            message = self._read_message(max(0.0, deadline - time.monotonic()))
+            if message is None:
+                raise CLIWorkerUnavailable("TTS工作进程无响应或已退出")
+            # 丢弃之前超时请求的迟到响应
+            if message.get("id") == request_id:
+                return message
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            if self.process.poll() is None:
+                self.process.stdin.close()
+                try:
+                    self.process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    self.process.kill()
+        except Exception as e:
+            print(f"⚠️ 停止TTS工作进程时出错: {e}")
+        self.process = None
+
+    def _read_message(self, timeout: float) -> Optional[dict]:
+        """读取下一条JSON消息，超时或进程退出时返回None，忽略无法解析的行"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                line = self._lines.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                return None
+            if line is None:
+                return None
+            try:
+                return json.loads(line)
+            except json.JSONDecodeError:
+                print(f"⚠️ TTS工作进程输出了非协议内容: {line.strip()[:100]}")
+
+    @staticmethod
+    def _read_stdout(process: subprocess.Popen, lines: "queue.Queue[Optional[str]]"):
+        for line in process.stdout:
+            lines.put(line)
+        # 进程退出
+        lines.put(None)
+
+
+class CLIWorkerPool:
+    """固定数量的常驻工作进程，每个进程同一时间只处理一个请求"""
+
+    def __init__(self, script_path: str, model_path: str, size: Optional[int] = None):
+        if size is None:
+            size = Config.TTS_CLI_WORKERS
+        self.size = size
+        self._idle: "queue.Queue[CLIWorker]" = queue.Queue()
+        self._lock = threading.Lock()
+        # 连续启动失败的次数，达到上限后不再尝试，全部退回按次启动进程
+        self._start_failures = 0
+        self.disabled = False
+        self._workers = [CLIWorker(script_path, model_path) for _ in range(size)]
+
+        # 在后台预热，避免第一次请求等待模型加载
+        for worker in self._workers:
+            threading.Thread(target=self._warm_up, args=(worker,), daemon=True).start()
+        atexit.register(self.stop)
+
+    def _warm_up(self, worker: CLIWorker):
+        self._ensure_started(worker)
+        self._idle.put(worker)
+
+    def _ensure_started(self, worker: CLIWorker) -> bool:
+        """确保工作进程在运行，已退出时自动重启"""
+        if worker.is_alive():
+            return True
+        if self.disabled:
+            return False
+        if worker.start():
+            with self._lock:
+                self._start_failures = 0
+            return True
+        with self._lock:
+            self._start_failures += 1
+            if self._start_failures >= Config.TTS_CLI_WORKER_MAX_START_FAILURES:
+                self.disabled = True
+                print("⚠️ TTS工作进程多次启动失败，改为按次启动进程")
+        return False
+
+    def synthesize(self, text: str, output_path: str, timeout: float = 60) -> bool:
+        """
+        使用空闲的工作进程合成音频
+
+        Returns:
+            bool: 合成是否成功
+        Raises:
+            CLIWorkerUnavailable: 没有可用的工作进程，调用方应退回到按次启动进程
+        """
+        if self.disabled:
+            raise CLIWorkerUnavailable("TTS工作进程已停用")
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise CLIWorkerUnavailable("等待空闲的TTS工作进程超时")
+
+        try:
+            if not self._ensure_started(worker):
+                raise CLIWorkerUnavailable("TTS工作进程启动失败")
+            try:
+                response = worker.synthesize(text, output_path, timeout)
+            except CLIWorkerUnavailable:
+                # 崩溃或卡住的进程直接结束，下次使用时重启
+                print("⚠️ TTS工作进程异常，将重启")
+                worker.stop()
+                raise
+            if not response.get("ok"):
+                print(f"❌ TTS工作进程合成失败: {response.get('error')}")
+                return False
+            return True
+        finally:
+            self._idle.put(worker)
+
+    def stop(self):
+        for worker in self._workers:
+            worker.stop()
@@ -0,0 +1,70 @@
+"""
+参考音色
+
+GPT-SOVITs按参考音频和对应文本克隆音色，参考音频的特征提取比较耗时。
+音色配置好后只向TTS服务登记一次：WebUI（Gradio）接口上传参考音频得到服务端路径，
+api_v2 接口调用 /set_refer_audio 让服务端预先提取并缓存特征，之后每次合成都带上
+同一个服务端路径，服务端直接复用缓存的特征。参考音频文件或文本变化后重新登记。
+"""
+import hashlib
+import os
+from typing import Dict, Any, List, Optional
+
+from config import Config
+
+
+class VoiceProfile:
+    """参考音频及其文本"""
+
+    def __init__(self, ref_audio_path: Optional[str] = None, prompt_text: str = "",
+                 prompt_lang: str = "中文", aux_ref_audio_paths: Optional[List[str]] = None):
+        self.ref_audio_path = ref_audio_path or None
+        self.prompt_text = prompt_text
+        self.prompt_lang = prompt_lang
+        self.aux_ref_audio_paths = aux_ref_audio_paths or []
+
+    @classmethod
+    def from_config(cls) -> "VoiceProfile":
+        return cls(Config.TTS_REF_AUDIO_PATH, Config.TTS_PROMPT_TEXT, Config.TTS_PROMPT_LANG)
+
+    @property
+    def is_set(self) -> bool:
+        return bool(self.ref_audio_path)
+
+    def fingerprint(self) -> str:
+        """
+        音色的指纹：路径、文本，以及本地参考音频的大小和修改时间
+
+        替换了同一路径下的参考音频时指纹也会变化，触发重新登记并使语音缓存失效
+        """
+        parts = [str(self.ref_audio_path), self.prompt_text, self.prompt_lang] + list(self.aux_ref_audio_paths)
+        if self.ref_audio_path and os.path.isfile(self.ref_audio_path):
+            stat = os.stat(self.ref_audio_path)
+            parts += [str(stat.st_size), str(stat.st_mtime_ns)]
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+    def apply(self, params: Dict[str, Any], ref_audio_path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        把音色写入推理参数
+
+        Args:
+            ref_audio_path: 已登记的服务端路径，None时使用配置的路径
+        """
+        params = dict(params)
+        if not self.is_set:
+            return params
+        params["ref_audio_path"] = ref_audio_path or self.ref_audio_path
+        params["aux_ref_audio_paths"] = list(self.aux_ref_audio_paths)
+        params["prompt_text"] = self.prompt_text
+        params["prompt_lang"] = self.prompt_lang
+        # 没有参考文本时使用无参考文本模式
+        params["ref_text_free"] = not self.prompt_text
+        return params
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "ref_audio_path": self.ref_audio_path,
+            "prompt_text": self.prompt_text,
+            "prompt_lang": self.prompt_lang,
+            "fingerprint": self.fingerprint() if self.is_set else None
+        }